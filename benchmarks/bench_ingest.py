@@ -0,0 +1,104 @@
+"""
+Ingest throughput per stage: rows/s and peak memory against a local database.
+
+Each stage runs in a fresh process so its peak RSS is not inflated by the
+stages before it. Feeds are generated once per size and reused.
+
+Usage:
+    BENCH_DB=sqlite|postgres python benchmarks/bench_ingest.py [--rows 10000 100000 1000000]
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+STAGES = ['xlsx_to_csv', 'preprocess_dataframe', 'save_csv_to_db',
+          'save_csv_to_db (unchanged)', 'save_xlsx_to_db']
+
+
+def _rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _run_stage(stage, xlsx_file, csv_file, results):
+    """Run one stage in this (fresh) process and report seconds and memory."""
+    os.environ['DJANGO_PROJECT_PATH'] = ROOT
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+    import logging
+    logging.disable(logging.INFO)
+
+    import pandas as pd
+    from django.core.management import call_command
+    from cronjobs.csv_cronjob import (Item, preprocess_dataframe, save_csv_to_db,
+                                      save_xlsx_to_db, xlsx_to_csv)
+
+    if stage in ('save_csv_to_db', 'save_xlsx_to_db'):
+        call_command('migrate', run_syncdb=True, verbosity=0)
+        Item.objects.all().delete()
+    df = pd.read_csv(csv_file) if stage == 'preprocess_dataframe' else None
+
+    baseline = _rss_mb()
+    start = time.perf_counter()
+    if stage == 'xlsx_to_csv':
+        # Leave the raw generated CSV alone for the stages below
+        xlsx_to_csv(xlsx_file, f"{csv_file}.converted")
+    elif stage == 'preprocess_dataframe':
+        preprocess_dataframe(df)
+    elif stage.startswith('save_csv_to_db'):
+        save_csv_to_db(csv_file)
+    elif stage == 'save_xlsx_to_db':
+        save_xlsx_to_db(xlsx_file)
+    elapsed = time.perf_counter() - start
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    results.put((elapsed, baseline, peak))
+
+
+def run_stage(stage, xlsx_file, csv_file):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=_run_stage, args=(stage, xlsx_file, csv_file, results))
+    process.start()
+    outcome = results.get()
+    process.join()
+    return outcome
+
+
+def main():
+    from benchmarks.feed_generator import write_feed
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--workdir', default='/tmp/feed_bench')
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    args = parser.parse_args()
+    os.makedirs(args.workdir, exist_ok=True)
+
+    print(f"database: {os.getenv('BENCH_DB', 'sqlite')}")
+    print(f"{'stage':<28} {'rows':>9} {'seconds':>9} {'rows/s':>11} {'peak MB':>9} {'+MB':>8}")
+    for rows in args.rows:
+        xlsx_file = os.path.join(args.workdir, f"feed_{rows}.xlsx")
+        csv_file = os.path.join(args.workdir, f"feed_{rows}.csv")
+        if not os.path.exists(xlsx_file):
+            write_feed(xlsx_file, rows)
+        if not os.path.exists(csv_file):
+            write_feed(csv_file, rows)
+
+        # save_csv_to_db (unchanged) re-ingests the same feed on top of the previous stage
+        for stage in args.stages:
+            elapsed, baseline, peak = run_stage(stage, xlsx_file, csv_file)
+            print(f"{stage:<28} {rows:>9} {elapsed:>9.2f} {rows / elapsed:>11,.0f} "
+                  f"{peak:>9.0f} {peak - baseline:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Rows/s of feed normalization: the legacy per-cell path against helpers.feed.
+
+Usage:
+    python benchmarks/bench_normalize.py [rows]
+"""
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers.feed import preprocess_dataframe, to_item_columns, iter_item_rows
+from benchmarks.feed_generator import make_feed
+
+
+def legacy_normalize(df):
+    """The per-cell preprocess + iterrows conversion used before helpers.feed."""
+    empty_row = pd.DataFrame([{}], columns=df.columns)
+    df = pd.concat([df, empty_row], ignore_index=True)
+    df.columns = df.columns.str.strip()
+    df = df.dropna(subset=['SKU', 'PART_NAME'])
+    df = df.drop_duplicates()
+    for column in ['SKU', 'STOCK_TOTAL']:
+        df[column] = pd.to_numeric(
+            df[column], errors='coerce').fillna(0).astype(int)
+    df = df.apply(lambda col: col.map(lambda x: x.strip() if isinstance(
+        x, str) else x) if col.dtype == "object" else col)
+    df = df[(df['SKU'] != 0) & (df['PART_NAME'].str.strip() != '')]
+
+    rows = []
+    for index, row in df.iterrows():
+        rows.append((
+            str(row.get('SKU', '')),
+            str(row.get('BRAND', '')),
+            str(row.get('PART_NAME', '')),
+            str(row.get('PARTSLINK', '')),
+            str(row.get('OEM_NUMBER', '')),
+            str(row.get('CATEGORY_ID', '')),
+            str(row.get('PDESCRIPTION', '')),
+            float(row.get('B2B_PRICE15', 0.0)),
+            float(row.get('SHIPPINGREVENUE18', 0.0)),
+            float(row.get('HANDLINGREVENUE18', 0.0)),
+            int(float(row.get('STOCK_VA', 0))),
+            int(float(row.get('STOCK_IL', 0))),
+            int(float(row.get('STOCK_LAS1', 0))),
+            int(float(row.get('STOCK_PERU', 0))),
+            int(float(row.get('STOCK_GPT', 0))),
+            int(float(row.get('STOCK_JAX', 0))),
+            int(float(row.get('STOCK_TOTAL', 0))),
+        ))
+    return rows
+
+
+def vectorized_normalize(df):
+    return list(iter_item_rows(to_item_columns(preprocess_dataframe(df))))
+
+
+def measure(name, func, df):
+    start = time.perf_counter()
+    rows = func(df)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12} {len(rows):>9} rows  {elapsed:8.3f}s  {len(df) / elapsed:12,.0f} rows/s")
+    return elapsed
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    df = make_feed(rows)
+    legacy = measure('legacy', legacy_normalize, df)
+    vectorized = measure('vectorized', vectorized_normalize, df)
+    print(f"speedup      {legacy / vectorized:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Items/s serialized into AddItems bodies: per-item ElementTree building against helpers.payload.
+
+Usage:
+    python benchmarks/bench_payload.py [items]
+"""
+import hashlib
+import os
+import sys
+import time
+import xml.dom.minidom
+import xml.etree.ElementTree as ET
+from decimal import Decimal
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers.payload import AddItemsPayloadBuilder
+
+BATCH_SIZE = 5
+
+
+def make_items(count):
+    return [SimpleNamespace(
+        sku=str(100000 + i), brand='DEPO', partslink='HO1248101', oem_number='74101SV4A00',
+        category_id='33645' if i % 3 else None, price=Decimal('57.37') + i % 100,
+        sell_price=(Decimal('57.37') + i % 100) * Decimal('1.2'),
+        part_name=f'ACCORD 94-97 FENDER LINER {i}', image_url=None,
+        pdescription=f'ACCORD 94-97 FRONT FENDER LINER & CLIPS <{i}>',
+    ) for i in range(count)]
+
+
+def legacy_request(access_token, batch):
+    """The ElementTree construction used before helpers.payload, including the unconditional pretty-print."""
+    request = ET.Element('AddItemsRequest', xmlns="urn:ebay:apis:eBLBaseComponents")
+    credentials = ET.SubElement(request, 'RequesterCredentials')
+    ET.SubElement(credentials, 'eBayAuthToken').text = access_token
+    ET.SubElement(request, 'Version').text = '1193'
+    ET.SubElement(request, 'ErrorLanguage').text = 'en_US'
+    ET.SubElement(request, 'WarningLevel').text = 'High'
+    for index, item in enumerate(batch):
+        container = ET.SubElement(request, 'AddItemRequestContainer')
+        ET.SubElement(container, 'MessageID').text = str(index + 1)
+        item_xml = ET.SubElement(container, 'Item')
+        ET.SubElement(item_xml, 'Title').text = item.pdescription
+        ET.SubElement(item_xml, 'SKU').text = str(item.sku)
+        ET.SubElement(item_xml, 'InventoryTrackingMethod').text = 'SKU'
+        ET.SubElement(item_xml, 'Message').text = str(item.sku)
+        ET.SubElement(item_xml, 'Description').text = (
+            f"Brand: {item.brand},\nPart Link: {item.partslink},\n"
+            f"OEM Number: {item.oem_number},\n\n{item.pdescription}")
+        category = ET.SubElement(item_xml, 'PrimaryCategory')
+        ET.SubElement(category, 'CategoryID').text = item.category_id or '6755'
+        ET.SubElement(item_xml, 'CategoryMappingAllowed').text = 'true'
+        ET.SubElement(item_xml, 'Site').text = 'eBayMotors'
+        ET.SubElement(item_xml, 'Quantity').text = '1'
+        ET.SubElement(item_xml, 'StartPrice').text = str(item.price * Decimal('1.2'))
+        ET.SubElement(item_xml, 'ListingDuration').text = 'GTC'
+        ET.SubElement(item_xml, 'ListingType').text = 'FixedPriceItem'
+        ET.SubElement(item_xml, 'DispatchTimeMax').text = '3'
+        shipping = ET.SubElement(item_xml, 'ShippingDetails')
+        ET.SubElement(shipping, 'ShippingType').text = 'Flat'
+        options = ET.SubElement(shipping, 'ShippingServiceOptions')
+        ET.SubElement(options, 'ShippingServicePriority').text = '1'
+        ET.SubElement(options, 'ShippingService').text = 'FedExHomeDelivery'
+        ET.SubElement(options, 'ShippingServiceCost').text = '0.0'
+        policy = ET.SubElement(item_xml, 'ReturnPolicy')
+        ET.SubElement(policy, 'ReturnsAcceptedOption').text = 'ReturnsAccepted'
+        ET.SubElement(policy, 'ReturnsWithinOption').text = 'Days_30'
+        ET.SubElement(policy, 'ShippingCostPaidByOption').text = 'Buyer'
+        ET.SubElement(item_xml, 'ConditionID').text = '1000'
+        ET.SubElement(item_xml, 'ConditionDisplayName').text = 'New'
+        ET.SubElement(item_xml, 'Country').text = 'US'
+        ET.SubElement(item_xml, 'Currency').text = 'USD'
+        ET.SubElement(item_xml, 'PostalCode').text = '60586'
+        specifics = ET.SubElement(item_xml, 'ItemSpecifics')
+        for name, value in (('Title', item.part_name), ('Publisher', item.brand),
+                            ('Author', 'JK Rowling'), ('Language', 'English')):
+            pair = ET.SubElement(specifics, 'NameValueList')
+            ET.SubElement(pair, 'Name').text = name
+            ET.SubElement(pair, 'Value').text = value
+        pictures = ET.SubElement(item_xml, 'PictureDetails')
+        ET.SubElement(pictures, 'GalleryType').text = 'Gallery'
+        ET.SubElement(pictures, 'PictureURL').text = item.image_url or \
+            'https://ir.ebaystatic.com/cr/v/c1/rsc/ebay_logo_512.png'
+        ET.SubElement(item_xml, 'UUID').text = hashlib.md5(str(item.sku).encode()).hexdigest().upper()
+    body = f"<?xml version='1.0' encoding='utf-8'?>\n{ET.tostring(request, encoding='utf-8').decode('utf-8')}"
+    xml.dom.minidom.parseString(body).toprettyxml(indent="  ")
+    return body
+
+
+def compiled_request(builder, access_token, batch):
+    return builder.request_xml(access_token, [builder.item_xml(item, index + 1)
+                                              for index, item in enumerate(batch)])
+
+
+def measure(name, render, items):
+    start = time.perf_counter()
+    for batch_start in range(0, len(items), BATCH_SIZE):
+        render(items[batch_start:batch_start + BATCH_SIZE])
+    elapsed = time.perf_counter() - start
+    print(f"{name:<10} {len(items):>8} items  {elapsed:7.3f}s  {len(items) / elapsed:12,.0f} items/s")
+    return elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 25000
+    items = make_items(count)
+    builder = AddItemsPayloadBuilder()
+    token = 'v^1.1#i^1#token'
+
+    # Both renderings must describe the same document
+    batch = items[:BATCH_SIZE]
+    assert ET.canonicalize(legacy_request(token, batch).split('\n', 1)[1]) == \
+        ET.canonicalize(compiled_request(builder, token, batch).split('\n', 1)[1])
+
+    legacy = measure('legacy', lambda batch: legacy_request(token, batch), items)
+    compiled = measure('compiled', lambda batch: compiled_request(builder, token, batch), items)
+    print(f"speedup    {legacy / compiled:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
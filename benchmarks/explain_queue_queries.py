@@ -0,0 +1,141 @@
+"""
+Query plans of the job queue and admin queries against a seeded item table.
+
+Seeds the benchmark database with a catalog shaped like production (mostly
+pushed items, a few percent new, failed or listed, some out of stock, and
+a change log for about one percent of them), runs EXPLAIN on every hot
+query, built exactly as the jobs build it, and fails when one of them
+scans the whole item table instead of using an index.
+
+SQLite does not match a partial index with an IN list against bound
+parameters, which is how Django sends them, so the listing queue check is
+only meaningful on Postgres (psycopg2 inlines the parameters).
+
+listings/tests.py runs the same checks on a smaller table under manage.py test.
+
+Usage:
+    BENCH_DB=postgres python benchmarks/explain_queue_queries.py [--rows 500000]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+# A plan line reading the whole item table, per backend
+FULL_SCAN = {
+    'postgresql': re.compile(r'Seq Scan on "?listings_item"?'),
+    'sqlite': re.compile(r'SCAN listings_item(?! USING)'),
+}
+
+
+def seed(rows, batch_size=10000):
+    """Replace the item table and change log with ``rows`` synthetic items and refresh the planner statistics."""
+    from django.db import connection
+    from django.utils import timezone
+    from listings.models import ChangeLogCursor, Item, ItemChange
+
+    Item.objects.all().delete()
+    ItemChange.objects.all().delete()
+    ChangeLogCursor.objects.all().delete()
+    now = timezone.now()
+    for start in range(0, rows, batch_size):
+        items = []
+        for i in range(start, min(start + batch_size, rows)):
+            bucket = i % 100
+            status = ('not listed' if bucket < 2 else 'error' if bucket < 3
+                      else 'listed' if bucket < 5 else 'updated')
+            price = Decimal(10 + i % 90)
+            stock = 0 if i % 20 == 0 else i % 7 + 1
+            items.append(Item(
+                sku=f'SKU{i:08d}', brand=f'BRAND{i % 500}', part_name=f'PART {i}',
+                category_id=str(33645 + i % 40), price=price, sell_price=price * Decimal('1.2'),
+                stock=stock, status=status,
+                item_id=str(100000000000 + i) if status in ('listed', 'updated') else None,
+                pushed_price=price * Decimal('1.2') if status == 'updated' else None,
+                pushed_quantity=stock if status == 'updated' else None,
+                error_class='retryable' if status == 'error' else None,
+                next_attempt_at=now - timedelta(minutes=i % 120) if status == 'error' else None,
+            ))
+        Item.objects.bulk_create(items)
+        # Price changes of about one percent of the pushed items since the last update run
+        ItemChange.objects.bulk_create([
+            ItemChange(sku=item.sku, old_price=item.price, new_price=item.price + 1,
+                       old_stock=item.stock, new_stock=item.stock)
+            for item in items[::97] if item.status == 'updated'])
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def queue_queries():
+    """(name, queryset, backends it can be checked on) of every query that has to stay off a full table scan."""
+    from cronjobs.listings_cronjob import listing_candidates
+    from cronjobs.update_listings import revise_candidates
+    from helpers.changelog import change_log_high_water
+    from helpers.claims import ItemClaimer
+    from listings.models import Item
+
+    everywhere = set(FULL_SCAN)
+
+    def claimed_window(queryset, job):
+        # The first window claimed_windows asks for
+        return queryset.filter(ItemClaimer(job).claimable()).order_by('pk')[:1000]
+
+    return [
+        ('listing window', claimed_window(listing_candidates(), 'add_items'), {'postgresql'}),
+        ('revise window', claimed_window(revise_candidates(change_log_high_water()),
+                                         'revise_inventory_status'), everywhere),
+        ('admin: newest first', Item.objects.order_by('-updated_at')[:100], everywhere),
+        ('admin: status filter', Item.objects.filter(status='error').order_by('-updated_at')[:100],
+         everywhere),
+        ('admin: brand filter', Item.objects.filter(brand='BRAND7').order_by('-updated_at')[:100],
+         everywhere),
+        ('claims of a worker', Item.objects.filter(claimed_by='worker-1:add_items'), everywhere),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--reuse', action='store_true',
+                        help="Keep the seeded table of an earlier run with the same row count")
+    parser.add_argument('--verbose', action='store_true', help="Print every plan")
+    args = parser.parse_args()
+
+    os.environ['DJANGO_PROJECT_PATH'] = ROOT
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+    import logging
+    logging.disable(logging.INFO)
+    from django.core.management import call_command
+    from django.db import connection
+    from cronjobs.listings_cronjob import Item
+
+    call_command('migrate', run_syncdb=True, verbosity=0)
+    if not (args.reuse and Item.objects.count() == args.rows):
+        start = time.perf_counter()
+        seed(args.rows)
+        print(f"seeded {args.rows:,} items in {time.perf_counter() - start:.1f}s")
+
+    full_scan = FULL_SCAN[connection.vendor]
+    failures = 0
+    print(f"database: {connection.vendor}")
+    for name, queryset, backends in queue_queries():
+        if connection.vendor not in backends:
+            print(f"{'skipped':<10} {name} (not checkable on {connection.vendor})")
+            continue
+        plan = queryset.explain()
+        scans = [line.strip() for line in plan.splitlines() if full_scan.search(line)]
+        failures += bool(scans)
+        print(f"{'FULL SCAN' if scans else 'index':<10} {name}")
+        if scans or args.verbose:
+            print('    ' + plan.replace('\n', '\n    '))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
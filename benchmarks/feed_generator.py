@@ -0,0 +1,105 @@
+"""
+Synthetic supplier feeds with the columns and quirks of the real files.
+
+Usage:
+    python benchmarks/feed_generator.py ROWS PATH.xlsx|PATH.csv [--seed N]
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+# Header as delivered by the supplier, including the stray whitespace preprocess_dataframe strips
+FEED_HEADER = [
+    'SKU ', 'BRAND', 'PART_NAME', 'PARTSLINK', 'OEM_NUMBER', 'CATEGORY_ID',
+    'B2B_PRICE15', 'SHIPPINGREVENUE18', 'HANDLINGREVENUE18',
+    'STOCK_VA', 'STOCK_IL', 'STOCK_LAS1', 'STOCK_PERU', 'STOCK_GPT', 'STOCK_JAX',
+    'STOCK_TOTAL', 'PDESCRIPTION',
+]
+WAREHOUSES = ['STOCK_VA', 'STOCK_IL', 'STOCK_LAS1',
+              'STOCK_PERU', 'STOCK_GPT', 'STOCK_JAX']
+BRANDS = [' DEPO', 'TYC ', 'KOOL VUE', 'EAGLE EYES', 'SHERMAN', 'GENERIC']
+PARTS = ['FENDER LINER', 'HEADLIGHT ASSEMBLY', 'TAIL LAMP', 'GRILLE',
+         'BUMPER COVER', 'MIRROR', 'RADIATOR', 'HOOD']
+MODELS = ['ACCORD 94-97', 'CIVIC 06-11', 'CAMRY 12-14', 'F-150 09-14',
+          'SILVERADO 07-13', 'ALTIMA 13-18']
+CATEGORIES = [33645.0, 33710.0, 33716.0, 6755.0]
+
+
+def make_feed(rows, seed=0, start=0):
+    """
+    Build ``rows`` feed rows as a DataFrame.
+
+    SKUs are unique per ``start`` offset, about 1% of rows are exact
+    duplicates, a few rows lack PART_NAME and optional columns are sparse,
+    like in the supplier files.
+    """
+    rng = np.random.default_rng(seed + start)
+    skus = (start + np.arange(rows) + 100000).astype(float)
+    part = rng.choice(PARTS, rows)
+    model = rng.choice(MODELS, rows)
+    warehouse_stock = {name: rng.integers(0, 12, rows).astype(float)
+                       for name in WAREHOUSES}
+    df = pd.DataFrame({
+        'SKU ': skus,
+        'BRAND': rng.choice(BRANDS, rows),
+        'PART_NAME': np.char.add(np.char.add(model.astype(str), ' '), part.astype(str)),
+        'PARTSLINK': np.where(rng.random(rows) < 0.7,
+                              np.char.add('HO', rng.integers(1000000, 9999999, rows).astype(str)), None),
+        'OEM_NUMBER': np.where(rng.random(rows) < 0.5,
+                               np.char.add('7410', rng.integers(100000, 999999, rows).astype(str)), None),
+        'CATEGORY_ID': rng.choice(CATEGORIES, rows),
+        'B2B_PRICE15': rng.uniform(5, 800, rows).round(2),
+        'SHIPPINGREVENUE18': rng.uniform(0, 40, rows).round(2),
+        'HANDLINGREVENUE18': rng.uniform(0, 6, rows).round(2),
+        **warehouse_stock,
+        'STOCK_TOTAL': sum(warehouse_stock.values()),
+        'PDESCRIPTION': np.char.add(np.char.add(model.astype(str), ' FRONT '), part.astype(str)),
+    }, columns=FEED_HEADER)
+
+    # Rows the preprocessing has to drop or collapse
+    df.loc[rng.random(rows) < 0.002, 'PART_NAME'] = None
+    duplicates = rng.choice(rows, size=2 * (rows // 200), replace=False).reshape(2, -1)
+    df.iloc[duplicates[1]] = df.iloc[duplicates[0]].to_numpy()
+    return df
+
+
+def write_feed(path, rows, seed=0, chunk_size=50000):
+    """
+    Write a synthetic feed of ``rows`` rows to ``path`` (.xlsx or .csv).
+
+    Rows are generated and written in chunks, so 1M-row feeds do not need the
+    whole DataFrame in memory.
+    """
+    if path.endswith('.csv'):
+        for start in range(0, rows, chunk_size):
+            make_feed(min(chunk_size, rows - start), seed, start).to_csv(
+                path, index=False, header=start == 0, mode='w' if start == 0 else 'a')
+        return path
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(FEED_HEADER)
+    for start in range(0, rows, chunk_size):
+        chunk = make_feed(min(chunk_size, rows - start), seed, start)
+        for row in chunk.itertuples(index=False):
+            sheet.append([None if isinstance(value, float) and np.isnan(value) else value
+                          for value in row])
+    workbook.save(path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('rows', type=int)
+    parser.add_argument('path')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_feed(args.path, args.rows, seed=args.seed)
+    print(f"Wrote {args.rows} rows to {args.path} ({os.path.getsize(args.path) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+"""
+Settings for the ingest benchmarks: the project settings with a throwaway database.
+
+BENCH_DB=sqlite (default) uses BENCH_SQLITE_PATH; BENCH_DB=postgres uses the
+local server from the project settings with BENCH_DATABASE_NAME as database.
+"""
+from ebay_project.settings import *
+
+if os.getenv('BENCH_DB', 'sqlite') == 'postgres':
+    DATABASES['default']['NAME'] = os.getenv('BENCH_DATABASE_NAME', 'ebay_listings_bench')
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.getenv('BENCH_SQLITE_PATH', '/tmp/ebay_listings_bench.sqlite3'),
+        }
+    }
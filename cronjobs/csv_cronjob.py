@@ -1,8 +1,12 @@
 import logging
-import hashlib
+import multiprocessing
+import pickle
+import shutil
+import tempfile
 import django
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -17,9 +21,14 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE',
 django.setup()
 
 import pandas as pd
-from django.db import transaction
+from django.db import connections
+from django.utils import timezone
+from openpyxl import load_workbook
 from listings.models import *
 from helpers.s3 import S3Service
+from helpers.feed import *
+from helpers.ingest import FeedIngest
+from helpers.pricing import reprice_pending
 
 
 bucket_name = os.getenv('S3_BUCKET')
@@ -38,7 +47,7 @@ def xlsx_to_csv(xlsx_file, csv_file):
     Convert an Excel file to a CSV file after preprocessing the data.
 
     Args:
-        xlsx_file (str): Path to the input Excel file.
+        xlsx_file (str or file-like): Path to or open binary file of the input Excel file.
         csv_file (str): Path to the output CSV file.
     """
     try:
@@ -54,159 +63,353 @@ def xlsx_to_csv(xlsx_file, csv_file):
         raise Exception(f"Failed to convert {xlsx_file} to CSV: {e}")
 
 
-def preprocess_dataframe(df):
-    # Add an empty row
-    empty_row = pd.DataFrame([{}], columns=df.columns)
-    df = pd.concat([df, empty_row], ignore_index=True)
-
-    # Strip any leading/trailing spaces from column names
-    df.columns = df.columns.str.strip()
-
-    # Drop rows with NaN values in essential columns
-    essential_columns = ['SKU', 'PART_NAME']
-    df = df.dropna(subset=essential_columns)
-
-    # Drop duplicate rows based on all columns
-    df = df.drop_duplicates()
+def iter_xlsx_chunks(xlsx_file, chunk_size=10000):
+    """
+    Stream an Excel file row by row and yield it as bounded DataFrames.
 
-    # Convert numeric columns that may have .0 suffix to integers
-    numeric_columns = ['SKU', 'STOCK_TOTAL']
-    for column in numeric_columns:
-        df[column] = pd.to_numeric(
-            df[column], errors='coerce').fillna(0).astype(int)
+    The workbook is opened in openpyxl read-only mode, so only the rows of the
+    current chunk are held in memory regardless of the size of the sheet.
 
-    # Remove leading and trailing spaces from all string columns
-    df = df.apply(lambda col: col.map(lambda x: x.strip() if isinstance(
-        x, str) else x) if col.dtype == "object" else col)
+    Args:
+        xlsx_file (str or file-like): Path to or open binary file of the input Excel file.
+        chunk_size (int, optional): Number of rows per yielded DataFrame. Defaults to 10000.
 
-    # Drop rows with default values in essential columns
-    df = df[(df['SKU'] != 0) & (df['PART_NAME'].str.strip() != '')]
+    Yields:
+        pd.DataFrame: Raw (not yet preprocessed) rows keyed by the header row.
+    """
+    workbook = load_workbook(xlsx_file, read_only=True, data_only=True)
+    try:
+        sheet = workbook.active
+        header = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True), None)
+        if header is None:
+            return
+
+        columns = [str(column).strip() if column is not None else f"Unnamed: {index}"
+                   for index, column in enumerate(header)]
+        width = len(columns)
+
+        chunk = []
+        for row in sheet.iter_rows(min_row=2, values_only=True):
+            # Read-only sheets drop trailing empty cells, so pad every row to the header width
+            if len(row) < width:
+                row = row + (None,) * (width - len(row))
+            chunk.append(row[:width])
+            if len(chunk) >= chunk_size:
+                yield pd.DataFrame.from_records(chunk, columns=columns)
+                chunk = []
+
+        if chunk:
+            yield pd.DataFrame.from_records(chunk, columns=columns)
+    finally:
+        workbook.close()
+
+
+def save_dataframe_to_db(chunk, batch_size=1000, ingest=None):
+    """Saves the new and changed rows of a preprocessed chunk to the database.
 
-    return df
+    Args:
+        chunk (pd.DataFrame): Rows already passed through preprocess_dataframe.
+        batch_size (int, optional): Number of items to bulk create in each transaction. Defaults to 1000.
+        ingest (FeedIngest, optional): Run-wide ingest state. Defaults to a fresh FeedIngest.
+    """
+    ingest = ingest or FeedIngest(batch_size=batch_size)
+    ingest.ingest(chunk)
 
 
-def save_csv_to_db(csv_file, chunk_size=10000, batch_size=1000):
+def save_csv_to_db(csv_file, chunk_size=10000, batch_size=1000, ingest=None):
     """Saves CSV data to the database in chunks.
 
     Args:
         csv_file (str): Path to the CSV file.
         chunk_size (int, optional): Number of rows to read at a time. Defaults to 10000.
         batch_size (int, optional): Number of items to bulk create in each transaction. Defaults to 1000.
+        ingest (FeedIngest, optional): Run-wide ingest state. Defaults to a fresh FeedIngest.
+
+    Returns:
+        bool: False if the file could not be read completely; the failure is recorded in ``ingest``.
     """
+    ingest = ingest or FeedIngest(batch_size=batch_size)
     try:
         for chunk in pd.read_csv(csv_file, chunksize=chunk_size):
             chunk = preprocess_dataframe(chunk)
-            items_to_create = []
-            items_to_update = []
-            existing_items = {item.sku: item for item in Item.objects.filter(
-                sku__in=chunk['SKU'].tolist())}
-            logger.info(
-                f"Found {existing_items} existing items.")
-
-            for index, row in chunk.iterrows():
-                sku = str(row.get('SKU', ''))
-                if sku in existing_items:
-                    existing_item = existing_items[sku]
-                    if (float(existing_item.price) != float(row.get('B2B_PRICE15', 0.0)) or int(existing_item.stock) != int(float(row.get('STOCK_TOTAL', 0)))):
-                        existing_item.price = float(row.get('B2B_PRICE15', 0.0))
-                        existing_item.stock = int(float(row.get('STOCK_TOTAL', 0)))
-                        if existing_item.status == 'updated':
-                            existing_item.status = 'listed'
-                        items_to_update.append(existing_item)
-                else:
-                    item = Item(
-                        sku=sku,
-                        brand=str(row.get('BRAND', '')),
-                        part_name=str(row.get('PART_NAME', '')),
-                        partslink=str(row.get('PARTSLINK', '')),
-                        oem_number=str(row.get('OEM_NUMBER', '')),
-                        category_id=str(row.get('CATEGORY_ID', '')),
-                        price=float(row.get('B2B_PRICE15', 0.0)),
-                        shipping_revenue18=float(
-                            row.get('SHIPPINGREVENUE18', 0.0)),
-                        handling_revenue18=float(
-                            row.get('HANDLINGREVENUE18', 0.0)),
-                        stock_va=int(float(row.get('STOCK_VA', 0))),
-                        stock_il=int(float(row.get('STOCK_IL', 0))),
-                        stock_las1=int(float(row.get('STOCK_LAS1', 0))),
-                        stock_peru=int(float(row.get('STOCK_PERU', 0))),
-                        stock_gpt=int(float(row.get('STOCK_GPT', 0))),
-                        stock_jax=int(float(row.get('STOCK_JAX', 0))),
-                        stock=int(float(row.get('STOCK_TOTAL', 0))),
-                        pdescription=str(row.get('PDESCRIPTION', '')),
-                    )
-                    items_to_create.append(item)
-                if len(items_to_create) >= batch_size:
-                    with transaction.atomic():
-                        Item.objects.bulk_create(
-                            items_to_create, ignore_conflicts=True)
-                    items_to_create = []
-                if len(items_to_update) >= batch_size:
-                    with transaction.atomic():
-                        Item.objects.bulk_update(
-                            items_to_update, ['price', 'stock', 'status'])
-                    items_to_update = []
-
-            if items_to_create:
-                with transaction.atomic():
-                    Item.objects.bulk_create(
-                        items_to_create, ignore_conflicts=True)
-
-            if items_to_update:
-                with transaction.atomic():
-                    Item.objects.bulk_update(
-                        items_to_update, ['price', 'stock', 'status'])
+            save_dataframe_to_db(chunk, ingest=ingest)
+    except Exception as e:
+        ingest.file_failed(csv_file, e)
+        return False
+    return True
+
+
+def save_xlsx_to_db(xlsx_file, chunk_size=10000, batch_size=1000, ingest=None):
+    """Streams an Excel file straight into the database without a CSV round trip.
+
+    Each chunk is read, preprocessed once and written before the next one is
+    read, so peak memory is bounded by ``chunk_size`` rather than the feed size.
 
+    Args:
+        xlsx_file (str or file-like): Path to or open binary file of the Excel file.
+        chunk_size (int, optional): Number of rows to read at a time. Defaults to 10000.
+        batch_size (int, optional): Number of items to bulk create in each transaction. Defaults to 1000.
+        ingest (FeedIngest, optional): Run-wide ingest state. Defaults to a fresh FeedIngest.
+
+    Returns:
+        bool: False if the file could not be read completely; the failure is recorded in ``ingest``.
+    """
+    ingest = ingest or FeedIngest(batch_size=batch_size)
+    try:
+        for chunk in iter_xlsx_chunks(xlsx_file, chunk_size=chunk_size):
+            chunk = preprocess_dataframe(chunk)
+            save_dataframe_to_db(chunk, ingest=ingest)
     except Exception as e:
-        print(row, e)
+        ingest.file_failed(getattr(xlsx_file, 'name', xlsx_file), e)
+        return False
+    return True
 
 
-def generate_file_hash(file_path):
-    """Generate a SHA-256 hash for the file content."""
-    sha256 = hashlib.sha256()
-    with open(file_path, 'rb') as f:
-        while chunk := f.read(8192):
-            sha256.update(chunk)
-    return sha256.hexdigest()
+def filter_unchanged_objects(objects):
+    """
+    Drop objects whose key, ETag and size match an already processed manifest entry.
 
+    Args:
+        objects (list): S3 object dicts from S3Service.list_objects.
 
-def main():
-    local_xlsx_file_template = "/tmp/{}_latest_file.xlsx"
-    local_csv_file_template = "/tmp/{}_latest_file.csv"
+    Returns:
+        list: Objects that are new or changed, in their original order.
+    """
+    processed = set(S3Object.objects.filter(
+        key__in=[obj['Key'] for obj in objects], processed_at__isnull=False)
+        .values_list('key', 'etag', 'size'))
+    changed = []
+    for obj in objects:
+        if (obj['Key'], obj['ETag'], obj['Size']) in processed:
+            logger.info(f"File {obj['Key']} unchanged since last run. Skipping download.")
+        else:
+            changed.append(obj)
+    return changed
+
+
+def record_s3_object(obj, file_hash):
+    """Mark an S3 object as processed in the manifest."""
+    S3Object.objects.update_or_create(key=obj['Key'], defaults={
+        'etag': obj['ETag'],
+        'size': obj['Size'],
+        'last_modified': obj['LastModified'],
+        'file_hash': file_hash,
+        'processed_at': timezone.now(),
+    })
+
+
+def _init_ingest_worker():
+    """Give every pool process its own S3 session; boto3 resources are not fork-safe."""
+    global s3_client
+    s3_client = S3Service(
+        region_name=os.getenv('REGION'),
+        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
+    )
+
+
+def fetch_feed_file(file_key, workdir):
+    """
+    Download one feed file, hashing it while it streams. Runs in a worker process.
 
-    # Get the latest file names from S3
-    latest_file_keys = s3_client.get_previous_day_files(bucket_name)
-    if not latest_file_keys:
-        return
+    Returns:
+        tuple: (local path, SHA-256 hex digest).
+    """
+    local_xlsx_file = os.path.join(workdir, file_key.split('/')[-1])
+    with open(local_xlsx_file, 'wb') as f:
+        file_hash = s3_client.stream_object(file_key, bucket_name, f)
+    return local_xlsx_file, file_hash
+
+
+def normalize_feed_file(xlsx_file, output_file, chunk_size=10000):
+    """
+    Parse and normalize a whole feed file into pickled item columns. Runs in a worker process.
+
+    Each chunk is appended to ``output_file`` as its own pickle so the parent
+    can merge it chunk by chunk. The sheet is read once, from top to bottom:
+    openpyxl's read-only mode has no random access to rows, so splitting a
+    file into row ranges would make every task parse everything before its range.
+
+    Returns:
+        str: ``output_file``.
+    """
+    with open(output_file, 'wb') as f:
+        for chunk in iter_xlsx_chunks(xlsx_file, chunk_size=chunk_size):
+            pickle.dump(to_item_columns(preprocess_dataframe(chunk)), f)
+    return output_file
+
+
+def merge_normalized_file(output_file, ingest):
+    """Merge the pickled item column chunks of one parsed file and remove the file."""
+    with open(output_file, 'rb') as f:
+        while True:
+            try:
+                columns = pickle.load(f)
+            except EOFError:
+                break
+            ingest.ingest_columns(columns)
+    os.remove(output_file)
+
+
+def ingest_files_parallel(objects, ingest, workers):
+    """
+    Download, parse and normalize feed files in a process pool and merge them in order.
+
+    Every file is parsed whole by one worker, so the pool spreads files, not
+    rows. Only the merge into the database runs in this process, strictly in
+    ``objects`` order and row order within a file, so when a SKU appears more
+    than once the last occurrence wins.
+
+    Args:
+        objects (list): S3 object dicts, oldest upload first.
+        ingest (FeedIngest): Run-wide ingest state.
+        workers (int): Number of worker processes.
 
-    for latest_file_key in latest_file_keys:
+    Returns:
+        int: Number of files skipped as already processed.
+    """
+    workdir = tempfile.mkdtemp(prefix='feed_ingest_')
+    # Forked workers must not share this process's database connections
+    connections.close_all()
+    skipped_files = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'),
+                                 initializer=_init_ingest_worker) as pool:
+            fetched = [pool.submit(fetch_feed_file, obj['Key'], workdir)
+                       for obj in objects]
+
+            parsed = []
+            # Files of this run with the same content as an earlier one are skipped
+            # like already processed ones, as ingest_files_sequential does
+            run_hashes = set()
+            for obj, future in zip(objects, fetched):
+                latest_file_name = obj['Key'].split('/')[-1]
+                try:
+                    local_xlsx_file, file_hash = future.result()
+                except Exception as e:
+                    ingest.file_failed(latest_file_name, e)
+                    continue
+
+                if file_hash in run_hashes or S3File.objects.filter(file_hash=file_hash).exists():
+                    logger.info(f"File {latest_file_name} already processed. Skipping.")
+                    record_s3_object(obj, file_hash)
+                    skipped_files += 1
+                    continue
+                run_hashes.add(file_hash)
+
+                parsed.append((obj, latest_file_name, file_hash, pool.submit(
+                    normalize_feed_file, local_xlsx_file, f"{local_xlsx_file}.pkl")))
+
+            for obj, latest_file_name, file_hash, future in parsed:
+                # Another run may have ingested the same content while this one was parsing
+                if S3File.objects.filter(file_hash=file_hash).exists():
+                    logger.info(f"File {latest_file_name} already processed. Skipping.")
+                    # Its parse output, if any, goes with the work directory
+                    future.cancel()
+                    record_s3_object(obj, file_hash)
+                    skipped_files += 1
+                    continue
+                try:
+                    merge_normalized_file(future.result(), ingest)
+                except Exception as e:
+                    ingest.file_failed(latest_file_name, e)
+                    continue
+                # Only a completely ingested file counts as processed; a failed one is retried next run
+                S3File.objects.get_or_create(file_hash=file_hash, defaults={'name': latest_file_name})
+                record_s3_object(obj, file_hash)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return skipped_files
+
+
+def ingest_files_sequential(objects, ingest, ingest_mode='stream'):
+    """
+    Download, parse and merge feed files one after another in this process.
+
+    Each object is streamed once into a spooled buffer that is hashed on the
+    way and handed to the parser as a file-like object; only files larger than
+    INGEST_SPOOL_MAX_MB touch the disk.
+
+    Args:
+        objects (list): S3 object dicts, oldest upload first.
+        ingest (FeedIngest): Run-wide ingest state.
+        ingest_mode (str, optional): 'stream' or the legacy 'csv' round trip. Defaults to 'stream'.
+
+    Returns:
+        int: Number of files skipped as already processed.
+    """
+    local_csv_file_template = "/tmp/{}_latest_file.csv"
+    max_memory = int(os.getenv('INGEST_SPOOL_MAX_MB', '64')) * 1024 * 1024
+
+    skipped_files = 0
+    for obj in objects:
+        latest_file_key = obj['Key']
         latest_file_name = latest_file_key.split('/')[-1]
-        local_xlsx_file = local_xlsx_file_template.format(latest_file_name)
         local_csv_file = local_csv_file_template.format(latest_file_name)
 
-        # Download the latest xlsx file from S3
-        s3_client.download_from_s3(
-            latest_file_key, bucket_name, local_xlsx_file)
+        # Download the latest xlsx file from S3, hashing it on the way
+        xlsx_file, file_hash = s3_client.open_object(
+            latest_file_key, bucket_name, max_memory=max_memory)
+
+        with xlsx_file:
+            # Check if the file already exists in the database
+            if S3File.objects.filter(file_hash=file_hash).exists():
+                logger.info(f"File {latest_file_name} already processed. Skipping.")
+                record_s3_object(obj, file_hash)
+                skipped_files += 1
+                continue
+
+            if ingest_mode == 'csv':
+                # Convert the xlsx file to csv
+                try:
+                    xlsx_to_csv(xlsx_file, local_csv_file)
+                except Exception as e:
+                    ingest.file_failed(latest_file_name, e)
+                    continue
+                saved = save_csv_to_db(local_csv_file, ingest=ingest)
+                os.remove(local_csv_file)
+            else:
+                saved = save_xlsx_to_db(xlsx_file, ingest=ingest)
+
+            # Only a completely ingested file counts as processed; a failed one is retried next run
+            if saved:
+                S3File.objects.create(name=latest_file_name, file_hash=file_hash)
+                record_s3_object(obj, file_hash)
+
+    return skipped_files
 
-        # Generate the hash for the downloaded file
-        file_hash = generate_file_hash(local_xlsx_file)
 
-        # Check if the file already exists in the database
-        if S3File.objects.filter(file_hash=file_hash).exists():
-            print(f"File {latest_file_name} already processed. Skipping.")
-            os.remove(local_xlsx_file)  # Clean up the local XLSX file
-            continue
+def main():
+    # 'stream' reads the workbook directly into the database, 'csv' keeps the legacy CSV round trip
+    ingest_mode = os.getenv('INGEST_MODE', 'stream')
+    # Number of processes for download/parse/normalize; 1 keeps everything in this process
+    workers = int(os.getenv('INGEST_WORKERS', '1'))
+
+    # Get the latest files from S3, scoped to S3_PREFIX (strftime codes allowed)
+    latest_files = s3_client.get_previous_day_objects(
+        bucket_name, os.getenv('S3_PREFIX', ''))
+    if not latest_files:
+        return
+
+    # Skip objects already processed with the same ETag and size without downloading them
+    new_files = filter_unchanged_objects(latest_files)
+    skipped_files = len(latest_files) - len(new_files)
 
-        # Convert the xlsx file to csv
-        xlsx_to_csv(local_xlsx_file, local_csv_file)
+    ingest = FeedIngest()
+    if workers > 1:
+        skipped_files += ingest_files_parallel(new_files, ingest, workers)
+    else:
+        skipped_files += ingest_files_sequential(
+            new_files, ingest, ingest_mode)
 
-        # Save the file metadata to the database
-        S3File.objects.create(name=latest_file_name, file_hash=file_hash)
-        save_csv_to_db(local_csv_file)
+    if skipped_files == len(latest_files):
+        return
 
-        # Clean up local files
-        os.remove(local_xlsx_file)
-        os.remove(local_csv_file)
+    # A SKU only disappeared if no file of the day carries it, which cannot be
+    # told when some of the day's files were skipped as already processed
+    ingest.finish(zero_disappeared=skipped_files == 0)
+    reprice_pending(full=True)
 
 
 if __name__ == "__main__":
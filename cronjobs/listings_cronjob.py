@@ -1,4 +1,3 @@
-from decimal import Decimal
 import django
 import os
 import sys
@@ -14,15 +13,28 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE',
                       os.getenv('DJANGO_SETTINGS_MODULE'))
 
 django.setup()
-import xml.etree.ElementTree as ET
-import xml.dom.minidom
 import requests
+import itertools
 import logging
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from django.db.models import Q
+from django.utils import timezone
 from listings.models import *
 from helpers.generate_token import *
+from helpers.payload import (AddItemsPayloadBuilder, PAYLOAD_FIELDS, get_item_by_sku_xml,
+                             parse_add_items_response, parse_get_item_response, pretty_xml)
+from helpers.job_ledger import RunLedger
+from helpers.bulk_exchange import BulkExchangeClient, BulkExchangeError, iter_bulk_results, write_bulk_file
+from helpers.listing_errors import classify_errors, failure_outcome, listed_outcome, write_listing_outcomes
+from helpers.pricing import reprice_pending
+from helpers.pagination import iter_batches, keyset_windows
+from helpers.claims import ItemClaimer, claimed_windows
+from helpers.concurrency import AdaptiveController, TokenBucket, CallStats
+from helpers.ebay_client import EbayUnavailable, get_ebay_client, was_throttled
 from cronjobs.update_listings import *
-import re
+import xml.etree.ElementTree as ET
 
 # Configure logging
 # Configure logging
@@ -31,237 +43,291 @@ logging.basicConfig(level=logging.INFO,
 logger = logging.getLogger(__name__)
 
 
-def create_bulk_items_trading_api():
+def post_add_items(client, xml_body, rate_limiter, access_token=None):
     """
-    Creates or replaces inventory items in bulk based on data from the database using the eBay Trading API.
+    Send one AddItems call, each attempt once the rate limiter allows it. Runs in a pool thread.
+
+    A call rejected for its access token is sent again with a refreshed token.
+
+    Returns:
+        tuple: (requests.Response, latency in seconds).
     """
-    access_token = check_access_token()
+    started = time.monotonic()
+    response = client.trading('AddItems', xml_body, before_attempt=rate_limiter.acquire,
+                              access_token=access_token)
+    return response, time.monotonic() - started
+
+
+def process_add_items_response(batch, batch_start, response):
+    """
+    Record the outcome of one AddItems call for every item of the batch.
+
+    Returns:
+        bool: False when the call failed as a whole and the batch was left untouched.
+    """
+    try:
+        ack, errors, results = parse_add_items_response(response.text)
+    except ET.ParseError:
+        logger.error(
+            f"Failed to list batch starting at item {batch_start}. Response: {response.status_code} {response.text}")
+        return False
+
+    if not results and not errors:
+        logger.error(
+            f"Failed to list batch starting at item {batch_start}. Response: {response.status_code} {response.text}")
+        return False
+
+    outcomes = {}
+    now = timezone.now()
+    for index, item in enumerate(batch):
+        # MessageID/CorrelationID is the 1-based position of the item in the batch
+        result = results.get(index + 1)
+        if result is not None and result.ok:
+            outcomes[item.pk] = listed_outcome(result.item_id)
+            logger.info(f"ItemID {result.item_id} updated for SKU {item.sku}")
+        else:
+            item_errors = result.errors if result is not None and result.errors else errors
+            debug_info = '\n'.join(item_errors) or f"No AddItemResponseContainer returned (Ack: {ack})"
+            # Errors of the call as a whole say nothing about the item, those are retried
+            error_class = classify_errors(result.error_codes if result is not None else [])
+            outcomes[item.pk] = failure_outcome(item.error_attempts, error_class, debug_info, now)
+            logger.error(f"Failed to list SKU {item.sku} ({outcomes[item.pk]['error_class']}): {debug_info}")
+
+    write_listing_outcomes(outcomes)
+    listed = sum(1 for values in outcomes.values() if values['status'] == 'listed')
+    logger.info(f"Listed {listed}/{len(batch)} items of batch starting at item {batch_start}.")
+    return listed > 0
+
+
+def listing_candidates():
+    """
+    New items and failed ones whose retry is due, errors from before classification included.
+
+    Items without a sell price yet, e.g. created after this run's reprice_pending(), wait for the next run.
+    """
+    # status__in repeats the condition of item_listing_queue_idx, so the planner matches that index directly
+    return Item.objects.exclude(stock=0).filter(status__in=['not listed', 'error'], sell_price__isnull=False).filter(
+        Q(status='not listed') |
+        Q(status='error', error_class__isnull=True) |
+        Q(status='error', error_class='retryable', next_attempt_at__lte=timezone.now()))
 
-    headers = {
-        "Content-Type": "text/xml",
-        "X-EBAY-API-SITEID": "100",  # Site ID for the US
-        "X-EBAY-API-CALL-NAME": "AddItems",
-        "X-EBAY-API-COMPATIBILITY-LEVEL": "1193"  # eBay API version
-    }
 
-    # Fetch items from the database
-    items = Item.objects.exclude(stock=0).filter(Q(status='not listed') | Q(status='error'))[:25000]
+def reconcile_unanswered_batches(ledger, client, access_token):
+    """
+    Look up the items of batches an earlier attempt sent without recording the answer.
+
+    Items eBay already has a listing for (GetItem by SKU) are marked listed so
+    they are not submitted a second time; the others stay candidates.
+    """
+    for job_batch in ledger.unanswered():
+        pending = Item.objects.filter(sku__in=job_batch.skus, status__in=['not listed', 'error'])
+        outcomes = {}
+        for item in pending:
+            response = client.trading('GetItem', get_item_by_sku_xml(access_token, item.sku),
+                                      access_token=access_token)
+            try:
+                item_id, errors = parse_get_item_response(response.text)
+            except ET.ParseError:
+                logger.error(f"Could not look up SKU {item.sku}: {response.status_code} {response.text}")
+                continue
+            if item_id:
+                outcomes[item.pk] = listed_outcome(item_id)
+                logger.info(f"SKU {item.sku} was listed as ItemID {item_id} by an unanswered call")
+        write_listing_outcomes(outcomes)
+        ledger.reconciled(job_batch, f"{len(outcomes)} of {len(job_batch.skus)} items found listed")
+
 
-    if not items.exists():
+def create_bulk_items_trading_api():
+    """
+    Creates or replaces inventory items in bulk based on data from the database using the eBay Trading API.
+
+    Calls are limited to LISTING_RATE per second. The number of batches in
+    flight (up to LISTING_CONCURRENCY) and the batch size (up to eBay's 5)
+    adapt to observed latency and throttling; responses are recorded as they arrive.
+    Candidates are claimed window by window, so several workers (see
+    ItemClaimer) can list at the same time without sending an item twice.
+    """
+    reprice_pending()
+    access_token = check_access_token()
+    client = get_ebay_client()
+
+    payload_builder = AddItemsPayloadBuilder()
+    controller = AdaptiveController(
+        'AddItems', max_concurrency=int(os.getenv('LISTING_CONCURRENCY', '4')),
+        max_batch_size=5, latency_target=float(os.getenv('LISTING_LATENCY_TARGET', '10')))
+    rate_limiter = TokenBucket(float(os.getenv('LISTING_RATE', '5')))
+    stats = CallStats()
+
+    claimer = ItemClaimer('add_items')
+    ledger = RunLedger(claimer.job, worker=claimer.worker, resume=claimer.stable,
+                       stale_after=claimer.lease)
+    if ledger.resumed:
+        try:
+            reconcile_unanswered_batches(ledger, client, access_token)
+        except (EbayUnavailable, requests.RequestException) as e:
+            logger.error(f"Could not reconcile unanswered batches, stopping: {e}")
+            ledger.finish(completed=False)
+            return
+
+    # Claimed and paged by primary key with only the columns the payload needs
+    windows = claimed_windows(listing_candidates(), claimer,
+                              window_size=int(os.getenv('LISTING_WINDOW', '1000')),
+                              limit=max(0, 25000 - ledger.items_submitted),
+                              fields=(*PAYLOAD_FIELDS, 'error_attempts'), after=ledger.checkpoint_pk)
+
+    in_flight = {}
+    unavailable = []
+
+    def collect(done):
+        # Database writes stay on this thread; the pool threads only talk to eBay,
+        # apart from the rare token refresh, which closes its connection again
+        for future in done:
+            batch, batch_start, job_batch = in_flight.pop(future)
+            try:
+                response, latency = future.result()
+            except EbayUnavailable as e:
+                # The batch may or may not have reached eBay; it stays pending for reconciliation
+                unavailable.append(e)
+                stats.record(0.0, len(batch), ok=False)
+                continue
+            except requests.RequestException as e:
+                logger.error(f"Failed to list batch starting at item {batch_start}: {e}")
+                stats.record(0.0, len(batch), ok=False)
+                controller.observe(0.0, ok=False)
+                continue
+            ok = process_add_items_response(batch, batch_start, response)
+            ledger.answered(job_batch, 'succeeded' if ok else 'failed')
+            stats.record(latency, len(batch), ok=ok)
+            # Rejected items are a data problem, only failed calls should slow the run down
+            controller.observe(latency, ok=response.status_code < 500 and response.status_code != 429,
+                               throttled=was_throttled(response))
+
+    batch_start = 0
+    with ThreadPoolExecutor(max_workers=controller.max_concurrency) as pool:
+        for batch in iter_batches(windows, lambda: controller.batch_size):
+            if unavailable:
+                break
+
+            containers = []
+            for index, item in enumerate(batch):
+                try:
+                    containers.append(payload_builder.item_xml(item, index + 1))
+                except Exception as e:
+                    logger.error(f"Error processing item {item.sku}: {e}")
+
+            # Served from memory, and refreshed ahead of its expiry on long runs
+            access_token = check_access_token()
+            xml_body = payload_builder.request_xml(access_token, containers)
+
+            # Pretty-printing re-parses the whole batch, only pay for it when it is logged
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(pretty_xml(xml_body))
+
+            while len(in_flight) >= controller.concurrency:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            job_batch = ledger.submitted(batch, list(range(1, len(batch) + 1)))
+            future = pool.submit(post_add_items, client, xml_body, rate_limiter, access_token)
+            in_flight[future] = (batch, batch_start, job_batch)
+            batch_start += len(batch)
+
+        collect(wait(in_flight).done)
+
+    # Calls without a recorded answer keep the run open, the next start reconciles them;
+    # until then its claims hold for their lease
+    completed = not unavailable and not ledger.unanswered().exists()
+    ledger.finish(completed=completed)
+    if completed:
+        claimer.release()
+
+    if unavailable:
+        logger.error(f"Stopping the listing run, eBay is unavailable: {unavailable[0]}")
+    elif not batch_start:
         logger.info("No items found to list.")
         return
 
-    # Process items in batches of 5
-    batch_size = 5
-    for batch_start in range(0, len(items), batch_size):
-        batch = items[batch_start:batch_start + batch_size]
-
-        add_items_request = ET.Element(
-            'AddItemsRequest', xmlns="urn:ebay:apis:eBLBaseComponents")
-        requester_credentials = ET.SubElement(
-            add_items_request, 'RequesterCredentials')
-        eBayAuthToken = ET.SubElement(requester_credentials, 'eBayAuthToken')
-        eBayAuthToken.text = access_token
-        version = ET.SubElement(add_items_request, 'Version')
-        version.text = '1193'
-        error_language = ET.SubElement(add_items_request, 'ErrorLanguage')
-        error_language.text = 'en_US'
-        warning_level = ET.SubElement(add_items_request, 'WarningLevel')
-        warning_level.text = 'High'
-
-        for index, item in enumerate(batch):
-            try:
-                add_item_request_container = ET.SubElement(
-                    add_items_request, 'AddItemRequestContainer')
-                message_id = ET.SubElement(
-                    add_item_request_container, 'MessageID')
-                message_id.text = str(index + 1)
-
-                item_xml = ET.SubElement(add_item_request_container, 'Item')
-
-                title = ET.SubElement(item_xml, 'Title')
-                title.text = item.pdescription
-
-                sku = ET.SubElement(item_xml, 'SKU')
-                sku.text = str(item.sku)
-
-                message = ET.SubElement(item_xml, 'Message')
-                message.text = str(item.sku)
-
-                description = ET.SubElement(item_xml, 'Description')
-                description.text = (
-                    f"Brand: {item.brand},\n"
-                    f"Part Link: {item.partslink},\n"
-                    f"OEM Number: {item.oem_number},\n\n"
-                    f"{item.pdescription}"
-                )
-
-                primary_category = ET.SubElement(item_xml, 'PrimaryCategory')
-                category_id = ET.SubElement(primary_category, 'CategoryID')
-                category_id.text = item.category_id or '6755'
-
-                category_mapping_allowed = ET.SubElement(
-                    item_xml, 'CategoryMappingAllowed')
-                category_mapping_allowed.text = 'true'
-
-                site = ET.SubElement(item_xml, 'Site')
-                site.text = 'eBayMotors'
-
-                quantity = ET.SubElement(item_xml, 'Quantity')
-                quantity.text = '1'
-
-                start_price = ET.SubElement(item_xml, 'StartPrice')
-                start_price.text = str(item.price * Decimal('1.2'))
-
-                listing_duration = ET.SubElement(item_xml, 'ListingDuration')
-                listing_duration.text = 'GTC'
-
-                listing_type = ET.SubElement(item_xml, 'ListingType')
-                listing_type.text = 'FixedPriceItem'
-
-                dispatch_time_max = ET.SubElement(item_xml, 'DispatchTimeMax')
-                dispatch_time_max.text = '3'
-
-                shipping_details = ET.SubElement(item_xml, 'ShippingDetails')
-                shipping_type = ET.SubElement(shipping_details, 'ShippingType')
-                shipping_type.text = 'Flat'
-                shipping_service_options = ET.SubElement(
-                    shipping_details, 'ShippingServiceOptions')
-                shipping_service_priority = ET.SubElement(
-                    shipping_service_options, 'ShippingServicePriority')
-                shipping_service_priority.text = '1'
-                shipping_service = ET.SubElement(
-                    shipping_service_options, 'ShippingService')
-                shipping_service.text = 'FedExHomeDelivery'
-                shipping_service_cost = ET.SubElement(
-                    shipping_service_options, 'ShippingServiceCost')
-                shipping_service_cost.text = '0.0'
-
-                return_policy = ET.SubElement(item_xml, 'ReturnPolicy')
-                returns_accepted_option = ET.SubElement(
-                    return_policy, 'ReturnsAcceptedOption')
-                returns_accepted_option.text = 'ReturnsAccepted'
-                returns_within_option = ET.SubElement(
-                    return_policy, 'ReturnsWithinOption')
-                returns_within_option.text = 'Days_30'
-                shipping_cost_paid_by_option = ET.SubElement(
-                    return_policy, 'ShippingCostPaidByOption')
-                shipping_cost_paid_by_option.text = 'Buyer'
-
-                condition_id = ET.SubElement(item_xml, 'ConditionID')
-                condition_id.text = '1000'
-
-                # Add ConditionDisplayName element
-                condition_display_name = ET.SubElement(item_xml, 'ConditionDisplayName')
-                condition_display_name.text = 'New'
-
-                country = ET.SubElement(item_xml, 'Country')
-                country.text = 'US'
-
-                currency = ET.SubElement(item_xml, 'Currency')
-                currency.text = 'USD'
-
-                postal_code = ET.SubElement(item_xml, 'PostalCode')
-                postal_code.text = '60586'
-
-                item_specifics = ET.SubElement(item_xml, 'ItemSpecifics')
-
-                name_value_list_1 = ET.SubElement(
-                    item_specifics, 'NameValueList')
-                name_1 = ET.SubElement(name_value_list_1, 'Name')
-                name_1.text = 'Title'
-                value_1 = ET.SubElement(name_value_list_1, 'Value')
-                value_1.text = item.part_name
-
-                name_value_list_2 = ET.SubElement(
-                    item_specifics, 'NameValueList')
-                name_2 = ET.SubElement(name_value_list_2, 'Name')
-                name_2.text = 'Publisher'
-                value_2 = ET.SubElement(name_value_list_2, 'Value')
-                value_2.text = item.brand
-
-                name_value_list_3 = ET.SubElement(
-                    item_specifics, 'NameValueList')
-                name_3 = ET.SubElement(name_value_list_3, 'Name')
-                name_3.text = 'Author'
-                value_3 = ET.SubElement(name_value_list_3, 'Value')
-                value_3.text = 'JK Rowling'
-
-                name_value_list_4 = ET.SubElement(
-                    item_specifics, 'NameValueList')
-                name_4 = ET.SubElement(name_value_list_4, 'Name')
-                name_4.text = 'Language'
-                value_4 = ET.SubElement(name_value_list_4, 'Value')
-                value_4.text = 'English'
-
-                picture_details = ET.SubElement(item_xml, 'PictureDetails')
-                gallery_type = ET.SubElement(picture_details, 'GalleryType')
-                gallery_type.text = 'Gallery'
-                picture_url = ET.SubElement(picture_details, 'PictureURL')
-                picture_url.text = item.image_url or 'https://ir.ebaystatic.com/cr/v/c1/rsc/ebay_logo_512.png'
-
-            except Exception as e:
-                logger.error(f"Error processing item {item.sku}: {e}")
-
-        request_body = ET.tostring(
-            add_items_request, encoding='utf-8').decode('utf-8')
-        xml_body = f"<?xml version='1.0' encoding='utf-8'?>\n{request_body}"
-        xml_body = xml_body.strip()
-        pretty_xml = xml.dom.minidom.parseString(
-            xml_body).toprettyxml(indent="  ")
-
-        logger.debug(pretty_xml)
-
-        # URL for the eBay Trading API
-        url = f"https://{os.getenv('BASE_URL')}/ws/api.dll"
-
-        # Make the POST request
-        response = requests.post(url, headers=headers, data=xml_body)
-        response_text = response.text
-
-        if '<Ack>Success</Ack>' in response_text or '<ItemID>' in response_text:
-            logger.info(
-                f"Successfully listed batch starting at item {batch_start}.")
-
-            # Regular expression patterns to find ItemID and CorrelationID
-            item_id_pattern = re.compile(r'<ItemID>(\d+)</ItemID>')
-            message_id_pattern = re.compile(
-                r'<CorrelationID>(\d+)</CorrelationID>')
-
-            # Find all matches in the response
-            item_ids = item_id_pattern.findall(response_text)
-            message_ids = message_id_pattern.findall(response_text)
-
-            # Ensure the number of item_ids matches the number of message_ids
-            if len(item_ids) != len(message_ids):
-                logger.error(
-                    "Mismatch between the number of ItemIDs and CorrelationIDs found.")
+    logger.info(f"AddItems run: {stats.summary()}")
+
+
+def record_bulk_results(results_path, chunk_size=1000):
+    """Write the outcomes of a bulk response file back to the items, one UPDATE per chunk."""
+    results = iter_bulk_results(results_path)
+    listed = failed = 0
+    while True:
+        chunk = [result for result in itertools.islice(results, chunk_size)
+                 if result.correlation_id is not None]
+        if not chunk:
+            break
+        attempts = dict(Item.objects.filter(pk__in=[result.correlation_id for result in chunk])
+                        .values_list('pk', 'error_attempts'))
+        outcomes = {}
+        now = timezone.now()
+        for result in chunk:
+            if result.correlation_id not in attempts:
+                continue
+            if result.ok:
+                outcomes[result.correlation_id] = listed_outcome(result.item_id)
+                listed += 1
             else:
-                for item_id, message_id in zip(item_ids, message_ids):
-                    try:
-                        # Get the SKU from the batch using the message_id
-                        sku = batch[int(message_id) - 1].sku
-                        # Save ItemID to the corresponding SKU in the database
-                        Item.objects.filter(sku=sku).update(
-                            item_id=item_id, status='listed')
-                        logger.info(f"ItemID {item_id} updated for SKU {sku}")
-                    except IndexError:
-                        debug_info = f"MessageID {message_id} is out of range for the batch"
-                        Item.objects.filter(sku=sku).update(
-                            status='error', debug_info=debug_info)
-                        logger.error(debug_info)
-                    except Exception as e:
-                        debug_info = f"Error updating SKU {sku} with ItemID {item_id}: {e}"
-                        Item.objects.filter(sku=sku).update(
-                            status='error', debug_info=debug_info)
-                        logger.error(debug_info)
-        else:
-            logger.error(
-                f"Failed to list batch starting at item {batch_start}. Response: {response.status_code} {response.text}")
+                outcomes[result.correlation_id] = failure_outcome(
+                    attempts[result.correlation_id], classify_errors(result.error_codes),
+                    '\n'.join(result.errors), now)
+                failed += 1
+        write_listing_outcomes(outcomes)
+    return listed, failed
+
+
+def create_items_bulk_exchange():
+    """
+    Lists every pending item with one Bulk Data Exchange upload job.
+
+    For first-time catalog loads: all candidates are written to a single
+    gzip file of AddFixedPriceItem records, uploaded, and the job is polled
+    until eBay has processed it; the response file is then streamed back
+    into the item table. Records carry a UUID per SKU, so re-running after
+    a crash cannot list an item twice.
+    """
+    reprice_pending()
+    # Items other workers are listing through the Trading API are left to them
+    windows = keyset_windows(listing_candidates().filter(ItemClaimer('add_items').claimable()),
+                             window_size=int(os.getenv('LISTING_WINDOW', '1000')),
+                             fields=(*PAYLOAD_FIELDS, 'error_attempts'))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        upload_path = os.path.join(workdir, 'AddFixedPriceItem.xml.gz')
+        count = write_bulk_file(itertools.chain.from_iterable(windows), upload_path,
+                                AddItemsPayloadBuilder())
+        if not count:
+            logger.info("No items found to list.")
+            return
+        logger.info(f"Wrote {count} items to a bulk upload file "
+                    f"({os.path.getsize(upload_path) / 1e6:.1f} MB compressed).")
+
+        # The job can outlive a token, so every call asks for the current one
+        exchange = BulkExchangeClient(check_access_token)
+        try:
+            job_id, file_reference_id = exchange.create_upload_job()
+            exchange.upload_file(job_id, file_reference_id, upload_path)
+            exchange.start_upload_job(job_id)
+            result_reference_id = exchange.wait_for_job(
+                job_id, poll_interval=float(os.getenv('BULK_POLL_INTERVAL', '30')))
+            results_path = exchange.download_file(
+                job_id, result_reference_id, os.path.join(workdir, 'responses.xml.gz'))
+        except (BulkExchangeError, EbayUnavailable, requests.RequestException) as e:
+            logger.error(f"Bulk listing job failed: {e}")
+            return
+
+        listed, failed = record_bulk_results(results_path)
+        logger.info(f"Bulk listing job {job_id}: {listed} listed, {failed} failed, "
+                    f"{count - listed - failed} without a response.")
 
 
 if __name__ == "__main__":
-    create_bulk_items_trading_api()
+    # LISTING_MODE=bulk lists the whole backlog with one upload job instead of AddItems calls
+    if os.getenv('LISTING_MODE', 'trading') == 'bulk':
+        create_items_bulk_exchange()
+    else:
+        create_bulk_items_trading_api()
     logger.info("Going to update the listed items")
     update_listed_items()
 
@@ -17,66 +17,257 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE',
 django.setup()
 
 
-from ebaysdk.trading import Connection as Trading
-from ebaysdk.exception import ConnectionError
+import requests
+from django.db.models import F, Q, Value
+from django.db.models.functions import Abs
 from listings.models import *
 from helpers.generate_token import *
+from helpers.changelog import *
+from helpers.ebay_client import EbayUnavailable, get_ebay_client, was_throttled
+from helpers.concurrency import AdaptiveController, CallStats, TokenBucket
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from helpers.payload import parse_revise_inventory_status_response, revise_inventory_status_xml
+from helpers.job_ledger import RunLedger
+from helpers.listing_errors import write_listing_outcomes
+from helpers.pricing import reprice_pending
+from helpers.pagination import iter_batches
+from helpers.claims import ItemClaimer, claimed_windows
 import logging
+import time
+import xml.etree.ElementTree as ET
 # Configure logging
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Fetch variables
-appid = os.getenv('CLIENT_ID')
-certid = os.getenv('CLIENT_SECRET')
-devid = os.getenv('DEV_ID')
-runame = os.getenv('RUNAME')
+# Name of this job's cursor in the ItemChange log
+CHANGE_LOG_CONSUMER = 'revise_inventory_status'
+
+# Item columns a ReviseInventoryStatus run reads
+UPDATE_FIELDS = ('id', 'sku', 'item_id', 'sell_price', 'stock')
+
+
+def out_of_sync(items):
+    """
+    Narrow items down to those whose sell price or stock differs from the last push.
+
+    REVISE_PRICE_TOLERANCE (a fraction, default 0) leaves price changes within
+    that share of the pushed price unsent; a quantity change is always sent.
+
+    Args:
+        items (QuerySet): Item queryset.
+
+    Returns:
+        QuerySet: The items to revise.
+    """
+    tolerance = Decimal(os.getenv('REVISE_PRICE_TOLERANCE', '0'))
+    return items.annotate(
+        price_drift=Abs(F('sell_price') - F('pushed_price')),
+    ).filter(
+        Q(pushed_price__isnull=True) | Q(pushed_quantity__isnull=True)
+        | ~Q(pushed_quantity=F('stock'))
+        | Q(price_drift__gt=F('pushed_price') * Value(tolerance)))
+
+
+def revise_candidates(high_water=None):
+    """
+    Items a ReviseInventoryStatus run works through.
+
+    Newly listed items and pushed items whose price or stock changed since
+    the last run (per the change log, up to ``high_water``), of those only the
+    ones eBay does not already have the values of. Items without a sell price
+    yet, e.g. created after this run's reprice_pending(), wait for the next
+    run. The two sources are
+    combined as a UNION of primary keys, so each is read through its own
+    index (the listed queue, and the SKUs of the change log) instead of the
+    OR making the database scan the item table.
+
+    Args:
+        high_water (int, optional): Last ItemChange sequence number to consider.
+
+    Returns:
+        QuerySet: Candidate items, in no particular order.
+    """
+    changed_skus = pending_changes(
+        CHANGE_LOG_CONSUMER, up_to=high_water).values('sku')
+    listed = Item.objects.filter(status='listed').values('pk')
+    changed = Item.objects.filter(status='updated', sku__in=changed_skus).values('pk')
+    return out_of_sync(Item.objects.filter(pk__in=listed.union(changed), sell_price__isnull=False))
+
 
 def update_listed_items():
-    # Fetch items with status 'listed'
-    listed_items = list(Item.objects.filter(status='listed'))[:20000]
-    logger.info(f"Found {len(listed_items)} items with status 'listed'.")
+    reprice_pending()
+    claimer = ItemClaimer('revise_inventory_status')
+    ledger = RunLedger(claimer.job, worker=claimer.worker, resume=claimer.stable,
+                       stale_after=claimer.lease)
+    # A resumed run keeps the change-log position it started with, so changes
+    # logged since then for items before its checkpoint stay pending
+    if ledger.run.change_log_position is None:
+        ledger.run.change_log_position = change_log_high_water()
+        ledger.run.save(update_fields=['change_log_position', 'updated_at'])
+    high_water = ledger.run.change_log_position
 
-    if not listed_items:
-        logger.info("No items found to update.")
+    # ReviseInventoryStatus is idempotent: unanswered calls are simply sent again,
+    # their items all come after the checkpoint
+    for job_batch in ledger.unanswered():
+        ledger.reconciled(job_batch, 'resent')
+
+    # Candidates are claimed and streamed in pk order with only the columns
+    # the call needs and the cap applied in SQL
+    in_sync = Item.objects.filter(status='listed').exclude(
+        pk__in=out_of_sync(Item.objects.filter(status='listed')).values('pk'))
+    skipped = in_sync.update(status='updated')
+    if skipped:
+        logger.info(f"{skipped} listed items already have their price and stock on eBay")
+    candidates = revise_candidates(high_water)
+    limit = max(0, 20000 - ledger.items_submitted)
+    windows = claimed_windows(candidates, claimer, window_size=int(os.getenv('UPDATE_WINDOW', '1000')),
+                              limit=limit, fields=UPDATE_FIELDS, after=ledger.checkpoint_pk)
+
+    client = get_ebay_client()
+    rate_limiter = TokenBucket(float(os.getenv('REVISE_RATE', '5')))
+    # Calls of up to 4 items with several in flight, both backed off while eBay struggles
+    controller = AdaptiveController(
+        'ReviseInventoryStatus', max_concurrency=int(os.getenv('REVISE_CONCURRENCY', '4')),
+        max_batch_size=4, latency_target=float(os.getenv('REVISE_LATENCY_TARGET', '5')))
+    stats = CallStats()
+    flush_size = int(os.getenv('UPDATE_WINDOW', '1000'))
+
+    in_flight = {}
+    revised, rejected = [], []
+    unavailable = []
+
+    def flush():
+        # One UPDATE per window of results instead of a save() per item
+        if revised:
+            write_listing_outcomes({item.pk: {'status': 'updated', 'pushed_price': item.sell_price,
+                                              'pushed_quantity': item.stock}
+                                    for item in revised}, touch=False)
+        if rejected:
+            requeue_items(rejected)
+        revised.clear()
+        rejected.clear()
+
+    def collect(done):
+        # Database writes stay on this thread; the pool threads only talk to eBay,
+        # apart from the rare token refresh, which closes its connection again
+        for future in done:
+            chunk, job_batch = in_flight.pop(future)
+            try:
+                response, latency = future.result()
+            except EbayUnavailable as e:
+                unavailable.append(e)
+                rejected.extend(chunk)
+                stats.record(0.0, len(chunk), ok=False)
+                continue
+            except requests.RequestException as e:
+                logger.error(f"Error connecting to eBay API: {e}")
+                rejected.extend(chunk)
+                ledger.answered(job_batch, 'failed', str(e))
+                stats.record(0.0, len(chunk), ok=False)
+                controller.observe(0.0, ok=False)
+                continue
+
+            controller.observe(latency, ok=response.status_code < 500 and response.status_code != 429,
+                               throttled=was_throttled(response))
+            ok_items, failed_items = split_revise_results(chunk, response)
+            revised.extend(ok_items)
+            rejected.extend(failed_items)
+            ledger.answered(job_batch, 'succeeded' if ok_items else 'failed')
+            stats.record(latency, len(chunk), ok=bool(ok_items))
+            if len(revised) + len(rejected) >= flush_size:
+                flush()
+
+    total = 0
+    with ThreadPoolExecutor(max_workers=controller.max_concurrency) as pool:
+        for chunk in iter_batches(windows, lambda: controller.batch_size):
+            if unavailable:
+                break
+            total += len(chunk)
+            # Served from memory, and refreshed ahead of its expiry on long runs
+            access_token = check_access_token()
+            xml_body = revise_inventory_status_xml(access_token, [
+                (item.item_id, item.stock, item.sell_price) for item in chunk])
+
+            while len(in_flight) >= controller.concurrency:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            job_batch = ledger.submitted(chunk, [item.item_id for item in chunk])
+            future = pool.submit(post_revise_inventory_status, client, xml_body, rate_limiter, access_token)
+            in_flight[future] = (chunk, job_batch)
+
+        collect(wait(in_flight).done)
+    flush()
+    # Resending a revision is harmless, so claims are dropped even when stopping early
+    claimer.release()
+
+    if unavailable:
+        # Leave the rest (and the change log) for the next run
+        ledger.finish(completed=False)
+        logger.error(f"Stopping the update run, eBay is unavailable: {unavailable[0]}")
         return
 
-    access_token = check_access_token()
-    # Split the items into chunks of 4
-    for i in range(0, len(listed_items), 4):
-        chunk = listed_items[i:i + 4]
-        inventory_status_payload = {'InventoryStatus': []}
-
-        for item in chunk:
-            inventory_status_payload['InventoryStatus'].append({
-                'ItemID': item.item_id,
-                'Quantity': item.stock,
-                'StartPrice': (item.price * Decimal('1.2')),
-            })
-
-        try:
-            # Initialize eBay Trading API connection
-            api = Trading(appid=appid, certid=certid, devid=devid,
-                          token=access_token, domain=os.getenv('BASE_URL'), config_file=None)
-
-            # Send the request to update the items in bulk
-            response = api.execute(
-                'ReviseInventoryStatus', inventory_status_payload)
-            logger.info(f"API response: {response.reply.Ack}")
-
-            # Check if the update was successful
-            if response.reply.Ack == 'Success' or response.reply.Ack == 'Warning':
-                for item in chunk:
-                    item.status = 'updated'
-                    item.save()
-                logger.info(f"Successfully updated {chunk}")
-            else:
-                logger.error(
-                    f"Failed to update items: {response.reply.Errors}")
-
-        except ConnectionError as e:
-            logger.error(f"Error connecting to eBay API: {e}")
+    if not total:
+        logger.info("No items found to update.")
+    else:
+        logger.info(f"ReviseInventoryStatus run: {stats.summary()}")
+    ledger.finish()
+
+    # Changes beyond the cap have to stay in the log for the next run, and so do
+    # those other workers may still be working through
+    capped = total == limit
+    if not capped and not ledger.other_runs_active(within=claimer.lease):
+        advance_cursor(CHANGE_LOG_CONSUMER, high_water)
+        prune_change_log()
+
+
+def post_revise_inventory_status(client, xml_body, rate_limiter, access_token=None):
+    """
+    Send one ReviseInventoryStatus call, each attempt once the rate limiter allows it. Runs in a pool thread.
+
+    A call rejected for its access token is sent again with a refreshed token.
+
+    Returns:
+        tuple: (requests.Response, latency in seconds).
+    """
+    started = time.monotonic()
+    response = client.trading('ReviseInventoryStatus', xml_body, before_attempt=rate_limiter.acquire,
+                              access_token=access_token)
+    return response, time.monotonic() - started
+
+
+def split_revise_results(chunk, response):
+    """
+    Split the items of one call into revised and rejected ones.
+
+    Returns:
+        tuple: (revised items, rejected items).
+    """
+    try:
+        ack, revised_ids, errors = parse_revise_inventory_status_response(response.text)
+    except ET.ParseError:
+        logger.error(f"Failed to update items: {response.status_code} {response.text}")
+        return [], list(chunk)
+
+    if ack in ('Success', 'Warning') and not revised_ids:
+        # No per-item detail in the answer: the call as a whole went through
+        revised_ids = {item.item_id for item in chunk}
+
+    ok_items = [item for item in chunk if item.item_id in revised_ids]
+    failed_items = [item for item in chunk if item.item_id not in revised_ids]
+    for item in failed_items:
+        item_errors = [text for text, params in errors if item.item_id in params] or \
+            [text for text, params in errors if not params] or [f"Not revised (Ack: {ack})"]
+        logger.error(f"Failed to update {item}: {'; '.join(item_errors)}")
+    if ok_items:
+        logger.info(f"Successfully updated {ok_items}")
+    return ok_items, failed_items
+
+
+def requeue_items(items):
+    """Put items whose push failed back to 'listed' so the next run retries them."""
+    Item.objects.filter(pk__in=[item.pk for item in items],
+                        status='updated').update(status='listed')
 
 if __name__ == "__main__":
     update_listed_items()
\ No newline at end of file
@@ -0,0 +1,184 @@
+"""
+Local stand-in for eBay's Bulk Data Exchange and File Transfer services.
+
+Serves createUploadJob, uploadFile, startUploadJob, getJobStatus and
+downloadFile well enough to run the bulk listing mode end to end:
+
+    python devtools/bulk_exchange_standin.py --port 8099
+    BULK_EXCHANGE_URL=http://127.0.0.1:8099/BulkDataExchangeService \
+    FILE_TRANSFER_URL=http://127.0.0.1:8099/FileTransferService \
+    LISTING_MODE=bulk python cronjobs/listings_cronjob.py
+
+Every AddFixedPriceItem record is listed, except titles over 80 characters
+(RequestError 70) and UUIDs it has seen before (error 488, answered with
+the earlier ItemID like eBay does).
+"""
+import argparse
+import gzip
+import io
+import itertools
+import re
+import threading
+import uuid
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+SERVICES = 'http://www.ebay.com/marketplace/services'
+EBAY = 'urn:ebay:apis:eBLBaseComponents'
+
+
+class StandinState:
+    def __init__(self, polls_until_complete=1) -> None:
+        self.polls_until_complete = polls_until_complete
+        self.jobs = {}
+        self.files = {}
+        self.listed_uuids = {}
+        self.item_ids = itertools.count(110000000000)
+        self.lock = threading.Lock()
+
+
+def process_upload(state, upload):
+    """Build the gzip response file for an uploaded gzip request file."""
+    records = []
+    for _, element in ET.iterparse(io.BytesIO(gzip.decompress(upload)), events=('end',)):
+        if element.tag != f'{{{EBAY}}}AddFixedPriceItemRequest':
+            continue
+        message_id = element.findtext(f'{{{EBAY}}}MessageID', '')
+        item = element.find(f'{{{EBAY}}}Item')
+        title = item.findtext(f'{{{EBAY}}}Title', '')
+        item_uuid = item.findtext(f'{{{EBAY}}}UUID', '')
+        with state.lock:
+            if item_uuid in state.listed_uuids:
+                body = ('<Ack>Failure</Ack><Errors><ShortMessage>Duplicate request</ShortMessage>'
+                        '<LongMessage>Duplicate request, seems this request is already processed.</LongMessage>'
+                        '<ErrorCode>488</ErrorCode><SeverityCode>Error</SeverityCode>'
+                        '<ErrorClassification>RequestError</ErrorClassification></Errors>'
+                        f'<DuplicateInvocationDetails><DuplicateInvocationID>{item_uuid}</DuplicateInvocationID>'
+                        '<Status>Success</Status>'
+                        f'<InvocationTrackingID>{state.listed_uuids[item_uuid]}</InvocationTrackingID>'
+                        '</DuplicateInvocationDetails>')
+            elif len(title) > 80:
+                body = ('<Ack>Failure</Ack><Errors><ShortMessage>Title too long</ShortMessage>'
+                        '<LongMessage>The title may not be more than 80 characters.</LongMessage>'
+                        '<ErrorCode>70</ErrorCode><SeverityCode>Error</SeverityCode>'
+                        '<ErrorClassification>RequestError</ErrorClassification></Errors>')
+            else:
+                item_id = next(state.item_ids)
+                state.listed_uuids[item_uuid] = item_id
+                body = f'<Ack>Success</Ack><ItemID>{item_id}</ItemID>'
+        records.append(f'<AddFixedPriceItemResponse xmlns="{EBAY}">{body}'
+                       f'<CorrelationID>{escape(message_id)}</CorrelationID></AddFixedPriceItemResponse>')
+        element.clear()
+    document = ('<?xml version="1.0" encoding="UTF-8"?><BulkDataExchangeResponses>'
+                + ''.join(records) + '</BulkDataExchangeResponses>')
+    return gzip.compress(document.encode())
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, operation, fields='', ack='Success'):
+            body = (f'<?xml version="1.0" encoding="UTF-8"?><{operation}Response xmlns="{SERVICES}">'
+                    f'<ack>{ack}</ack>{fields}</{operation}Response>').encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/xml')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _error(self, operation, message):
+            self._reply(operation, f'<errorMessage><error><message>{escape(message)}</message>'
+                                   '</error></errorMessage>', ack='Failure')
+
+        def do_POST(self):
+            operation = self.headers.get('X-EBAY-SOA-OPERATION-NAME', '')
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if not self.headers.get('X-EBAY-SOA-SECURITY-TOKEN'):
+                return self._error(operation, 'Missing security token')
+
+            if operation == 'uploadFile':
+                boundary = re.search(r'boundary=([^;]+)', self.headers['Content-Type']).group(1)
+                parts = body.split(b'--' + boundary.encode())
+                request, attachment = parts[1], parts[2]
+                job_id = re.search(rb'<taskReferenceId>(.*?)<', request).group(1).decode()
+                data = attachment.split(b'\r\n\r\n', 1)[1][:-2]
+                with state.lock:
+                    state.jobs[job_id]['upload'] = data
+                return self._reply(operation)
+
+            fields = {child.tag.split('}')[-1]: child.text for child in ET.fromstring(body)}
+            if operation == 'createUploadJob':
+                job_id, file_id = uuid.uuid4().hex[:10], uuid.uuid4().hex[:10]
+                with state.lock:
+                    state.jobs[job_id] = {'status': 'Created', 'polls': 0}
+                return self._reply(operation, f'<jobId>{job_id}</jobId><fileReferenceId>{file_id}</fileReferenceId>')
+
+            job = state.jobs.get(fields.get('jobId') or fields.get('taskReferenceId'))
+            if job is None:
+                return self._error(operation, 'Unknown job')
+            if operation == 'startUploadJob':
+                if 'upload' not in job:
+                    return self._error(operation, 'No file uploaded')
+                job['status'] = 'InProcess'
+                return self._reply(operation)
+            if operation == 'getJobStatus':
+                if job['status'] == 'InProcess':
+                    job['polls'] += 1
+                    if job['polls'] > state.polls_until_complete:
+                        response_id = uuid.uuid4().hex[:10]
+                        state.files[response_id] = process_upload(state, job['upload'])
+                        job.update(status='Completed', response_id=response_id)
+                return self._reply(operation, (
+                    f'<jobProfile><jobId>{fields["jobId"]}</jobId><jobStatus>{job["status"]}</jobStatus>'
+                    f'<percentComplete>{100 if job["status"] == "Completed" else 50}</percentComplete>'
+                    f'<fileReferenceId>{job.get("response_id", "")}</fileReferenceId></jobProfile>'))
+            if operation == 'downloadFile':
+                data = state.files.get(fields.get('fileReferenceId'))
+                if data is None:
+                    return self._error(operation, 'Unknown file')
+                boundary = f'MIMEBoundary_{uuid.uuid4().hex}'
+                payload = (
+                    f'--{boundary}\r\nContent-Type: application/xop+xml; type="text/xml"\r\n'
+                    'Content-ID: <0.response@ebay.com>\r\n\r\n'
+                    f'<downloadFileResponse xmlns="{SERVICES}"><ack>Success</ack></downloadFileResponse>\r\n'
+                    f'--{boundary}\r\nContent-Type: application/octet-stream\r\n'
+                    'Content-ID: <responsefile@ebay.com>\r\n\r\n').encode() + data + \
+                    f'\r\n--{boundary}--\r\n'.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', f'multipart/related; boundary="{boundary}"; type="application/xop+xml"')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                return
+            return self._error(operation, f'Unsupported operation {operation}')
+
+    return Handler
+
+
+def make_server(port=8099, polls_until_complete=1):
+    return ThreadingHTTPServer(('127.0.0.1', port), make_handler(StandinState(polls_until_complete)))
+
+
+def serve(port=8099, polls_until_complete=1):
+    """Start the stand-in on a background thread and return the server."""
+    server = make_server(port, polls_until_complete)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--polls', type=int, default=1,
+                        help='getJobStatus calls answered InProcess before a job completes')
+    args = parser.parse_args()
+    server = make_server(args.port, args.polls)
+    print(f"Bulk exchange stand-in on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
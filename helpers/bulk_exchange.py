@@ -0,0 +1,265 @@
+import gzip
+import logging
+import mmap
+import os
+import re
+import shutil
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+from helpers.ebay_client import get_ebay_client
+from helpers.payload import NAMESPACE, parse_item_result
+
+logger = logging.getLogger(__name__)
+
+SERVICES_NAMESPACE = 'http://www.ebay.com/marketplace/services'
+
+# Job states after which getJobStatus will not change any more
+FINISHED_JOB_STATUSES = {'Completed', 'Failed', 'Aborted'}
+
+_BOUNDARY = re.compile(r'boundary="?([^";]+)"?')
+
+
+class BulkExchangeError(Exception):
+    """A Bulk Data Exchange or File Transfer call failed or the job did not complete."""
+
+
+def write_bulk_file(items, path, payload_builder):
+    """
+    Write items as a gzip-compressed AddFixedPriceItem bulk upload file.
+
+    Records are streamed to disk one by one; MessageID is the item's primary
+    key, so response records map straight back to rows.
+
+    Args:
+        items (iterable): Item instances.
+        path (str): Destination .xml.gz file.
+        payload_builder (AddItemsPayloadBuilder): Renders the records.
+
+    Returns:
+        int: Number of records written.
+    """
+    count = 0
+    with gzip.open(path, 'wt', encoding='utf-8') as upload:
+        upload.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                     '<BulkDataExchangeRequests>'
+                     '<Header><SiteID>100</SiteID><Version>1193</Version></Header>\n')
+        for item in items:
+            try:
+                upload.write(payload_builder.fixed_price_item_xml(item, item.pk))
+            except Exception as e:
+                logger.error(f"Error processing item {item.sku}: {e}")
+                continue
+            upload.write('\n')
+            count += 1
+        upload.write('</BulkDataExchangeRequests>\n')
+    return count
+
+
+def iter_bulk_results(path):
+    """
+    Stream AddFixedPriceItem outcomes out of a gzip-compressed response file.
+
+    Yields:
+        AddItemResult: One per response record, correlation_id being the item pk.
+    """
+    tag = f'{{{NAMESPACE}}}AddFixedPriceItemResponse'
+    with gzip.open(path, 'rb') as responses:
+        for _, element in ET.iterparse(responses, events=('end',)):
+            if element.tag == tag:
+                yield parse_item_result(element)
+                element.clear()
+
+
+def extract_attachment(body_path, content_type, output_path):
+    """
+    Copy the binary attachment out of a multipart/related (XOP) response saved on disk.
+
+    Returns:
+        str: ``output_path``.
+    """
+    match = _BOUNDARY.search(content_type)
+    if not match:
+        raise BulkExchangeError(f"Not a multipart response: {content_type}")
+    delimiter = b'--' + match.group(1).encode()
+
+    with open(body_path, 'rb') as body, \
+            mmap.mmap(body.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        position = data.find(delimiter)
+        while position != -1:
+            headers_end = data.find(b'\r\n\r\n', position)
+            next_delimiter = data.find(delimiter, headers_end)
+            if headers_end == -1 or next_delimiter == -1:
+                break
+            headers = data[position:headers_end].lower()
+            if b'application/octet-stream' in headers or b'attachment' in headers:
+                start, end = headers_end + 4, next_delimiter - 2  # part ends with CRLF
+                with open(output_path, 'wb') as output:
+                    body.seek(start)
+                    remaining = end - start
+                    while remaining > 0:
+                        chunk = body.read(min(remaining, 1024 * 1024))
+                        output.write(chunk)
+                        remaining -= len(chunk)
+                return output_path
+            position = next_delimiter
+    raise BulkExchangeError("No attachment in the multipart response")
+
+
+class BulkExchangeClient:
+    """
+    Runs upload jobs through the Bulk Data Exchange and File Transfer services.
+
+    BULK_EXCHANGE_URL and FILE_TRANSFER_URL override the service endpoints,
+    e.g. to point at devtools/bulk_exchange_standin.py. Calls go through the
+    shared EbayClient, so they get its pooling, retries and circuit breaker.
+
+    ``access_token`` is the token or a callable returning the current one;
+    jobs can run for hours, longer than one token lives.
+    """
+
+    def __init__(self, access_token, client=None) -> None:
+        self.access_token = access_token
+        self.client = client or get_ebay_client()
+        self.bulk_url = os.getenv(
+            'BULK_EXCHANGE_URL', 'https://webservices.ebay.com/BulkDataExchangeService')
+        self.transfer_url = os.getenv(
+            'FILE_TRANSFER_URL', 'https://storage.ebay.com/FileTransferService')
+
+    def _headers(self, service, operation, content_type='text/xml'):
+        return {
+            'Content-Type': content_type,
+            'X-EBAY-SOA-SERVICE-NAME': service,
+            'X-EBAY-SOA-OPERATION-NAME': operation,
+            'X-EBAY-SOA-SECURITY-TOKEN': (
+                self.access_token() if callable(self.access_token) else self.access_token),
+        }
+
+    @staticmethod
+    def _request_xml(operation, fields):
+        body = ''.join(f'<{name}>{escape(str(value))}</{name}>' for name, value in fields)
+        return (f'<?xml version="1.0" encoding="UTF-8"?>'
+                f'<{operation}Request xmlns="{SERVICES_NAMESPACE}">{body}</{operation}Request>')
+
+    @staticmethod
+    def _parse(response, operation):
+        try:
+            root = ET.fromstring(response.content)
+        except ET.ParseError:
+            raise BulkExchangeError(
+                f"{operation} failed: {response.status_code} {response.text[:500]}")
+        ns = {'s': SERVICES_NAMESPACE}
+        ack = root.findtext('s:ack', '', ns)
+        if ack not in ('Success', 'Warning'):
+            messages = [error.findtext('s:message', '', ns)
+                        for error in root.iterfind('s:errorMessage/s:error', ns)]
+            raise BulkExchangeError(f"{operation} failed ({ack}): {'; '.join(messages)}")
+        return root, ns
+
+    def _call(self, url, service, operation, fields):
+        response = self.client.post(url, headers=self._headers(service, operation),
+                                    data=self._request_xml(operation, fields))
+        return self._parse(response, operation)
+
+    def create_upload_job(self, job_type='AddFixedPriceItem'):
+        """
+        Returns:
+            tuple: (job_id, file_reference_id) for the file to upload.
+        """
+        root, ns = self._call(self.bulk_url, 'BulkDataExchangeService', 'createUploadJob',
+                              [('uploadJobType', job_type), ('UUID', uuid.uuid4().hex),
+                               ('fileType', 'XML')])
+        return root.findtext('s:jobId', '', ns), root.findtext('s:fileReferenceId', '', ns)
+
+    def upload_file(self, job_id, file_reference_id, path):
+        """Stream the gzip file at ``path`` to the job as an XOP attachment."""
+        boundary = f'MIMEBoundary_{uuid.uuid4().hex}'
+        request_xml = self._request_xml('uploadFile', [
+            ('taskReferenceId', job_id), ('fileReferenceId', file_reference_id),
+            ('fileFormat', 'gzip')]).replace(
+            '</uploadFileRequest>',
+            f'<fileAttachment><Size>{os.path.getsize(path)}</Size><Data>'
+            '<xop:Include xmlns:xop="http://www.w3.org/2004/08/xop/include" '
+            'href="cid:attachment.bin@ebay.com"/></Data></fileAttachment></uploadFileRequest>')
+
+        # The multipart body is assembled on disk so it can be streamed and re-sent on retry
+        body_path = f'{path}.multipart'
+        with open(body_path, 'wb') as body, open(path, 'rb') as attachment:
+            body.write(
+                f'--{boundary}\r\n'
+                'Content-Type: application/xop+xml; charset=UTF-8; type="text/xml"\r\n'
+                'Content-Transfer-Encoding: binary\r\n'
+                'Content-ID: <0.request@ebay.com>\r\n\r\n'
+                f'{request_xml}\r\n'
+                f'--{boundary}\r\n'
+                'Content-Type: application/octet-stream\r\n'
+                'Content-Transfer-Encoding: binary\r\n'
+                'Content-ID: <attachment.bin@ebay.com>\r\n\r\n'.encode())
+            shutil.copyfileobj(attachment, body)
+            body.write(f'\r\n--{boundary}--\r\n'.encode())
+
+        content_type = (f'multipart/related; boundary={boundary}; type="application/xop+xml"; '
+                        'start="<0.request@ebay.com>"; start-info="text/xml"')
+        try:
+            with open(body_path, 'rb') as body:
+                response = self.client.post(
+                    self.transfer_url, data=body,
+                    headers=self._headers('FileTransferService', 'uploadFile', content_type))
+        finally:
+            os.remove(body_path)
+        self._parse(response, 'uploadFile')
+
+    def start_upload_job(self, job_id):
+        self._call(self.bulk_url, 'BulkDataExchangeService', 'startUploadJob',
+                   [('jobId', job_id)])
+
+    def wait_for_job(self, job_id, poll_interval=30, timeout=6 * 3600):
+        """
+        Poll getJobStatus until the job finishes.
+
+        Returns:
+            str: File reference id of the response file.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            root, ns = self._call(self.bulk_url, 'BulkDataExchangeService', 'getJobStatus',
+                                  [('jobId', job_id)])
+            profile = root.find('s:jobProfile', ns)
+            status = profile.findtext('s:jobStatus', '', ns) if profile is not None else ''
+            logger.info(f"Bulk job {job_id}: {status} "
+                        f"({profile.findtext('s:percentComplete', '0', ns) if profile is not None else 0}%)")
+            if status == 'Completed':
+                return profile.findtext('s:fileReferenceId', '', ns)
+            if status in FINISHED_JOB_STATUSES:
+                raise BulkExchangeError(f"Bulk job {job_id} ended as {status}")
+            if time.monotonic() > deadline:
+                raise BulkExchangeError(f"Bulk job {job_id} still {status} after {timeout}s")
+            time.sleep(poll_interval)
+
+    def download_file(self, job_id, file_reference_id, path):
+        """
+        Stream the response file of a finished job to ``path``.
+
+        Returns:
+            str: ``path``, the gzip-compressed response file.
+        """
+        response = self.client.post(
+            self.transfer_url, stream=True,
+            headers=self._headers('FileTransferService', 'downloadFile'),
+            data=self._request_xml('downloadFile', [
+                ('taskReferenceId', job_id), ('fileReferenceId', file_reference_id)]))
+        content_type = response.headers.get('Content-Type', '')
+        if not content_type.startswith('multipart/'):
+            self._parse(response, 'downloadFile')
+            raise BulkExchangeError(f"downloadFile returned no attachment: {content_type}")
+
+        body_path = f'{path}.multipart'
+        try:
+            with response, open(body_path, 'wb') as body:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    body.write(chunk)
+            return extract_attachment(body_path, content_type, path)
+        finally:
+            os.remove(body_path)
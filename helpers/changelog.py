@@ -0,0 +1,57 @@
+from django.db import transaction
+from django.db.models import Max, Min
+from listings.models import *
+
+
+def change_log_high_water():
+    """Sequence number of the newest ItemChange, 0 when the log is empty."""
+    return ItemChange.objects.aggregate(position=Max('id'))['position'] or 0
+
+
+def get_cursor(consumer):
+    """Return the cursor of ``consumer``, starting new consumers at the current end of the log."""
+    cursor, _ = ChangeLogCursor.objects.get_or_create(
+        consumer=consumer, defaults={'position': change_log_high_water()})
+    return cursor
+
+
+def pending_changes(consumer, up_to=None):
+    """
+    Changes ``consumer`` has not processed yet, oldest first.
+
+    Args:
+        consumer (str): Consumer name.
+        up_to (int, optional): Ignore changes after this sequence number, e.g. a
+            high-water mark taken at the start of a run.
+
+    Returns:
+        QuerySet: ItemChange rows after the consumer's cursor.
+    """
+    changes = ItemChange.objects.filter(id__gt=get_cursor(consumer).position)
+    if up_to is not None:
+        changes = changes.filter(id__lte=up_to)
+    return changes.order_by('id')
+
+
+def advance_cursor(consumer, position):
+    """Move the cursor of ``consumer`` forward to ``position``; it never moves back."""
+    with transaction.atomic():
+        cursor = ChangeLogCursor.objects.select_for_update().get(
+            pk=get_cursor(consumer).pk)
+        if position > cursor.position:
+            cursor.position = position
+            cursor.save(update_fields=['position', 'updated_at'])
+
+
+def prune_change_log():
+    """
+    Delete the changes every consumer has already passed.
+
+    Returns:
+        int: Number of deleted rows.
+    """
+    oldest = ChangeLogCursor.objects.aggregate(position=Min('position'))['position']
+    if oldest is None:
+        return 0
+    deleted, _ = ItemChange.objects.filter(id__lte=oldest).delete()
+    return deleted
@@ -0,0 +1,85 @@
+import logging
+import os
+import socket
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from listings.models import *
+from helpers.pagination import keyset_windows
+
+logger = logging.getLogger(__name__)
+
+
+class ItemClaimer:
+    """
+    Claims of one job of one worker on Item rows, so several processes can work the same queue.
+
+    A worker claims a window of candidates with SELECT ... FOR UPDATE SKIP
+    LOCKED, which makes concurrent workers take disjoint rows, and marks them
+    with ``owner`` (worker and job name) and a lease. Claims of other owners
+    are skipped until they are released or their lease runs out, e.g. because
+    the worker died; every new claim renews the lease of the owner's earlier
+    ones. Claims are scoped to the job, so one job of a worker never renews or
+    releases the claims another job of the same worker still holds.
+
+    WORKER_ID names the worker and must differ between processes running at
+    the same time; a restarted worker with the same WORKER_ID picks its own
+    claims and unfinished runs up again. Without it every process is a worker
+    of its own, named after the host and process id, whose claims are only
+    taken over once their lease runs out. CLAIM_LEASE_SECONDS sets the lease
+    (default 900).
+    """
+
+    def __init__(self, job, worker=None, lease=None) -> None:
+        self.job = job
+        worker = worker or os.getenv('WORKER_ID') or None
+        # Only a configured worker id survives a restart
+        self.stable = worker is not None
+        self.worker = worker or f'{socket.gethostname()}:{os.getpid()}'
+        self.owner = f'{self.worker}:{job}'
+        self.lease = lease or timedelta(seconds=int(os.getenv('CLAIM_LEASE_SECONDS', '900')))
+
+    def claimable(self):
+        """Rows no other owner holds a live claim on."""
+        return (Q(claimed_by__isnull=True) | Q(claimed_by=self.owner)
+                | Q(claim_expires_at__lt=timezone.now()))
+
+    def claim(self, queryset, size):
+        """
+        Claim up to ``size`` rows of ``queryset``, in its order.
+
+        Returns:
+            list: The claimed model instances.
+        """
+        with transaction.atomic():
+            rows = list(queryset.filter(self.claimable())
+                        .select_for_update(skip_locked=True)[:size])
+            Item.objects.filter(Q(pk__in=[row.pk for row in rows]) | Q(claimed_by=self.owner)).update(
+                claimed_by=self.owner, claim_expires_at=timezone.now() + self.lease)
+        return rows
+
+    def release(self):
+        """
+        Drop every claim of this job of the worker.
+
+        Returns:
+            int: Number of released rows.
+        """
+        return Item.objects.filter(claimed_by=self.owner).update(
+            claimed_by=None, claim_expires_at=None)
+
+
+def claimed_windows(queryset, claimer, window_size, limit=None, fields=None, after=None):
+    """
+    Like keyset_windows, but each window is claimed by ``claimer`` first.
+
+    Rows claimed by other workers are left out, so several workers iterating
+    the same candidates each get their own share of them.
+
+    Yields:
+        list: Claimed model instances of one window, in primary-key order.
+    """
+    return keyset_windows(queryset, window_size, limit=limit, fields=fields, after=after,
+                          fetch=claimer.claim)
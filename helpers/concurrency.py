@@ -0,0 +1,137 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting calls to ``rate`` per second with bursts up to ``capacity``.
+
+    A rate of 0 or less disables limiting.
+    """
+
+    def __init__(self, rate, capacity=None) -> None:
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available and take it."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity,
+                                   self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class CallStats:
+    """Collects per-call latencies and outcomes for the end-of-run throughput report."""
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.latencies = []
+        self.items = 0
+        self.failures = 0
+
+    def record(self, latency, items, ok=True):
+        self.latencies.append(latency)
+        self.items += items
+        if not ok:
+            self.failures += 1
+
+    @staticmethod
+    def percentile(values, fraction):
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        calls = len(self.latencies)
+        return (f"{calls} calls ({self.failures} failed), {self.items} items in {elapsed:.1f}s: "
+                f"{calls / elapsed if elapsed else 0:.2f} calls/s, "
+                f"{self.items / elapsed if elapsed else 0:.1f} items/s, "
+                f"latency p50 {self.percentile(self.latencies, 0.5):.2f}s "
+                f"p95 {self.percentile(self.latencies, 0.95):.2f}s "
+                f"max {max(self.latencies, default=0):.2f}s")
+
+
+class AdaptiveController:
+    """
+    Additive-increase/multiplicative-decrease control of in-flight calls and batch size.
+
+    Every ``window`` calls the controller looks at the latency percentiles and
+    the error and throttle rates of the last ``window`` calls. A healthy window
+    first grows the batch size, then the number of in-flight calls, by one.
+    Throttling, errors or a p95 latency above ``latency_target`` halve the
+    number of in-flight calls; once that is at its minimum, slow windows
+    halve the batch size instead. Every change is logged with the numbers
+    that caused it. Not thread-safe: feed it from the thread collecting results.
+    """
+
+    def __init__(self, name, max_concurrency, max_batch_size, latency_target,
+                 window=10, max_error_rate=0.1) -> None:
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_batch_size = max(1, max_batch_size)
+        self.latency_target = latency_target
+        self.window = window
+        self.max_error_rate = max_error_rate
+        self.concurrency = max(1, self.max_concurrency // 2)
+        self.batch_size = self.max_batch_size
+        self._calls = deque(maxlen=window)
+        self._since_decision = 0
+
+    def observe(self, latency, ok=True, throttled=False):
+        """Record one finished call and adjust the limits once per window."""
+        self._calls.append((latency, ok, throttled))
+        self._since_decision += 1
+        if self._since_decision >= self.window:
+            self._since_decision = 0
+            self._decide()
+
+    def _decide(self):
+        latencies = [latency for latency, ok, _ in self._calls if ok]
+        calls = len(self._calls)
+        errors = sum(1 for _, ok, _ in self._calls if not ok)
+        throttled = sum(1 for _, _, was_throttled in self._calls if was_throttled)
+        p50 = CallStats.percentile(latencies, 0.5)
+        p95 = CallStats.percentile(latencies, 0.95)
+
+        concurrency, batch_size = self.concurrency, self.batch_size
+        if throttled or errors / calls > self.max_error_rate:
+            reason = 'throttled' if throttled else 'errors'
+            self.concurrency = max(1, self.concurrency // 2)
+        elif p95 > self.latency_target:
+            reason = 'slow'
+            if self.concurrency > 1:
+                self.concurrency = max(1, self.concurrency // 2)
+            else:
+                self.batch_size = max(1, self.batch_size // 2)
+        else:
+            reason = 'healthy'
+            if self.batch_size < self.max_batch_size:
+                self.batch_size += 1
+            elif self.concurrency < self.max_concurrency:
+                self.concurrency += 1
+
+        if (concurrency, batch_size) != (self.concurrency, self.batch_size):
+            logger.info(
+                f"{self.name}: {reason} (p50 {p50:.2f}s, p95 {p95:.2f}s, "
+                f"{errors}/{calls} errors, {throttled}/{calls} throttled): "
+                f"in-flight {concurrency} -> {self.concurrency}, "
+                f"batch size {batch_size} -> {self.batch_size}")
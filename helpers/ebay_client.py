@@ -0,0 +1,257 @@
+import logging
+import os
+import random
+import re
+import threading
+import time
+from xml.sax.saxutils import escape
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = {'e': 'urn:ebay:apis:eBLBaseComponents'}
+
+# HTTP statuses worth another attempt: throttling and server-side failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Trading API errors returned with HTTP 200 that mean "slow down", not "bad request"
+THROTTLE_ERROR_CODES = {'518', '21919144'}
+# Trading API errors for an auth token that expired or was revoked: refresh it and send again
+TOKEN_ERROR_CODES = {'931', '932', '21916984'}
+_ERROR_CODE = re.compile(r'<ErrorCode>(\d+)</ErrorCode>')
+
+
+class EbayUnavailable(Exception):
+    """Raised instead of calling eBay while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after ``threshold`` consecutive failed calls and rejects calls for ``cooldown`` seconds.
+
+    After the cooldown one trial call is let through (half-open); its success
+    closes the breaker, its failure opens it for another cooldown.
+    """
+
+    def __init__(self, threshold=5, cooldown=60) -> None:
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Let a call through or reject it while the breaker is open.
+
+        Returns:
+            bool: True if the call is the half-open trial.
+
+        Raises:
+            EbayUnavailable: The breaker is open, or another call is the trial.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if self._trial_running or time.monotonic() - self._opened_at < self.cooldown:
+                raise EbayUnavailable(
+                    f"eBay circuit open after {self._failures} consecutive failures")
+            self._trial_running = True
+            return True
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def record(self, ok):
+        with self._lock:
+            self._trial_running = False
+            if ok:
+                self._failures = 0
+                self._opened_at = None
+                return
+            self._failures += 1
+            if self._failures >= self.threshold:
+                if self._opened_at is None:
+                    logger.error(f"Opening eBay circuit after {self._failures} consecutive failures")
+                self._opened_at = time.monotonic()
+
+
+class EbayClient:
+    """
+    One keep-alive HTTP session for every eBay call made by the cronjobs and token helpers.
+
+    Calls time out, are retried with exponential backoff and jitter on
+    connection errors, 5xx, HTTP 429 and Trading API throttling errors, and
+    go through a circuit breaker so a run stops cleanly while eBay is down.
+    """
+
+    def __init__(self, base_url=None, timeout=None, max_retries=None, backoff=1.0,
+                 max_backoff=30.0, pool_size=10, breaker=None) -> None:
+        self.base_url = base_url or os.getenv('BASE_URL')
+        self.timeout = timeout or (5, float(os.getenv('EBAY_TIMEOUT', '60')))
+        self.max_retries = int(os.getenv('EBAY_MAX_RETRIES', '4')) if max_retries is None else max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker(
+            threshold=int(os.getenv('EBAY_BREAKER_THRESHOLD', '5')),
+            cooldown=float(os.getenv('EBAY_BREAKER_COOLDOWN', '60')))
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @property
+    def trading_url(self):
+        return f"https://{self.base_url}/ws/api.dll"
+
+    def post(self, url, headers=None, data=None, before_attempt=None, stream=False):
+        """
+        POST with retries and the circuit breaker.
+
+        Args:
+            url (str): Full request URL.
+            headers (dict, optional): Request headers.
+            data (str|dict|file, optional): Request body; files are rewound for every attempt.
+            before_attempt (callable, optional): Called before every attempt, e.g. a rate limiter.
+            stream (bool): Leave the body of the response unread, see requests' stream.
+
+        Returns:
+            requests.Response: The last response; retryable failures are returned once retries run out.
+                Its ``retry_reasons`` attribute lists the retryable failures of its attempts.
+
+        Raises:
+            EbayUnavailable: The circuit breaker is open.
+            requests.RequestException: The last attempt failed to connect or timed out.
+        """
+        trial = self.breaker.before_call()
+        attempt = 0
+        retry_reasons = []
+        while True:
+            if before_attempt:
+                before_attempt()
+            if hasattr(data, 'seek'):
+                data.seek(0)
+            try:
+                response = self.session.post(url, headers=headers, data=data,
+                                             timeout=self.timeout, stream=stream)
+                retry_reason = self._retry_reason(response, stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                response = None
+                retry_reason = str(e)
+                if attempt >= self.max_retries:
+                    self.breaker.record(ok=False)
+                    raise
+            except Exception:
+                self.breaker.record(ok=False)
+                raise
+
+            if retry_reason is not None:
+                retry_reasons.append(retry_reason)
+            if response is not None:
+                response.retry_reasons = retry_reasons
+            if retry_reason is None:
+                self.breaker.record(ok=True)
+                return response
+            if attempt >= self.max_retries:
+                self.breaker.record(ok=False)
+                return response
+            if not trial and self.breaker.is_open:
+                # Another call already gave up on eBay, stop retrying this one too.
+                # The trial itself keeps retrying: the breaker is open while it runs.
+                self.breaker.record(ok=False)
+                raise EbayUnavailable(f"eBay circuit opened while retrying ({retry_reason})")
+
+            if stream and response is not None:
+                response.close()
+            delay = self._delay(attempt, response)
+            logger.warning(f"eBay call to {url} failed ({retry_reason}), "
+                           f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+    def trading(self, call_name, body, site_id='100', compatibility_level='1193',
+                headers=None, before_attempt=None, access_token=None):
+        """
+        POST an XML body to the Trading API as ``call_name``.
+
+        With ``access_token``, the token the body carries, a call rejected
+        for an expired or invalid token is sent once more with a refreshed one.
+        """
+        trading_headers = {
+            "Content-Type": "text/xml",
+            "X-EBAY-API-SITEID": site_id,
+            "X-EBAY-API-CALL-NAME": call_name,
+            "X-EBAY-API-COMPATIBILITY-LEVEL": compatibility_level,
+        }
+        trading_headers.update(headers or {})
+        response = self.post(self.trading_url, headers=trading_headers, data=body,
+                             before_attempt=before_attempt)
+        if access_token and token_rejected(response):
+            new_token = _refresh_access_token(access_token)
+            if new_token and new_token != access_token:
+                logger.warning(f"{call_name} rejected the access token, sending it again with a refreshed one")
+                body = body.replace(escape(access_token), escape(new_token))
+                response = self.post(self.trading_url, headers=trading_headers, data=body,
+                                     before_attempt=before_attempt)
+        return response
+
+    @staticmethod
+    def _retry_reason(response, stream=False):
+        if response.status_code in RETRY_STATUSES:
+            return f"HTTP {response.status_code}"
+        # A streamed body is left for the caller, only the status is checked
+        if not stream and response.status_code == 200 and '<ErrorCode>' in response.text:
+            throttled = THROTTLE_ERROR_CODES.intersection(_ERROR_CODE.findall(response.text))
+            if throttled:
+                return f"throttled, error {', '.join(sorted(throttled))}"
+        return None
+
+    def _delay(self, attempt, response):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(self.max_backoff, float(retry_after))
+        # Exponential backoff with full jitter so concurrent workers do not retry in lockstep
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+def was_throttled(response):
+    """True when the call, or one of its retried attempts, was throttled by eBay."""
+    return any(reason == 'HTTP 429' or reason.startswith('throttled')
+               for reason in getattr(response, 'retry_reasons', []))
+
+
+def token_rejected(response):
+    """True when a Trading API call failed because of its auth token."""
+    return (response.status_code == 200 and '<ErrorCode>' in response.text
+            and bool(TOKEN_ERROR_CODES.intersection(_ERROR_CODE.findall(response.text))))
+
+
+def _refresh_access_token(stale_token):
+    # Imported here: the token helpers need Django and import this module themselves
+    from django.db import connections
+    from helpers.generate_token import refresh_access_token
+    try:
+        return refresh_access_token(stale_token)
+    finally:
+        # A refresh is the only database access of a job's pool threads; do not leave
+        # them holding a connection for the rest of the run
+        if threading.current_thread() is not threading.main_thread():
+            connections.close_all()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_ebay_client():
+    """The process-wide EbayClient, created on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = EbayClient(pool_size=int(os.getenv('EBAY_POOL_SIZE', '10')))
+        return _client
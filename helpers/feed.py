@@ -0,0 +1,157 @@
+import numpy as np
+import pandas as pd
+
+# Item field -> supplier feed column
+STRING_COLUMNS = {
+    'brand': 'BRAND',
+    'part_name': 'PART_NAME',
+    'partslink': 'PARTSLINK',
+    'oem_number': 'OEM_NUMBER',
+    'category_id': 'CATEGORY_ID',
+    'pdescription': 'PDESCRIPTION',
+}
+PRICE_COLUMNS = {
+    'price': 'B2B_PRICE15',
+    'shipping_revenue18': 'SHIPPINGREVENUE18',
+    'handling_revenue18': 'HANDLINGREVENUE18',
+}
+STOCK_COLUMNS = {
+    'stock_va': 'STOCK_VA',
+    'stock_il': 'STOCK_IL',
+    'stock_las1': 'STOCK_LAS1',
+    'stock_peru': 'STOCK_PERU',
+    'stock_gpt': 'STOCK_GPT',
+    'stock_jax': 'STOCK_JAX',
+    'stock': 'STOCK_TOTAL',
+}
+
+# Columns whose change means the SKU has to be written again
+FINGERPRINT_FIELDS = ('price',) + tuple(STOCK_COLUMNS)
+
+ITEM_FIELDS = ('sku',) + tuple(STRING_COLUMNS) + \
+    tuple(PRICE_COLUMNS) + tuple(STOCK_COLUMNS) + ('feed_fingerprint',)
+
+
+def _strip_strings(series):
+    """Strip the string values of an object column, leaving other values untouched."""
+    try:
+        stripped = series.str.strip()
+    except AttributeError:
+        # Object column without any string values
+        return series
+    return stripped.where(stripped.notna(), series)
+
+
+def preprocess_dataframe(df):
+    """
+    Clean a raw feed DataFrame: trim names and values and drop unusable rows.
+
+    Args:
+        df (pd.DataFrame): Raw rows as read from the supplier file.
+
+    Returns:
+        pd.DataFrame: Rows with a non-zero integer SKU and a non-empty PART_NAME.
+    """
+    # Strip any leading/trailing spaces from column names
+    df = df.rename(columns=lambda column: str(column).strip())
+
+    # Drop rows with NaN values in essential columns
+    essential_columns = ['SKU', 'PART_NAME']
+    df = df.dropna(subset=essential_columns)
+
+    # Drop duplicate rows based on all columns
+    df = df.drop_duplicates()
+
+    # Convert numeric columns that may have .0 suffix to integers
+    numeric_columns = ['SKU', 'STOCK_TOTAL']
+    for column in numeric_columns:
+        df[column] = pd.to_numeric(
+            df[column], errors='coerce').fillna(0).astype(int)
+
+    # Remove leading and trailing spaces from all string columns
+    for column in df.columns[df.dtypes == object]:
+        df[column] = _strip_strings(df[column])
+
+    # Drop rows with default values in essential columns
+    part_name = df['PART_NAME'].astype(str)
+    df = df[(df['SKU'] != 0) & (part_name != '')]
+
+    return df
+
+
+def _string_array(series):
+    """Column-wise str coercion; missing values become '' and integral floats lose their '.0'."""
+    if pd.api.types.is_float_dtype(series) and \
+            np.array_equal(series.dropna(), series.dropna().round()):
+        series = series.astype('Int64')
+    return series.astype(object).where(series.notna(), '').astype(str).to_numpy()
+
+
+def _price_array(series):
+    """Column-wise price coercion to exact two-decimal strings, safe to feed a DecimalField."""
+    cents = np.rint(pd.to_numeric(series, errors='coerce').fillna(0)
+                    .to_numpy(dtype=np.float64) * 100).astype(np.int64)
+    sign = np.where(cents < 0, '-', '')
+    cents = np.abs(cents)
+    units = (cents // 100).astype(str)
+    fraction = np.char.zfill((cents % 100).astype(str), 2)
+    return np.char.add(np.char.add(np.char.add(sign, units), '.'), fraction).astype(object)
+
+
+def _stock_array(series):
+    """Column-wise stock coercion, truncating like int(float(x)) and defaulting to 0."""
+    return pd.to_numeric(series, errors='coerce').fillna(0) \
+        .to_numpy(dtype=np.float64).astype(np.int64)
+
+
+def to_item_columns(df):
+    """
+    Convert a preprocessed feed DataFrame into Item field arrays.
+
+    Every column is coerced as a whole array instead of per cell. When a SKU
+    occurs more than once the last occurrence wins.
+
+    Args:
+        df (pd.DataFrame): Output of preprocess_dataframe.
+
+    Returns:
+        dict: Item field name -> numpy array, all of the same length, keyed by ITEM_FIELDS.
+    """
+    df = df.drop_duplicates(subset='SKU', keep='last')
+    length = len(df)
+
+    def column(name):
+        if name in df.columns:
+            return df[name]
+        return pd.Series([None] * length, index=df.index, dtype=object)
+
+    columns = {'sku': df['SKU'].astype(np.int64).astype(str).to_numpy(dtype=object)}
+    for field, name in STRING_COLUMNS.items():
+        columns[field] = _string_array(column(name))
+    for field, name in PRICE_COLUMNS.items():
+        columns[field] = _price_array(column(name))
+    for field, name in STOCK_COLUMNS.items():
+        columns[field] = _stock_array(column(name))
+    columns['feed_fingerprint'] = fingerprint_columns(columns)
+    return columns
+
+
+def fingerprint_columns(columns):
+    """
+    Hash the FINGERPRINT_FIELDS of every row into a signed 64-bit integer.
+
+    The hash is stable across runs, so it can be stored with the item and
+    compared against the next feed to find rows that actually changed.
+    """
+    frame = pd.DataFrame({field: columns[field] for field in FINGERPRINT_FIELDS})
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy().view(np.int64)
+
+
+def take_rows(columns, mask):
+    """Select the rows of an item column dict with a boolean mask or index array."""
+    return {field: values[mask] for field, values in columns.items()}
+
+
+def iter_item_rows(columns, fields=ITEM_FIELDS):
+    """Yield one tuple of plain Python values per row from an item column dict, in ``fields`` order."""
+    return zip(*(columns[field].tolist() for field in fields))
@@ -1,9 +1,16 @@
 from urllib.parse import unquote, urlparse, parse_qs
+from datetime import timedelta
 from dotenv import load_dotenv
 import requests
 import base64
 import os
+import threading
+import xml.etree.ElementTree as ET
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from listings.models import *
+from helpers.ebay_client import NAMESPACE, get_ebay_client
 
 load_dotenv()
 
@@ -13,6 +20,15 @@ dev_id = os.getenv('DEV_ID')
 redirect_uri = os.getenv('RUNAME')
 refresh_token = os.getenv('REFRESH_TOKEN')
 
+# Refresh this long before the access token expires
+TOKEN_REFRESH_MARGIN = timedelta(seconds=int(os.getenv('TOKEN_REFRESH_MARGIN', '600')))
+# pg_advisory_xact_lock key held while refreshing the access token
+TOKEN_LOCK_ID = 7312001
+
+# Token of this process, so most calls need neither eBay nor the database
+_token_cache = {'access_token': None, 'expires_at': None}
+_token_lock = threading.Lock()
+
 
 def generate_access_token_from_refresh_token():
     """
@@ -24,7 +40,7 @@ def generate_access_token_from_refresh_token():
         redirect_uri (str): Redirect URI used for the authorization request.
 
     Returns:
-        str: Access token if the request is successful, otherwise None.
+        tuple: (access token, lifetime in seconds) if the request is successful, otherwise None.
     """
     encoded_credentials = base64.b64encode(
         f'{client_id}:{client_secret}'.encode()).decode()
@@ -41,7 +57,7 @@ def generate_access_token_from_refresh_token():
     }
 
     try:
-        response = requests.post(token_url, headers=headers, data=data)
+        response = get_ebay_client().post(token_url, headers=headers, data=data)
         response.raise_for_status()  # Raise HTTPError for bad responses
 
         # Parse JSON response
@@ -54,7 +70,7 @@ def generate_access_token_from_refresh_token():
         if not access_token:
             raise ValueError("access_token not found in response.")
 
-        return access_token
+        return access_token, int(response_data.get('expires_in', 7200))
 
     except requests.RequestException as e:
         print(f"HTTP Request failed: {e}")
@@ -66,17 +82,18 @@ def generate_access_token_from_refresh_token():
     return None
 
 
-def check_access_token():
-    access_token = APIToken.objects.last().access_token
+def get_token_expiry(access_token):
+    """
+    Ask eBay when an access token expires (GetTokenStatus).
+
+    Returns:
+        datetime: Expiry of an active token, None if the token is not active.
+    """
     # Set up headers for the request
     headers = {
-        "Content-Type": "text/xml",
-        "X-EBAY-API-SITEID": "0",  # Site ID for the US
-        "X-EBAY-API-CALL-NAME": "GetTokenStatus",
         "X-EBAY-API-APP-NAME": client_id,
         "X-EBAY-API-DEV-NAME": dev_id,
         "X-EBAY-API-CERT-NAME": client_secret,
-        "X-EBAY-API-COMPATIBILITY-LEVEL": "967"  # eBay API version
     }
 
     # Set up the body for the request
@@ -90,30 +107,117 @@ def check_access_token():
         </GetTokenStatusRequest>
         """.format(access_token)
 
-    # eBay Trading API endpoint
-    url = f"https://{os.getenv('BASE_URL')}/ws/api.dll"
+    # Send the request; site 0 is the US, 967 the API version
+    response = get_ebay_client().trading(
+        'GetTokenStatus', body, site_id='0', compatibility_level='967', headers=headers)
     try:
-        # Send the request
-        response = requests.post(url, headers=headers, data=body)
-        text = response.text
-        if '<Ack>Success</Ack>' in text:
-            return access_token
+        root = ET.fromstring(response.text)
+    except ET.ParseError:
+        return None
+    if root.findtext('e:Ack', '', NAMESPACE) != 'Success' or \
+            root.findtext('e:TokenStatus/e:Status', 'Active', NAMESPACE) != 'Active':
+        return None
+    expires_at = parse_datetime(root.findtext('e:TokenStatus/e:ExpirationTime', '', NAMESPACE))
+    # A valid token without a reported expiry is trusted for one more default lifetime
+    return expires_at or timezone.now() + timedelta(seconds=7200)
+
+
+def _is_fresh(expires_at):
+    return expires_at is not None and expires_at - TOKEN_REFRESH_MARGIN > timezone.now()
 
-        access_token = generate_access_token_from_refresh_token()
-        if not access_token:
-            raise ValueError("access_token not found in response.")
 
-        token = APIToken.objects.last()
-        token.access_token = access_token
+def _cache_token(access_token, expires_at):
+    _token_cache['access_token'] = access_token
+    _token_cache['expires_at'] = expires_at
+    return access_token
+
+
+def _refresh_lock():
+    """Serialize token refreshes of all processes until the end of the transaction."""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [TOKEN_LOCK_ID])
+
+
+def _load_or_refresh(stale_token=None):
+    """
+    Serve the stored token while it is fresh, otherwise refresh it under the lock.
+
+    Called with _token_lock held. ``stale_token`` is a token eBay rejected,
+    which is replaced even if its stored expiry says it is still valid.
+    """
+    token = APIToken.objects.last()
+    if token.access_token_expires_at is None and stale_token is None:
+        # Stored before expiries were tracked: ask eBay once and remember the answer
+        token.access_token_expires_at = get_token_expiry(token.access_token)
+        if token.access_token_expires_at is not None:
+            token.save(update_fields=['access_token_expires_at', 'updated_at'])
+    if token.access_token != stale_token and _is_fresh(token.access_token_expires_at):
+        return _cache_token(token.access_token, token.access_token_expires_at)
+
+    with transaction.atomic():
+        _refresh_lock()
+        token = APIToken.objects.select_for_update().last()
+        # Another process may have refreshed it while this one waited for the lock
+        if token.access_token != stale_token and _is_fresh(token.access_token_expires_at):
+            return _cache_token(token.access_token, token.access_token_expires_at)
+
+        refreshed = generate_access_token_from_refresh_token()
+        if not refreshed:
+            raise ValueError("access_token not found in response.")
+        token.access_token, expires_in = refreshed
+        token.access_token_expires_at = timezone.now() + timedelta(seconds=expires_in)
         token.save()
-        print(f"access_token updated")
-        return access_token
-    except requests.RequestException as e:
-        print(f"HTTP Request failed: {e}")
-    except ValueError as e:
-        print(f"Value error: {e}")
-    except Exception as e:
-        print(f"An error occurred: {e}")
+    print(f"access_token updated")
+    return _cache_token(token.access_token, token.access_token_expires_at)
+
+
+def check_access_token():
+    """
+    The current access token, refreshed ahead of its expiry.
+
+    The token is served from memory and from APIToken while it is valid for
+    more than TOKEN_REFRESH_MARGIN seconds; only then is it refreshed, by one
+    process at a time. Cheap enough to call before every API call.
+
+    Returns:
+        str: Access token, None if no valid token could be obtained.
+    """
+    with _token_lock:
+        if _is_fresh(_token_cache['expires_at']):
+            return _token_cache['access_token']
+        try:
+            return _load_or_refresh()
+        except requests.RequestException as e:
+            print(f"HTTP Request failed: {e}")
+        except ValueError as e:
+            print(f"Value error: {e}")
+        except Exception as e:
+            print(f"An error occurred: {e}")
+
+    return None
+
+
+def refresh_access_token(stale_token):
+    """
+    Replace an access token eBay rejected before its expiry.
+
+    Concurrent callers holding the same rejected token share one refresh.
+
+    Returns:
+        str: The new access token, None if it could not be refreshed.
+    """
+    with _token_lock:
+        if _token_cache['access_token'] != stale_token and _is_fresh(_token_cache['expires_at']):
+            return _token_cache['access_token']
+        try:
+            return _load_or_refresh(stale_token)
+        except requests.RequestException as e:
+            print(f"HTTP Request failed: {e}")
+        except ValueError as e:
+            print(f"Value error: {e}")
+        except Exception as e:
+            print(f"An error occurred: {e}")
 
     return None
 
@@ -176,7 +280,7 @@ def get_user_access_and_refresh_token(encoded_credentials, code, redirect_uri):
     }
 
     try:
-        response = requests.post(token_url, headers=headers, data=data)
+        response = get_ebay_client().post(token_url, headers=headers, data=data)
         response.raise_for_status()  # Raise HTTPError for bad responses
 
         # Parse JSON response
@@ -0,0 +1,373 @@
+import csv
+import io
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from django.db import connection, transaction
+from listings.models import *
+from helpers.feed import *
+
+logger = logging.getLogger(__name__)
+
+# Item fields rewritten for a SKU whose fingerprint changed
+UPDATE_FIELDS = ['price', *STOCK_COLUMNS, 'feed_fingerprint']
+
+# Log at most this many disappeared SKUs by name
+DISAPPEARED_LOG_LIMIT = 50
+
+# Share of the in-stock SKUs that may disappear in one run before zeroing is refused
+DEFAULT_MAX_DISAPPEARED_SHARE = '0.1'
+
+
+class OrmItemWriter:
+    """Writes item columns with bulk_create/bulk_update; works on every database backend."""
+
+    def __init__(self, batch_size=1000) -> None:
+        self.batch_size = batch_size
+
+    def write(self, columns):
+        """
+        Insert new SKUs and rewrite the feed columns of existing ones.
+
+        Args:
+            columns (dict): Item field arrays for new or changed SKUs only, see FeedIngest.
+
+        Returns:
+            tuple: (created, updated) row counts.
+        """
+        existing = pd.DataFrame.from_records(
+            Item.objects.filter(sku__in=columns['sku'].tolist())
+            .values_list('sku', 'id', 'price', 'stock'),
+            columns=['sku', 'id', 'price', 'stock'])
+
+        # Align the existing rows with the feed rows and compare whole columns at once
+        existing = existing.set_index('sku').reindex(columns['sku'])
+        is_new = existing['id'].isna().to_numpy()
+        old_price = existing['price'].map(
+            lambda value: f"{value:.2f}", na_action='ignore').to_numpy()
+        price_or_stock_changed = (old_price != columns['price']) | \
+            (existing['stock'].to_numpy() != columns['stock'])
+
+        items_to_create = [Item(**dict(zip(ITEM_FIELDS, row)))
+                           for row in iter_item_rows(take_rows(columns, is_new))]
+
+        updates = take_rows(columns, ~is_new)
+        updated = existing[~is_new]
+        # Only price and stock are rewritten, neither of which fixes a rejected listing,
+        # so the error state of failed items is left alone (see Item.LISTING_DATA_FIELDS)
+        items_to_update = [
+            Item(id=int(pk), **dict(zip(UPDATE_FIELDS, row)))
+            for pk, row in zip(updated['id'], iter_item_rows(updates, UPDATE_FIELDS))]
+        # Change log entries, aligned with items_to_update; None where only warehouse stock moved
+        changes = [
+            ItemChange(sku=sku, old_price=old_price, new_price=new_price,
+                       old_stock=int(old_stock), new_stock=new_stock)
+            if changed else None
+            for sku, old_price, new_price, old_stock, new_stock, changed in zip(
+                updated.index, updated['price'], updates['price'].tolist(),
+                updated['stock'], updates['stock'].tolist(),
+                price_or_stock_changed[~is_new])]
+
+        for start in range(0, len(items_to_create), self.batch_size):
+            with transaction.atomic():
+                Item.objects.bulk_create(
+                    items_to_create[start:start + self.batch_size], ignore_conflicts=True)
+
+        for start in range(0, len(items_to_update), self.batch_size):
+            end = start + self.batch_size
+            with transaction.atomic():
+                Item.objects.bulk_update(
+                    items_to_update[start:end], UPDATE_FIELDS)
+                ItemChange.objects.bulk_create(
+                    [change for change in changes[start:end] if change is not None])
+
+        return len(items_to_create), len(items_to_update)
+
+
+class PostgresCopyItemWriter:
+    """
+    Writes item columns with COPY into a temp staging table and one set-based merge.
+
+    The merge inserts new SKUs and, for existing ones, only touches rows whose
+    fingerprint differs. Price/stock changes are appended to the ItemChange
+    log by the same statement.
+    """
+
+    staging_table = 'listings_item_staging'
+
+    def __init__(self, batch_size=None) -> None:
+        # COPY writes a whole chunk per statement, batch_size is accepted for interface parity
+        self.batch_size = batch_size
+
+    def _create_staging_table(self, cursor):
+        cursor.execute(f"""
+            CREATE TEMP TABLE IF NOT EXISTS {self.staging_table} (
+                sku varchar(255) PRIMARY KEY,
+                brand varchar(255),
+                part_name varchar(255),
+                partslink varchar(255),
+                oem_number varchar(255),
+                category_id varchar(255),
+                pdescription text,
+                price numeric(10, 2),
+                shipping_revenue18 numeric(10, 2),
+                handling_revenue18 numeric(10, 2),
+                stock_va integer,
+                stock_il integer,
+                stock_las1 integer,
+                stock_peru integer,
+                stock_gpt integer,
+                stock_jax integer,
+                stock integer,
+                feed_fingerprint bigint
+            ) ON COMMIT DELETE ROWS
+        """)
+
+    def _merge_sql(self):
+        table = Item._meta.db_table
+        change_table = ItemChange._meta.db_table
+        fields = ', '.join(ITEM_FIELDS)
+        # Like OrmItemWriter, existing rows only get price and stock and keep their error state
+        assignments = ',\n                    '.join(
+            f"{field} = EXCLUDED.{field}" for field in UPDATE_FIELDS)
+        # Every sub-statement sees the same snapshot, so "old" holds the pre-merge values
+        return f"""
+            WITH old AS (
+                SELECT item.sku, item.price, item.stock
+                FROM {table} item
+                JOIN {self.staging_table} staged ON staged.sku = item.sku
+            ), merged AS (
+                INSERT INTO {table} ({fields}, status, error_attempts, created_at, updated_at)
+                SELECT {fields}, 'not listed', 0, now(), now()
+                FROM {self.staging_table}
+                ON CONFLICT (sku) DO UPDATE SET
+                    {assignments}
+                WHERE {table}.feed_fingerprint IS DISTINCT FROM EXCLUDED.feed_fingerprint
+                RETURNING sku, price, stock, (xmax = 0) AS inserted
+            ), logged AS (
+                INSERT INTO {change_table} (sku, old_price, new_price, old_stock, new_stock, created_at)
+                SELECT merged.sku, old.price, merged.price, old.stock, merged.stock, now()
+                FROM merged
+                JOIN old ON old.sku = merged.sku
+                WHERE NOT merged.inserted
+                  AND (old.price IS DISTINCT FROM merged.price
+                       OR old.stock IS DISTINCT FROM merged.stock)
+            )
+            SELECT count(*) FILTER (WHERE inserted),
+                   count(*) FILTER (WHERE NOT inserted)
+            FROM merged
+        """
+
+    def write(self, columns):
+        """
+        COPY the chunk into the staging table and merge it into the item table.
+
+        Args:
+            columns (dict): Item field arrays as returned by to_item_columns.
+
+        Returns:
+            tuple: (created, updated) row counts.
+        """
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(iter_item_rows(columns))
+        buffer.seek(0)
+
+        not_null = ', '.join(STRING_COLUMNS)
+        with transaction.atomic(), connection.cursor() as cursor:
+            self._create_staging_table(cursor)
+            cursor.copy_expert(
+                f"COPY {self.staging_table} ({', '.join(ITEM_FIELDS)}) FROM STDIN "
+                f"WITH (FORMAT csv, FORCE_NOT_NULL ({not_null}))", buffer)
+            cursor.execute(self._merge_sql())
+            created, updated = cursor.fetchone()
+
+        logger.info(f"Merged chunk: {created} created, {updated} updated.")
+        return created, updated
+
+
+def get_item_writer(batch_size=1000):
+    """
+    Pick the item writer for the configured database.
+
+    INGEST_BACKEND selects 'copy' or 'orm' explicitly; by default COPY is used
+    on PostgreSQL and the ORM writer everywhere else.
+    """
+    backend = os.getenv('INGEST_BACKEND', 'auto')
+    if backend == 'copy' or (backend == 'auto' and connection.vendor == 'postgresql'):
+        return PostgresCopyItemWriter(batch_size=batch_size)
+    return OrmItemWriter(batch_size=batch_size)
+
+
+class IngestReport:
+    """Per-run counts of what the feed did to the item table."""
+
+    def __init__(self) -> None:
+        self.inserted = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.disappeared = []
+        self.failed_files = []
+        # Why disappeared SKUs were left alone, None when they were zeroed
+        self.zeroing_skipped = None
+
+    def __str__(self):
+        report = (f"{self.inserted} inserted, {self.changed} changed, "
+                  f"{self.unchanged} unchanged, {len(self.disappeared)} disappeared")
+        if self.failed_files:
+            report += f", {len(self.failed_files)} files failed"
+        return report
+
+
+class FeedIngest:
+    """
+    Diffs feed chunks against the stored per-SKU fingerprints and writes only the difference.
+
+    One instance covers a whole run, possibly spanning several files, so that
+    SKUs missing from every file of the run can be detected in finish().
+    Zeroing them is only safe when every file was read completely: after a
+    failed file, or when more than INGEST_MAX_DISAPPEARED_SHARE of the
+    in-stock SKUs (default 0.1) went missing, nothing is zeroed.
+    """
+
+    def __init__(self, batch_size=1000, writer=None, max_disappeared_share=None) -> None:
+        self.writer = writer or get_item_writer(batch_size=batch_size)
+        self.report = IngestReport()
+        self.max_disappeared_share = float(
+            os.getenv('INGEST_MAX_DISAPPEARED_SHARE', DEFAULT_MAX_DISAPPEARED_SHARE)
+            if max_disappeared_share is None else max_disappeared_share)
+        self._seen_skus = []
+
+    def diff(self, columns):
+        """
+        Find the rows of item columns that are new or changed since the last ingest.
+
+        Returns:
+            np.ndarray: Boolean mask of new or changed rows.
+        """
+        stored = pd.DataFrame.from_records(
+            Item.objects.filter(sku__in=columns['sku'].tolist())
+            .values_list('sku', 'feed_fingerprint'),
+            columns=['sku', 'feed_fingerprint'])
+        # Nullable Int64 keeps the 64-bit hashes exact where float64 would round them
+        fingerprints = stored.set_index('sku')['feed_fingerprint'] \
+            .astype('Int64').reindex(columns['sku'])
+        # Unknown SKUs and items without a stored fingerprint always need writing
+        known = fingerprints.notna().to_numpy()
+        same = fingerprints.fillna(0).to_numpy(dtype=np.int64) == columns['feed_fingerprint']
+        return ~(known & same)
+
+    def ingest(self, chunk):
+        """
+        Write the new and changed SKUs of a preprocessed chunk.
+
+        Args:
+            chunk (pd.DataFrame): Rows already passed through preprocess_dataframe.
+        """
+        self.ingest_columns(to_item_columns(chunk))
+
+    def ingest_columns(self, columns):
+        """
+        Write the new and changed SKUs of already converted item columns.
+
+        Args:
+            columns (dict): Item field arrays as returned by to_item_columns.
+        """
+        self._seen_skus.append(columns['sku'].astype(np.int64))
+
+        dirty = self.diff(columns)
+        self.report.unchanged += int((~dirty).sum())
+        if not dirty.any():
+            return
+
+        created, updated = self.writer.write(take_rows(columns, dirty))
+        self.report.inserted += created
+        self.report.changed += updated
+
+    def file_failed(self, name, error):
+        """Record a feed file that could not be read completely; the run will not zero anything."""
+        logger.error(f"Failed to save {name} to the database: {error}")
+        self.report.failed_files.append(name)
+
+    def zero_disappeared(self, window_size=10000):
+        """
+        Zero the stock of in-stock SKUs that were missing from every chunk of the run.
+
+        Their fingerprint is cleared so they count as changed if they come back,
+        and the change is logged so the quantity push sends 0 to eBay. When
+        more than ``max_disappeared_share`` of the in-stock SKUs are missing
+        the feed is taken to be truncated and nothing is zeroed.
+
+        Returns:
+            list: SKUs whose stock was zeroed.
+        """
+        seen = np.unique(np.concatenate(self._seen_skus)) if self._seen_skus \
+            else np.empty(0, dtype=np.int64)
+        in_stock = Item.objects.exclude(stock=0).values_list('id', 'sku', 'price', 'stock')
+
+        missing = []
+        window = []
+        in_stock_count = 0
+        for row in in_stock.iterator(chunk_size=window_size):
+            in_stock_count += 1
+            window.append(row)
+            if len(window) >= window_size:
+                missing.extend(self._missing_rows(window, seen))
+                window = []
+        missing.extend(self._missing_rows(window, seen))
+
+        self.report.disappeared = [row[1] for row in missing]
+        if len(missing) > self.max_disappeared_share * in_stock_count:
+            self.report.zeroing_skipped = (
+                f"{len(missing)} of {in_stock_count} in-stock SKUs missing, more than "
+                f"{self.max_disappeared_share:.0%}")
+            return []
+
+        stock_reset = {field: 0 for field in STOCK_COLUMNS}
+        for start in range(0, len(missing), window_size):
+            rows = missing[start:start + window_size]
+            with transaction.atomic():
+                Item.objects.filter(id__in=[row[0] for row in rows]).update(
+                    feed_fingerprint=None, **stock_reset)
+                ItemChange.objects.bulk_create([
+                    ItemChange(sku=sku, old_price=price, new_price=price,
+                               old_stock=stock, new_stock=0)
+                    for _, sku, price, stock in rows])
+        return self.report.disappeared
+
+    @staticmethod
+    def _missing_rows(window, seen):
+        """Rows of ``window`` whose numeric SKU is not in the sorted ``seen`` array."""
+        if not window:
+            return []
+        skus = pd.to_numeric(pd.Series([row[1] for row in window]), errors='coerce') \
+            .fillna(0).astype(np.int64).to_numpy()
+        missing = ~np.isin(skus, seen)
+        return [row for row, is_missing in zip(window, missing) if is_missing]
+
+    def finish(self, zero_disappeared=True):
+        """
+        Close the run: optionally zero disappeared SKUs and log the report.
+
+        Args:
+            zero_disappeared (bool, optional): Detect and zero SKUs missing from the run. Defaults to True.
+
+        Returns:
+            IngestReport: Counts for the run.
+        """
+        if zero_disappeared and self.report.failed_files:
+            self.report.zeroing_skipped = f"failed files: {', '.join(self.report.failed_files)}"
+        elif zero_disappeared:
+            self.zero_disappeared()
+        logger.info(f"Ingest report: {self.report}")
+        if self.report.zeroing_skipped:
+            logger.error(f"Not zeroing disappeared SKUs, {self.report.zeroing_skipped}")
+        if self.report.disappeared:
+            shown = ', '.join(self.report.disappeared[:DISAPPEARED_LOG_LIMIT])
+            more = len(self.report.disappeared) - DISAPPEARED_LOG_LIMIT
+            logger.warning(
+                f"SKUs missing from the feed, stock "
+                f"{'left as it was' if self.report.zeroing_skipped else 'zeroed'}: {shown}"
+                + (f" (+{more} more)" if more > 0 else ""))
+        return self.report
@@ -0,0 +1,114 @@
+import logging
+from collections import deque
+
+from django.db import transaction
+from django.utils import timezone
+from listings.models import *
+
+logger = logging.getLogger(__name__)
+
+
+class RunLedger:
+    """
+    Persistent record of one job run and the batches it sent to eBay.
+
+    A batch is written before its API call and updated once the response is
+    recorded, so a crash leaves the unanswered batches behind as 'pending'.
+    The run's checkpoint only moves past a batch once it and every earlier
+    batch are answered; a run that did not complete is resumed by the next
+    start of the same job from that checkpoint.
+
+    With several workers running the job, each has its own runs and only
+    resumes those, and only with ``resume`` set, i.e. when the worker name is
+    stable across restarts. A run still 'running' that recorded progress
+    within ``stale_after`` (timedelta) belongs to a live process and is never
+    taken over.
+    """
+
+    def __init__(self, job, worker=None, resume=True, stale_after=None) -> None:
+        self.job = job
+        self.worker = worker
+        self.run = None
+        with transaction.atomic():
+            if resume:
+                runs = (JobRun.objects.select_for_update(skip_locked=True)
+                        .filter(job=job, worker=worker).exclude(status='completed'))
+                if stale_after is not None:
+                    runs = runs.exclude(status='running',
+                                        updated_at__gte=timezone.now() - stale_after)
+                self.run = runs.order_by('-id').first()
+            self.resumed = self.run is not None
+            if self.resumed:
+                self.run.status = 'running'
+                self.run.save(update_fields=['status', 'updated_at'])
+            else:
+                self.run = JobRun.objects.create(job=job, worker=worker)
+        if self.resumed:
+            logger.info(f"Resuming {self.run} after pk {self.run.checkpoint_pk}, "
+                        f"{self.run.items_submitted} items already submitted")
+        # Batches of this process in submission order, for advancing the checkpoint
+        self._open = deque()
+
+    @property
+    def checkpoint_pk(self):
+        return self.run.checkpoint_pk
+
+    @property
+    def items_submitted(self):
+        return self.run.items_submitted
+
+    def other_runs_active(self, within):
+        """True while a run of another worker has recorded progress in the last ``within`` (timedelta)."""
+        return (JobRun.objects.filter(job=self.job, status='running',
+                                      updated_at__gte=timezone.now() - within)
+                .exclude(pk=self.run.pk).exists())
+
+    def unanswered(self):
+        """Batches of earlier attempts of this run that were sent but never answered."""
+        return self.run.batches.filter(outcome='pending').order_by('id')
+
+    def submitted(self, batch, message_ids):
+        """
+        Record a batch right before its API call.
+
+        Args:
+            batch (list): Items of the call, in primary-key order.
+            message_ids (list): MessageID sent for each item.
+
+        Returns:
+            JobBatch: Pass it to ``answered`` once the response is recorded.
+        """
+        job_batch = JobBatch.objects.create(
+            run=self.run, first_pk=batch[0].pk, last_pk=batch[-1].pk,
+            skus=[item.sku for item in batch], message_ids=message_ids)
+        self.run.items_submitted += len(batch)
+        self.run.save(update_fields=['items_submitted', 'updated_at'])
+        self._open.append(job_batch)
+        return job_batch
+
+    def answered(self, job_batch, outcome, detail=None):
+        """Record the outcome of a batch and advance the checkpoint past every answered batch."""
+        job_batch.outcome = outcome
+        job_batch.detail = detail
+        job_batch.answered_at = timezone.now()
+        job_batch.save(update_fields=['outcome', 'detail', 'answered_at'])
+
+        checkpoint = None
+        while self._open and self._open[0].answered_at is not None:
+            checkpoint = self._open.popleft().last_pk
+        if checkpoint is not None:
+            self.run.checkpoint_pk = checkpoint
+            self.run.save(update_fields=['checkpoint_pk', 'updated_at'])
+
+    def reconciled(self, job_batch, detail=None):
+        """Close a batch of an earlier attempt whose outcome was looked up after the fact."""
+        job_batch.outcome = 'reconciled'
+        job_batch.detail = detail
+        job_batch.answered_at = timezone.now()
+        job_batch.save(update_fields=['outcome', 'detail', 'answered_at'])
+
+    def finish(self, completed=True):
+        """Mark the run completed, or interrupted so the next start resumes it."""
+        self.run.status = 'completed' if completed else 'interrupted'
+        self.run.finished_at = timezone.now()
+        self.run.save(update_fields=['status', 'finished_at', 'updated_at'])
@@ -0,0 +1,119 @@
+import os
+from datetime import timedelta
+
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from listings.models import *
+
+# eBay errors that say nothing about the item itself: retry later, whatever their classification
+RETRYABLE_ERROR_CODES = {
+    '10007',     # Internal error to the application
+    '518',       # Call usage limit reached
+    '21919144',  # Too many concurrent requests
+    '21919188',  # Seller's selling limit reached
+    '931',       # Auth token is invalid
+    '932',       # Auth token is hard expired
+}
+
+# Longest wait between two attempts of a retryable item
+MAX_RETRY_DELAY = timedelta(days=7)
+
+
+def classify_errors(error_codes):
+    """
+    Classify the failure of one item from its eBay errors.
+
+    eBay marks its own failures as SystemError; RequestError means the
+    request, i.e. the item data, was rejected and resending it unchanged
+    will fail again, unless the code is one of RETRYABLE_ERROR_CODES.
+
+    Args:
+        error_codes (list): (ErrorCode, ErrorClassification) tuples; empty when
+            eBay returned no error for the item at all.
+
+    Returns:
+        str: 'retryable' or 'permanent'.
+    """
+    if not error_codes:
+        return 'retryable'
+    for code, classification in error_codes:
+        if code in RETRYABLE_ERROR_CODES or classification == 'SystemError':
+            return 'retryable'
+    return 'permanent'
+
+
+def failure_outcome(attempts, error_class, debug_info, now):
+    """
+    Item fields to write after a failed listing attempt.
+
+    Retryable items wait LISTING_RETRY_BASE_MINUTES, doubling with each
+    attempt; after LISTING_MAX_ATTEMPTS they are parked like permanent ones.
+
+    Args:
+        attempts (int): Failed attempts before this one.
+        error_class (str): As returned by classify_errors.
+        debug_info (str): eBay error text.
+        now (datetime): Time of the attempt.
+    """
+    attempts += 1
+    max_attempts = int(os.getenv('LISTING_MAX_ATTEMPTS', '8'))
+    if error_class == 'retryable' and attempts >= max_attempts:
+        error_class = 'permanent'
+        debug_info = f"{debug_info}\nGave up after {attempts} attempts."
+
+    next_attempt_at = None
+    if error_class == 'retryable':
+        base = timedelta(minutes=int(os.getenv('LISTING_RETRY_BASE_MINUTES', '60')))
+        next_attempt_at = now + min(MAX_RETRY_DELAY, base * 2 ** (attempts - 1))
+
+    return {
+        'status': 'error',
+        'debug_info': debug_info,
+        'error_class': error_class,
+        'error_attempts': attempts,
+        'next_attempt_at': next_attempt_at,
+    }
+
+
+def listed_outcome(item_id):
+    """Item fields to write once eBay has a listing for the item."""
+    return {
+        'item_id': item_id,
+        'status': 'listed',
+        'debug_info': None,
+        'error_class': None,
+        'error_attempts': 0,
+        'next_attempt_at': None,
+    }
+
+
+def write_listing_outcomes(outcomes, touch=True):
+    """
+    Write back the listing outcome of many items, one UPDATE per resulting status.
+
+    Fields with the same value for every item of a status are set directly,
+    the others through a Case/When on the primary key.
+
+    Args:
+        outcomes (dict): pk -> {field: value}, as built by listed_outcome and
+            failure_outcome; fields an item has no value for are left as they are.
+        touch (bool): Also set updated_at, as save() would.
+    """
+    by_status = {}
+    for pk, values in outcomes.items():
+        by_status.setdefault(values['status'], {})[pk] = values
+
+    touched = {'updated_at': timezone.now()} if touch else {}
+    for group in by_status.values():
+        updates = {}
+        for field in {field for values in group.values() for field in values}:
+            field_values = [values[field] for values in group.values() if field in values]
+            if len(field_values) == len(group) and all(
+                    value == field_values[0] for value in field_values):
+                updates[field] = field_values[0]
+                continue
+            output_field = Item._meta.get_field(field)
+            updates[field] = Case(*[When(pk=pk, then=Value(values[field], output_field=output_field))
+                                    for pk, values in group.items() if field in values],
+                                  default=F(field))
+        Item.objects.filter(pk__in=group).update(**updates, **touched)
@@ -0,0 +1,56 @@
+from django.db.models import Max
+
+
+def keyset_windows(queryset, window_size, limit=None, fields=None, after=None, fetch=None):
+    """
+    Iterate a queryset in primary-key order, one bounded window of model instances at a time.
+
+    Each window is fetched with ``pk > last seen pk`` instead of an OFFSET, so
+    every query is an index range scan of ``window_size`` rows. The upper pk is
+    fixed when iteration starts: rows inserted during the run are not picked
+    up, and rows leaving the filter mid-run (e.g. listed by this job) do not
+    shift later windows, so nothing is skipped or repeated.
+
+    Args:
+        queryset (QuerySet): Candidate rows; its ordering is replaced by pk.
+        window_size (int): Rows fetched per query.
+        limit (int, optional): Stop after this many rows in total.
+        fields (iterable, optional): Load only these columns (QuerySet.only).
+        after (int, optional): Start after this pk, e.g. a resume checkpoint.
+        fetch (callable, optional): ``fetch(page, size)`` returns the rows of one window,
+            e.g. ItemClaimer.claim; defaults to the first ``size`` rows of ``page``.
+
+    Yields:
+        list: Model instances of one window.
+    """
+    queryset = queryset.order_by('pk')
+    if fields:
+        queryset = queryset.only(*fields)
+
+    upper = queryset.aggregate(upper=Max('pk'))['upper']
+    if upper is None:
+        return
+    queryset = queryset.filter(pk__lte=upper)
+
+    last_pk = after
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = window_size if remaining is None else min(window_size, remaining)
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = fetch(page, size) if fetch else list(page[:size])
+        if not rows:
+            return
+        yield rows
+        last_pk = rows[-1].pk
+        if remaining is not None:
+            remaining -= len(rows)
+
+
+def iter_batches(windows, batch_size):
+    """Re-slice keyset windows into API batches, asking ``batch_size()`` for the size of each."""
+    for window in windows:
+        start = 0
+        while start < len(window):
+            size = batch_size()
+            yield window[start:start + size]
+            start += size
@@ -0,0 +1,334 @@
+import hashlib
+import re
+import xml.dom.minidom
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+NAMESPACE = 'urn:ebay:apis:eBLBaseComponents'
+DEFAULT_CATEGORY_ID = '6755'
+DEFAULT_PICTURE_URL = 'https://ir.ebaystatic.com/cr/v/c1/rsc/ebay_logo_512.png'
+
+# Item columns the AddItems payload reads; load only these for listing candidates
+PAYLOAD_FIELDS = ('id', 'sku', 'pdescription', 'brand', 'partslink', 'oem_number',
+                  'category_id', 'sell_price', 'part_name', 'image_url')
+
+# Marks a per-item field inside the template, e.g. @@sku@@
+_PLACEHOLDER = re.compile(r'@@(\w+)@@')
+
+
+def _sub(parent, tag, text=None):
+    element = ET.SubElement(parent, tag)
+    if text is not None:
+        element.text = text
+    return element
+
+
+def _build_item_container():
+    """Build the AddItemRequestContainer skeleton once, with @@field@@ markers for per-item values."""
+    container = ET.Element('AddItemRequestContainer')
+    _sub(container, 'MessageID', '@@message_id@@')
+
+    item_xml = _sub(container, 'Item')
+    _sub(item_xml, 'Title', '@@title@@')
+    _sub(item_xml, 'SKU', '@@sku@@')
+    # Lets an unanswered AddItems call be reconciled with GetItem by SKU
+    _sub(item_xml, 'InventoryTrackingMethod', 'SKU')
+    _sub(item_xml, 'Message', '@@sku@@')
+    _sub(item_xml, 'Description', '@@description@@')
+    primary_category = _sub(item_xml, 'PrimaryCategory')
+    _sub(primary_category, 'CategoryID', '@@category_id@@')
+    _sub(item_xml, 'CategoryMappingAllowed', 'true')
+    _sub(item_xml, 'Site', 'eBayMotors')
+    _sub(item_xml, 'Quantity', '1')
+    _sub(item_xml, 'StartPrice', '@@start_price@@')
+    _sub(item_xml, 'ListingDuration', 'GTC')
+    _sub(item_xml, 'ListingType', 'FixedPriceItem')
+    _sub(item_xml, 'DispatchTimeMax', '3')
+
+    shipping_details = _sub(item_xml, 'ShippingDetails')
+    _sub(shipping_details, 'ShippingType', 'Flat')
+    shipping_service_options = _sub(shipping_details, 'ShippingServiceOptions')
+    _sub(shipping_service_options, 'ShippingServicePriority', '1')
+    _sub(shipping_service_options, 'ShippingService', 'FedExHomeDelivery')
+    _sub(shipping_service_options, 'ShippingServiceCost', '0.0')
+
+    return_policy = _sub(item_xml, 'ReturnPolicy')
+    _sub(return_policy, 'ReturnsAcceptedOption', 'ReturnsAccepted')
+    _sub(return_policy, 'ReturnsWithinOption', 'Days_30')
+    _sub(return_policy, 'ShippingCostPaidByOption', 'Buyer')
+
+    _sub(item_xml, 'ConditionID', '1000')
+    _sub(item_xml, 'ConditionDisplayName', 'New')
+    _sub(item_xml, 'Country', 'US')
+    _sub(item_xml, 'Currency', 'USD')
+    _sub(item_xml, 'PostalCode', '60586')
+
+    item_specifics = _sub(item_xml, 'ItemSpecifics')
+    for name, value in (('Title', '@@part_name@@'), ('Publisher', '@@brand@@'),
+                        ('Author', 'JK Rowling'), ('Language', 'English')):
+        name_value_list = _sub(item_specifics, 'NameValueList')
+        _sub(name_value_list, 'Name', name)
+        _sub(name_value_list, 'Value', value)
+
+    picture_details = _sub(item_xml, 'PictureDetails')
+    _sub(picture_details, 'GalleryType', 'Gallery')
+    _sub(picture_details, 'PictureURL', '@@picture_url@@')
+    # One UUID per SKU: eBay rejects a second listing of it instead of creating a duplicate
+    _sub(item_xml, 'UUID', '@@uuid@@')
+    return container
+
+
+def compile_template(element):
+    """
+    Serialize an element with @@field@@ markers and split it into static segments.
+
+    Returns:
+        tuple: (segments, fields) where the rendered XML is
+            segments[0] + value(fields[0]) + segments[1] + ... + segments[-1].
+    """
+    parts = _PLACEHOLDER.split(ET.tostring(element, encoding='unicode'))
+    return parts[0::2], parts[1::2]
+
+
+class AddItemsPayloadBuilder:
+    """
+    Renders AddItems request bodies from a template compiled once.
+
+    Everything constant (shipping, return policy, condition, country, currency,
+    postal code, item specifics) is serialized a single time; per item only the
+    escaped field values are joined in between the static segments.
+    """
+
+    def __init__(self) -> None:
+        container = _build_item_container()
+        self._segments, self._fields = compile_template(container)
+
+        # Bulk upload records carry the bare Item
+        self._bulk_segments, self._bulk_fields = compile_template(container.find('Item'))
+
+    @staticmethod
+    def item_fields(item):
+        """Per-item text values, keyed like the template markers."""
+        return {
+            'title': item.pdescription,
+            'sku': str(item.sku),
+            'description': (
+                f"Brand: {item.brand},\n"
+                f"Part Link: {item.partslink},\n"
+                f"OEM Number: {item.oem_number},\n\n"
+                f"{item.pdescription}"
+            ),
+            'category_id': item.category_id or DEFAULT_CATEGORY_ID,
+            'start_price': str(item.sell_price),
+            'part_name': item.part_name,
+            'brand': item.brand,
+            'picture_url': item.image_url or DEFAULT_PICTURE_URL,
+            'uuid': hashlib.md5(str(item.sku).encode()).hexdigest().upper(),
+        }
+
+    @staticmethod
+    def _render(segments, fields, values):
+        parts = [segments[0]]
+        for field, segment in zip(fields, segments[1:]):
+            value = values[field]
+            parts.append(escape(value) if value is not None else '')
+            parts.append(segment)
+        return ''.join(parts)
+
+    def item_xml(self, item, message_id):
+        """Render one AddItemRequestContainer for ``item``."""
+        values = self.item_fields(item)
+        values['message_id'] = str(message_id)
+        return self._render(self._segments, self._fields, values)
+
+    def fixed_price_item_xml(self, item, message_id):
+        """Render one AddFixedPriceItemRequest record for a bulk upload file."""
+        values = self.item_fields(item)
+        return (
+            f'<AddFixedPriceItemRequest xmlns="{NAMESPACE}">'
+            "<ErrorLanguage>en_US</ErrorLanguage>"
+            "<WarningLevel>High</WarningLevel>"
+            "<Version>1193</Version>"
+            f"{self._render(self._bulk_segments, self._bulk_fields, values)}"
+            f"<MessageID>{escape(str(message_id))}</MessageID>"
+            "</AddFixedPriceItemRequest>"
+        )
+
+    def request_xml(self, access_token, containers):
+        """
+        Wrap rendered item containers into a complete AddItemsRequest document.
+
+        Args:
+            access_token (str): Token for RequesterCredentials.
+            containers (list): Strings returned by item_xml.
+        """
+        return (
+            "<?xml version='1.0' encoding='utf-8'?>\n"
+            f'<AddItemsRequest xmlns="{NAMESPACE}">'
+            f"<RequesterCredentials><eBayAuthToken>{escape(access_token or '')}</eBayAuthToken></RequesterCredentials>"
+            "<Version>1193</Version>"
+            "<ErrorLanguage>en_US</ErrorLanguage>"
+            "<WarningLevel>High</WarningLevel>"
+            f"{''.join(containers)}"
+            "</AddItemsRequest>"
+        )
+
+
+def pretty_xml(xml_body):
+    """Indent an XML document for debug logging."""
+    return xml.dom.minidom.parseString(xml_body).toprettyxml(indent="  ")
+
+
+def revise_inventory_status_xml(access_token, statuses):
+    """
+    Build a ReviseInventoryStatusRequest document.
+
+    Args:
+        access_token (str): Token for RequesterCredentials.
+        statuses (list): (item_id, quantity, start_price) tuples, at most 4 per call.
+    """
+    inventory_status = ''.join(
+        "<InventoryStatus>"
+        f"<ItemID>{escape(str(item_id))}</ItemID>"
+        f"<Quantity>{quantity}</Quantity>"
+        f"<StartPrice>{start_price}</StartPrice>"
+        "</InventoryStatus>"
+        for item_id, quantity, start_price in statuses
+    )
+    return (
+        "<?xml version='1.0' encoding='utf-8'?>\n"
+        f'<ReviseInventoryStatusRequest xmlns="{NAMESPACE}">'
+        f"<RequesterCredentials><eBayAuthToken>{escape(access_token or '')}</eBayAuthToken></RequesterCredentials>"
+        "<ErrorLanguage>en_US</ErrorLanguage>"
+        "<WarningLevel>High</WarningLevel>"
+        f"{inventory_status}"
+        "</ReviseInventoryStatusRequest>"
+    )
+
+
+class AddItemResult:
+    """Outcome of one AddItemResponseContainer."""
+
+    def __init__(self, correlation_id, item_id, errors, error_codes=()) -> None:
+        self.correlation_id = correlation_id
+        self.item_id = item_id
+        self.errors = errors
+        # (ErrorCode, ErrorClassification) of the errors, warnings excluded
+        self.error_codes = list(error_codes)
+
+    @property
+    def ok(self):
+        # Containers with only warnings still carry the new ItemID
+        return bool(self.item_id)
+
+
+def _error_texts(parent):
+    ns = {'e': NAMESPACE}
+    return [f"{error.findtext('e:SeverityCode', '', ns)} "
+            f"{error.findtext('e:ErrorCode', '', ns)}: "
+            f"{error.findtext('e:LongMessage', '', ns) or error.findtext('e:ShortMessage', '', ns)}"
+            for error in parent.findall('e:Errors', ns)]
+
+
+def _error_codes(parent):
+    ns = {'e': NAMESPACE}
+    return [(error.findtext('e:ErrorCode', '', ns), error.findtext('e:ErrorClassification', '', ns))
+            for error in parent.findall('e:Errors', ns)
+            if error.findtext('e:SeverityCode', '', ns) != 'Warning']
+
+
+def parse_item_result(element):
+    """
+    Read the outcome of one listing call from its response element.
+
+    Works for AddItemResponseContainer and AddFixedPriceItemResponse. A
+    duplicate UUID counts as success with the ItemID of the earlier listing.
+
+    Returns:
+        AddItemResult: With correlation_id None when it is missing or not a number.
+    """
+    ns = {'e': NAMESPACE}
+    correlation_id = element.findtext('e:CorrelationID', '', ns).strip()
+    item_id = (element.findtext('e:ItemID', '', ns).strip() or
+               element.findtext('e:DuplicateInvocationDetails/e:InvocationTrackingID', '', ns).strip())
+    return AddItemResult(
+        int(correlation_id) if correlation_id.isdigit() else None,
+        item_id or None,
+        _error_texts(element),
+        _error_codes(element),
+    )
+
+
+def parse_add_items_response(response_text):
+    """
+    Parse an AddItemsResponse.
+
+    Args:
+        response_text (str): Response body.
+
+    Returns:
+        tuple: (ack, errors, results) where errors are the call-level error
+            texts and results maps CorrelationID (int) to an AddItemResult.
+
+    Raises:
+        xml.etree.ElementTree.ParseError: The body is not XML.
+    """
+    ns = {'e': NAMESPACE}
+    root = ET.fromstring(response_text)
+    results = {}
+    for container in root.findall('e:AddItemResponseContainer', ns):
+        result = parse_item_result(container)
+        if result.correlation_id is not None:
+            results[result.correlation_id] = result
+    return root.findtext('e:Ack', '', ns), _error_texts(root), results
+
+
+def get_item_by_sku_xml(access_token, sku):
+    """Build a GetItemRequest looking a listing up by its SKU."""
+    return (
+        "<?xml version='1.0' encoding='utf-8'?>\n"
+        f'<GetItemRequest xmlns="{NAMESPACE}">'
+        f"<RequesterCredentials><eBayAuthToken>{escape(access_token or '')}</eBayAuthToken></RequesterCredentials>"
+        f"<SKU>{escape(str(sku))}</SKU>"
+        "<DetailLevel>ReturnSummary</DetailLevel>"
+        "</GetItemRequest>"
+    )
+
+
+def parse_get_item_response(response_text):
+    """
+    Read the ItemID from a GetItemResponse.
+
+    Returns:
+        tuple: (item_id or None when there is no such listing, error texts).
+    """
+    ns = {'e': NAMESPACE}
+    root = ET.fromstring(response_text)
+    item_id = root.findtext('e:Item/e:ItemID', '', ns).strip()
+    return item_id or None, _error_texts(root)
+
+
+def parse_revise_inventory_status_response(response_text):
+    """
+    Parse a ReviseInventoryStatusResponse into per-item results.
+
+    eBay answers with an InventoryStatus element for every item it revised
+    and an Errors element, naming the ItemID in its ErrorParameters, for every
+    item it rejected, so one bad item does not fail the rest of the call.
+
+    Returns:
+        tuple: (ack, revised ItemIDs, errors) where errors is a list of
+            (error text, set of ErrorParameters values).
+
+    Raises:
+        xml.etree.ElementTree.ParseError: The body is not XML.
+    """
+    ns = {'e': NAMESPACE}
+    root = ET.fromstring(response_text)
+    revised = {status.findtext('e:ItemID', '', ns).strip()
+               for status in root.findall('e:InventoryStatus', ns)}
+    errors = [(text, {value.text.strip() for value in error.iterfind('e:ErrorParameters/e:Value', ns)
+                      if value.text})
+              for text, error in zip(_error_texts(root), root.findall('e:Errors', ns))
+              if error.findtext('e:SeverityCode', '', ns) != 'Warning']
+    return root.findtext('e:Ack', '', ns), revised, errors
@@ -0,0 +1,125 @@
+import logging
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, Max, Q, Value, When
+from django.db.models.functions import Ceil, Coalesce, Greatest, Least, Round
+from listings.models import *
+
+logger = logging.getLogger(__name__)
+
+# Markup of items no active rule matches
+DEFAULT_MARKUP = Decimal('1.2')
+
+_PRICE = DecimalField(max_digits=12, decimal_places=2)
+_ZERO = Value(Decimal('0'), output_field=_PRICE)
+
+
+def _decimal(value):
+    return Value(Decimal(value), output_field=_PRICE)
+
+
+def rule_price(rule):
+    """
+    The sell price one rule gives, as an expression over the Item columns.
+
+    Markup first, then shipping and handling revenue, the price ending,
+    and last the floor and ceiling, which always hold.
+    """
+    price = F('price') * _decimal(rule.markup)
+    if rule.include_shipping:
+        price = (price + Coalesce(F('shipping_revenue18'), _ZERO)
+                 + Coalesce(F('handling_revenue18'), _ZERO))
+    if rule.price_ending is not None:
+        # Smallest price at or above the current one that ends in price_ending
+        price = Ceil(price - _decimal(rule.price_ending)) + _decimal(rule.price_ending)
+    if rule.price_floor is not None:
+        price = Greatest(price, _decimal(rule.price_floor))
+    if rule.price_ceiling is not None:
+        price = Least(price, _decimal(rule.price_ceiling))
+    return price
+
+
+def compile_pricing(rules=None):
+    """
+    Compile the pricing rules into one SQL expression for Item.sell_price.
+
+    Args:
+        rules (iterable, optional): PricingRule instances. Defaults to the active rules.
+
+    Returns:
+        Expression: A CASE over the rules in match order, rounded to cents.
+    """
+    if rules is None:
+        rules = PricingRule.objects.filter(active=True)
+    # Priority first, then brand-and-category rules before single-column and catch-all ones
+    rules = sorted(rules, key=lambda rule: (
+        rule.priority, -bool(rule.brand) - bool(rule.category_id), rule.pk or 0))
+
+    default = F('price') * _decimal(DEFAULT_MARKUP)
+    whens = []
+    for rule in rules:
+        condition = Q()
+        if rule.brand:
+            condition &= Q(brand=rule.brand)
+        if rule.category_id:
+            condition &= Q(category_id=rule.category_id)
+        if not condition:
+            default = rule_price(rule)
+            break
+        whens.append(When(condition, then=rule_price(rule)))
+
+    price = Case(*whens, default=default, output_field=_PRICE) if whens else default
+    return Round(price, 2, output_field=_PRICE)
+
+
+def reprice_items(items=None, sell_price=None):
+    """
+    Store the sell price of many items in one UPDATE, writing only the ones that change.
+
+    Pushed listings whose sell price changed are put back to 'listed' so the
+    next ReviseInventoryStatus run picks them up.
+
+    Args:
+        items (QuerySet, optional): Items to reprice. Defaults to every item.
+        sell_price (Expression, optional): As returned by compile_pricing. Defaults to the active rules.
+
+    Returns:
+        int: Number of items whose sell price changed.
+    """
+    if items is None:
+        items = Item.objects.all()
+    if sell_price is None:
+        sell_price = compile_pricing()
+
+    changed = items.annotate(new_sell_price=sell_price).filter(
+        Q(sell_price__isnull=True) | ~Q(sell_price=F('new_sell_price')))
+    Item.objects.filter(pk__in=changed.filter(status='updated').values('pk')).update(status='listed')
+    count = Item.objects.filter(pk__in=changed.values('pk')).update(sell_price=sell_price)
+    if count:
+        logger.info(f"Repriced {count} items")
+    return count
+
+
+def reprice_pending(full=False):
+    """
+    Reprice what the cronjobs have to before pushing prices.
+
+    The whole catalog is repriced when the pricing rules changed since the
+    last run (see RepriceRequest) or ``full`` is set, otherwise only the
+    items without a sell price yet.
+
+    Args:
+        full (bool): Reprice every item even without a pending request.
+
+    Returns:
+        int: Number of items whose sell price changed.
+    """
+    latest = RepriceRequest.objects.aggregate(latest=Max('pk'))['latest']
+    if latest is None and not full:
+        return reprice_items(Item.objects.filter(sell_price__isnull=True))
+
+    count = reprice_items()
+    # Requests made while repricing stay for the next run
+    if latest is not None:
+        RepriceRequest.objects.filter(pk__lte=latest).delete()
+    return count
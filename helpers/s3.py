@@ -1,4 +1,6 @@
 from datetime import datetime, timedelta
+import hashlib
+import tempfile
 import boto3
 
 
@@ -11,36 +13,97 @@ class S3Service:
             aws_secret_access_key=aws_secret_access_key
         )
 
-    def download_from_s3(self, s3_file, s3_bucket, local_file):
+    def stream_object(self, s3_file, s3_bucket, fileobj, chunk_size=1024 * 1024):
+        """
+        Copy an object body into ``fileobj`` in one pass, hashing it on the way.
+
+        Returns:
+            str: SHA-256 hex digest of the object content.
+        """
         try:
-            self.s3.Bucket(s3_bucket).download_file(s3_file, local_file)
-            return True
+            sha256 = hashlib.sha256()
+            body = self.s3.Object(s3_bucket, s3_file).get()['Body']
+            for chunk in body.iter_chunks(chunk_size):
+                sha256.update(chunk)
+                fileobj.write(chunk)
+            return sha256.hexdigest()
         except Exception as e:
             raise Exception(
                 f"Failed to download {s3_file} from {s3_bucket}: {e}")
 
-    def get_previous_day_files(self, s3_bucket):
+    def open_object(self, s3_file, s3_bucket, max_memory=64 * 1024 * 1024):
+        """
+        Download an object into a spooled buffer and hash it while streaming.
+
+        Objects up to ``max_memory`` bytes stay in memory, larger ones spill to
+        a temporary file. The caller owns the returned file and must close it.
+
+        Returns:
+            tuple: (file-like object positioned at the start, SHA-256 hex digest).
+        """
+        buffer = tempfile.SpooledTemporaryFile(max_size=max_memory)
         try:
-            bucket = self.s3.Bucket(s3_bucket)
-            # Filter out folders (objects whose keys end with '/') and files that do not end with .xlsx
-            files = [obj for obj in bucket.objects.all()
-                    if not obj.key.endswith('/') and obj.key.endswith('.xlsx')]
+            file_hash = self.stream_object(s3_file, s3_bucket, buffer)
+        except Exception:
+            buffer.close()
+            raise
+        buffer.seek(0)
+        return buffer, file_hash
 
+    def list_objects(self, s3_bucket, prefix='', page_size=1000):
+        """
+        Page through the objects under ``prefix`` without materializing the whole listing.
+
+        Yields:
+            dict: Key, ETag (unquoted), Size and LastModified of every object.
+        """
+        try:
+            paginator = self.s3.meta.client.get_paginator('list_objects_v2')
+            pages = paginator.paginate(Bucket=s3_bucket, Prefix=prefix,
+                                       PaginationConfig={'PageSize': page_size})
+            for page in pages:
+                for obj in page.get('Contents', []):
+                    yield {
+                        'Key': obj['Key'],
+                        'ETag': obj['ETag'].strip('"'),
+                        'Size': obj['Size'],
+                        'LastModified': obj['LastModified'],
+                    }
+        except Exception as e:
+            raise Exception(
+                f"Failed to list {s3_bucket}/{prefix}: {e}")
+
+    def get_previous_day_objects(self, s3_bucket, prefix=''):
+        """
+        List the .xlsx objects uploaded on the previous day.
+
+        Args:
+            s3_bucket (str): Bucket name.
+            prefix (str, optional): Key prefix, may contain strftime codes that are
+                filled with the previous day, e.g. 'feeds/%Y/%m/%d/'. Defaults to ''.
+
+        Returns:
+            list: Object dicts from list_objects, oldest upload first.
+        """
+        try:
             # Get the current date and the date for the previous day
             current_date = datetime.now().date()
             previous_day = current_date - timedelta(days=1)
 
-            # Filter files to include only those from the previous day
+            # Filter out folders (objects whose keys end with '/') and files that do not end with .xlsx,
+            # keeping only those from the previous day
             previous_day_files = [
-                obj for obj in files
-                if obj.last_modified.date() == previous_day
+                obj for obj in self.list_objects(s3_bucket, previous_day.strftime(prefix))
+                if not obj['Key'].endswith('/') and obj['Key'].endswith('.xlsx')
+                and obj['LastModified'].date() == previous_day
             ]
 
             if not previous_day_files:
                 raise Exception(
                     f"No files from the previous day found in {s3_bucket}")
 
-            return [file.key for file in previous_day_files]
+            # Oldest first, so later uploads win when the same SKU appears twice
+            return sorted(previous_day_files, key=lambda obj: (obj['LastModified'], obj['Key']))
 
         except Exception as e:
             raise Exception(
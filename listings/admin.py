@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Item, APIToken, S3File
+from .models import Item, APIToken, S3File, S3Object, ItemChange, ChangeLogCursor, JobRun, JobBatch, PricingRule, RepriceRequest
 
 
 @admin.register(Item)
@@ -7,10 +7,52 @@ class ItemAdmin(admin.ModelAdmin):
     list_display = ('sku', 'brand', 'item_id',
                     'status', 'stock', 'updated_at')
     search_fields = ('sku', 'brand', 'item_id')
-    list_filter = ('status', 'brand', 'created_at')
+    list_filter = ('status', 'error_class', 'brand', 'created_at')
     ordering = ('-updated_at',)
     readonly_fields = ('created_at', 'updated_at')
 
+    def save_model(self, request, obj, form, change):
+        # Editing the listing data of a failed item gives it a fresh set of attempts
+        if change and obj.status == 'error' and set(form.changed_data) & set(Item.LISTING_DATA_FIELDS):
+            for field, value in Item.ERROR_RESET.items():
+                setattr(obj, field, value)
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(PricingRule)
+class PricingRuleAdmin(admin.ModelAdmin):
+    list_display = ('name', 'priority', 'brand', 'category_id', 'markup',
+                    'include_shipping', 'price_ending', 'price_floor', 'price_ceiling', 'active')
+    search_fields = ('name', 'brand', 'category_id')
+    list_filter = ('active', 'include_shipping')
+    ordering = ('priority', 'name')
+    readonly_fields = ('created_at', 'updated_at')
+
+    # Repricing the catalog takes too long for a request; the next cronjob run does it
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self.request_reprice(request, f"Rule {obj} {'changed' if change else 'added'}")
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.request_reprice(request, f"Rule {obj} deleted")
+
+    def delete_queryset(self, request, queryset):
+        names = ', '.join(str(rule) for rule in queryset)
+        super().delete_queryset(request, queryset)
+        self.request_reprice(request, f"Rules {names} deleted")
+
+    def request_reprice(self, request, reason):
+        RepriceRequest.objects.create(reason=reason[:255])
+        self.message_user(request, "Sell prices will be updated by the next listing or update run.")
+
+
+@admin.register(RepriceRequest)
+class RepriceRequestAdmin(admin.ModelAdmin):
+    list_display = ('reason', 'requested_at')
+    ordering = ('-requested_at',)
+    readonly_fields = ('requested_at',)
+
 
 @admin.register(APIToken)
 class APITokenAdmin(admin.ModelAdmin):
@@ -26,3 +68,45 @@ class S3FileAdmin(admin.ModelAdmin):
     search_fields = ('name', 'file_hash')
     ordering = ('-upload_time',)
     readonly_fields = ('upload_time',)
+
+
+@admin.register(S3Object)
+class S3ObjectAdmin(admin.ModelAdmin):
+    list_display = ('key', 'etag', 'size', 'last_modified', 'processed_at')
+    search_fields = ('key', 'etag', 'file_hash')
+    ordering = ('-last_modified',)
+    readonly_fields = ('processed_at',)
+
+
+@admin.register(ItemChange)
+class ItemChangeAdmin(admin.ModelAdmin):
+    list_display = ('id', 'sku', 'old_price', 'new_price',
+                    'old_stock', 'new_stock', 'created_at')
+    search_fields = ('sku',)
+    ordering = ('-id',)
+    readonly_fields = ('created_at',)
+
+
+@admin.register(ChangeLogCursor)
+class ChangeLogCursorAdmin(admin.ModelAdmin):
+    list_display = ('consumer', 'position', 'updated_at')
+    search_fields = ('consumer',)
+    readonly_fields = ('updated_at',)
+
+
+@admin.register(JobRun)
+class JobRunAdmin(admin.ModelAdmin):
+    list_display = ('id', 'job', 'worker', 'status', 'items_submitted',
+                    'checkpoint_pk', 'started_at', 'finished_at')
+    list_filter = ('job', 'worker', 'status')
+    ordering = ('-started_at',)
+    readonly_fields = ('started_at', 'updated_at')
+
+
+@admin.register(JobBatch)
+class JobBatchAdmin(admin.ModelAdmin):
+    list_display = ('id', 'run', 'first_pk', 'last_pk',
+                    'outcome', 'submitted_at', 'answered_at')
+    list_filter = ('outcome',)
+    ordering = ('-id',)
+    readonly_fields = ('submitted_at',)
@@ -0,0 +1,64 @@
+# Generated by Django 5.1 on 2026-10-18 14:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='APIToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('access_token', models.TextField()),
+                ('refresh_token', models.TextField()),
+                ('refresh_token_expires_in', models.IntegerField()),
+                ('token_type', models.CharField(max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Item',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sku', models.CharField(max_length=255, unique=True)),
+                ('item_id', models.CharField(blank=True, max_length=255, null=True, unique=True)),
+                ('brand', models.CharField(max_length=255)),
+                ('part_name', models.CharField(max_length=255)),
+                ('partslink', models.CharField(blank=True, max_length=255, null=True)),
+                ('oem_number', models.CharField(blank=True, max_length=255, null=True)),
+                ('category_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('shipping_revenue18', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('handling_revenue18', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('stock_va', models.IntegerField(blank=True, null=True)),
+                ('stock_il', models.IntegerField(blank=True, null=True)),
+                ('stock_las1', models.IntegerField(blank=True, null=True)),
+                ('stock_peru', models.IntegerField(blank=True, null=True)),
+                ('stock_gpt', models.IntegerField(blank=True, null=True)),
+                ('stock_jax', models.IntegerField(blank=True, null=True)),
+                ('stock', models.IntegerField()),
+                ('image_url', models.URLField(blank=True, null=True)),
+                ('pdescription', models.TextField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('not listed', 'Not Listed'), ('listed', 'Listed'), ('error', 'Error'), ('updated', 'Updated for Price & Stock')], default='not listed', max_length=30)),
+                ('debug_info', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='S3File',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('file_hash', models.CharField(max_length=64, unique=True)),
+                ('upload_time', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,173 @@
+# Generated by Django 5.1 on 2026-10-18 14:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('consumer', models.CharField(max_length=100, unique=True)),
+                ('position', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ItemChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sku', models.CharField(max_length=255)),
+                ('old_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('new_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('old_stock', models.IntegerField(blank=True, null=True)),
+                ('new_stock', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='JobBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_pk', models.BigIntegerField()),
+                ('last_pk', models.BigIntegerField()),
+                ('skus', models.JSONField()),
+                ('message_ids', models.JSONField()),
+                ('outcome', models.CharField(choices=[('pending', 'Pending'), ('succeeded', 'Succeeded'), ('failed', 'Failed'), ('reconciled', 'Reconciled')], default='pending', max_length=20)),
+                ('detail', models.TextField(blank=True, null=True)),
+                ('submitted_at', models.DateTimeField(auto_now_add=True)),
+                ('answered_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='JobRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job', models.CharField(max_length=100)),
+                ('worker', models.CharField(blank=True, max_length=255, null=True)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('interrupted', 'Interrupted'), ('completed', 'Completed')], default='running', max_length=20)),
+                ('checkpoint_pk', models.BigIntegerField(blank=True, null=True)),
+                ('items_submitted', models.IntegerField(default=0)),
+                ('change_log_position', models.BigIntegerField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PricingRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('priority', models.IntegerField(default=100)),
+                ('brand', models.CharField(blank=True, max_length=255, null=True)),
+                ('category_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('markup', models.DecimalField(decimal_places=3, default=1.2, max_digits=6)),
+                ('include_shipping', models.BooleanField(default=False)),
+                ('price_ending', models.DecimalField(blank=True, decimal_places=2, max_digits=3, null=True)),
+                ('price_floor', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('price_ceiling', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='S3Object',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=1024, unique=True)),
+                ('etag', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField()),
+                ('last_modified', models.DateTimeField()),
+                ('file_hash', models.CharField(blank=True, max_length=64, null=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='apitoken',
+            name='access_token_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='claim_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='claimed_by',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='error_attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='error_class',
+            field=models.CharField(blank=True, choices=[('retryable', 'Retryable'), ('permanent', 'Permanent')], max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='feed_fingerprint',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='pushed_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='pushed_quantity',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='sell_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(condition=models.Q(('status__in', ['not listed', 'error']), models.Q(('stock', 0), _negated=True)), fields=['id'], name='item_listing_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(condition=models.Q(('status', 'listed')), fields=['id'], name='item_revise_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['-updated_at'], name='item_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['status', '-updated_at'], name='item_status_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['brand', '-updated_at'], name='item_brand_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(condition=models.Q(('claimed_by__isnull', False)), fields=['claimed_by', 'claim_expires_at'], name='item_claim_idx'),
+        ),
+        migrations.AddField(
+            model_name='jobbatch',
+            name='run',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='batches', to='listings.jobrun'),
+        ),
+    ]
@@ -9,6 +9,17 @@ class Item(models.Model):
         ('error', 'Error'),
         ('updated', 'Updated for Price & Stock'),
     ]
+    ERROR_CLASS_CHOICES = [
+        ('retryable', 'Retryable'),
+        ('permanent', 'Permanent'),
+    ]
+    # Values that give an item a fresh set of listing attempts
+    ERROR_RESET = {'error_attempts': 0,
+                   'next_attempt_at': None, 'error_class': None}
+    # Listing data eBay validates; only a change to one of these can make a rejected item listable.
+    # Price and stock are left out: they change daily and do not fix a rejected listing.
+    LISTING_DATA_FIELDS = ('brand', 'part_name', 'partslink', 'oem_number',
+                           'category_id', 'pdescription', 'image_url')
 
     sku = models.CharField(max_length=255, unique=True)
     item_id = models.CharField(
@@ -35,9 +46,43 @@ class Item(models.Model):
     status = models.CharField(
         max_length=30, choices=STATUS_CHOICES, default='not listed')
     debug_info = models.TextField(blank=True, null=True)
+    # Listing failures: retryable ones wait until next_attempt_at, permanent ones until the listing data changes
+    error_class = models.CharField(
+        max_length=20, choices=ERROR_CLASS_CHOICES, blank=True, null=True)
+    error_attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(blank=True, null=True)
+    # Hash of price, stock and the per-warehouse stock columns from the last ingest
+    feed_fingerprint = models.BigIntegerField(blank=True, null=True)
+    # StartPrice computed from the PricingRule table, see helpers/pricing.py
+    sell_price = models.DecimalField(
+        max_digits=10, decimal_places=2, blank=True, null=True)
+    # StartPrice and Quantity eBay accepted in the last ReviseInventoryStatus call
+    pushed_price = models.DecimalField(
+        max_digits=10, decimal_places=2, blank=True, null=True)
+    pushed_quantity = models.IntegerField(blank=True, null=True)
+    # Worker and job currently processing the item and until when the claim holds, see helpers/claims.py
+    claimed_by = models.CharField(max_length=255, blank=True, null=True)
+    claim_expires_at = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Listing job candidates, walked in primary-key order (listing_candidates)
+            models.Index(fields=['id'], name='item_listing_queue_idx',
+                         condition=models.Q(status__in=['not listed', 'error']) & ~models.Q(stock=0)),
+            # Listed items waiting for their first ReviseInventoryStatus
+            models.Index(fields=['id'], name='item_revise_queue_idx',
+                         condition=models.Q(status='listed')),
+            # Admin changelist: newest first, optionally filtered by status or brand
+            models.Index(fields=['-updated_at'], name='item_updated_idx'),
+            models.Index(fields=['status', '-updated_at'], name='item_status_updated_idx'),
+            models.Index(fields=['brand', '-updated_at'], name='item_brand_updated_idx'),
+            # Only claimed rows are indexed, so renewing and releasing claims stays cheap
+            models.Index(fields=['claimed_by', 'claim_expires_at'], name='item_claim_idx',
+                         condition=models.Q(claimed_by__isnull=False)),
+        ]
+
     def __str__(self):
         return f"{self.sku} - {self.item_id}"
 
@@ -46,6 +91,7 @@ class APIToken(models.Model):
     access_token = models.TextField()
     refresh_token = models.TextField()
     refresh_token_expires_in = models.IntegerField()
+    access_token_expires_at = models.DateTimeField(blank=True, null=True)
     token_type = models.CharField(max_length=50)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -53,6 +99,50 @@ class APIToken(models.Model):
     def __str__(self):
         return f"Token type: {self.token_type} (Created at: {self.created_at})"
 
+class PricingRule(models.Model):
+    """
+    How the sell price of matching items is derived from their feed price.
+
+    A rule matches on brand and/or category; empty means any. The first
+    matching rule by priority (then the more specific one) prices an item,
+    items no rule matches get the default 1.2 markup.
+    """
+    name = models.CharField(max_length=255)
+    priority = models.IntegerField(default=100)
+    brand = models.CharField(max_length=255, blank=True, null=True)
+    category_id = models.CharField(max_length=255, blank=True, null=True)
+    markup = models.DecimalField(max_digits=6, decimal_places=3, default=1.2)
+    # Add shipping_revenue18 and handling_revenue18 on top of the marked-up price
+    include_shipping = models.BooleanField(default=False)
+    # Round up to the next price with these cents, e.g. 0.99
+    price_ending = models.DecimalField(
+        max_digits=3, decimal_places=2, blank=True, null=True)
+    price_floor = models.DecimalField(
+        max_digits=10, decimal_places=2, blank=True, null=True)
+    price_ceiling = models.DecimalField(
+        max_digits=10, decimal_places=2, blank=True, null=True)
+    active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} (x{self.markup})"
+
+
+class RepriceRequest(models.Model):
+    """
+    A change to the pricing rules the catalog has not been repriced for yet.
+
+    The admin only records the change; the next cronjob run reprices every
+    item and deletes the requests it covered, see helpers.pricing.reprice_pending.
+    """
+    reason = models.CharField(max_length=255)
+    requested_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.reason} ({self.requested_at:%Y-%m-%d %H:%M})"
+
+
 class S3File(models.Model):
     name = models.CharField(max_length=255)
     file_hash = models.CharField(max_length=64, unique=True)
@@ -67,3 +157,98 @@ class S3File(models.Model):
         sha256 = hashlib.sha256()
         sha256.update(file_content)
         return sha256.hexdigest()
+
+
+class S3Object(models.Model):
+    """Manifest of feed objects seen in the bucket, used to skip unchanged ones before download."""
+    key = models.CharField(max_length=1024, unique=True)
+    etag = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    last_modified = models.DateTimeField()
+    file_hash = models.CharField(max_length=64, blank=True, null=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return self.key
+
+
+class ItemChange(models.Model):
+    """
+    Append-only log of price/stock changes written by the feed ingest.
+
+    The primary key doubles as the sequence number consumers keep a cursor into.
+    """
+    sku = models.CharField(max_length=255)
+    old_price = models.DecimalField(
+        max_digits=10, decimal_places=2, blank=True, null=True)
+    new_price = models.DecimalField(max_digits=10, decimal_places=2)
+    old_stock = models.IntegerField(blank=True, null=True)
+    new_stock = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"#{self.id} {self.sku}: {self.old_price}/{self.old_stock} -> {self.new_price}/{self.new_stock}"
+
+
+class ChangeLogCursor(models.Model):
+    """Position of one consumer in the ItemChange log."""
+    consumer = models.CharField(max_length=100, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.consumer} @ {self.position}"
+
+
+class JobRun(models.Model):
+    """
+    One run of a cronjob that pushes items to eBay, used to resume it after a crash.
+
+    Candidates are processed in primary-key order; every candidate up to
+    ``checkpoint_pk`` belongs to a batch whose response has been recorded.
+    """
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('interrupted', 'Interrupted'),
+        ('completed', 'Completed'),
+    ]
+
+    job = models.CharField(max_length=100)
+    # Worker the run belongs to when several processes run the same job
+    worker = models.CharField(max_length=255, blank=True, null=True)
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default='running')
+    checkpoint_pk = models.BigIntegerField(blank=True, null=True)
+    items_submitted = models.IntegerField(default=0)
+    # ItemChange high-water mark the run works up to, for jobs that consume the change log
+    change_log_position = models.BigIntegerField(blank=True, null=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.job}@{self.worker} #{self.id} ({self.status})"
+
+
+class JobBatch(models.Model):
+    """A batch of items sent in one API call, written before the call and updated with its outcome."""
+    OUTCOME_CHOICES = [
+        ('pending', 'Pending'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+        ('reconciled', 'Reconciled'),
+    ]
+
+    run = models.ForeignKey(JobRun, on_delete=models.CASCADE, related_name='batches')
+    first_pk = models.BigIntegerField()
+    last_pk = models.BigIntegerField()
+    skus = models.JSONField()
+    message_ids = models.JSONField()
+    outcome = models.CharField(
+        max_length=20, choices=OUTCOME_CHOICES, default='pending')
+    detail = models.TextField(blank=True, null=True)
+    submitted_at = models.DateTimeField(auto_now_add=True)
+    answered_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.run} batch {self.first_pk}-{self.last_pk} ({self.outcome})"
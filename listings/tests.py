@@ -1,3 +1,797 @@
-from django.test import TestCase
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import pandas as pd
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+
+from benchmarks.explain_queue_queries import FULL_SCAN, queue_queries, seed
+from cronjobs.listings_cronjob import (create_items_bulk_exchange, listing_candidates, process_add_items_response,
+                                       reconcile_unanswered_batches)
+from cronjobs.update_listings import out_of_sync, revise_candidates, split_revise_results
+from devtools.bulk_exchange_standin import serve
+from helpers.changelog import advance_cursor, get_cursor, pending_changes, prune_change_log
+from helpers.claims import ItemClaimer, claimed_windows
+from helpers import generate_token
+from helpers.ebay_client import TOKEN_ERROR_CODES, CircuitBreaker, EbayClient
+from helpers.feed import preprocess_dataframe, to_item_columns
+from helpers.ingest import FeedIngest, OrmItemWriter, PostgresCopyItemWriter
+from helpers.job_ledger import RunLedger
+from helpers.listing_errors import classify_errors, failure_outcome, listed_outcome, write_listing_outcomes
+from helpers.pagination import iter_batches, keyset_windows
+from helpers.payload import parse_revise_inventory_status_response
+from helpers.pricing import reprice_pending
+from listings.models import *
+
+
+def feed_chunk(skus, stock=5, price=10):
+    """A preprocessed feed chunk carrying ``skus``, all with the same stock and price."""
+    return preprocess_dataframe(pd.DataFrame({
+        'SKU': skus,
+        'PART_NAME': [f'PART {sku}' for sku in skus],
+        'B2B_PRICE15': [price] * len(skus),
+        'STOCK_TOTAL': [stock] * len(skus),
+    }))
+
+
+def make_items(count, **fields):
+    """Create ``count`` items with SKUs 1..count, all carrying ``fields``."""
+    values = {'brand': 'BRAND', 'price': Decimal('10.00'), 'stock': 5, **fields}
+    Item.objects.bulk_create([Item(sku=str(sku), part_name=f'PART {sku}', **values)
+                              for sku in range(1, count + 1)])
+    return Item.objects.order_by('pk')
+
+
+def ebay_error(code, message, classification='RequestError', severity='Error', params=()):
+    """One Trading API Errors element."""
+    parameters = ''.join(f'<ErrorParameters ParamID="{index}"><Value>{value}</Value></ErrorParameters>'
+                         for index, value in enumerate(params))
+    return (f'<Errors><ShortMessage>{message}</ShortMessage><LongMessage>{message}</LongMessage>'
+            f'<ErrorCode>{code}</ErrorCode><SeverityCode>{severity}</SeverityCode>{parameters}'
+            f'<ErrorClassification>{classification}</ErrorClassification></Errors>')
+
+
+def ebay_response(call_name, ack, body=''):
+    """A Trading API response as eBay sends it."""
+    return SimpleNamespace(status_code=200, headers={}, text=(
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        f'<{call_name}Response xmlns="urn:ebay:apis:eBLBaseComponents">'
+        f'<Timestamp>2026-10-18T12:00:00.000Z</Timestamp><Ack>{ack}</Ack>{body}'
+        f'<Version>1193</Version></{call_name}Response>'))
+
+
+class QueueQueryPlanTests(TestCase):
+    """The job queue and admin queries use their indexes instead of scanning the item table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        default_rows = '100000' if connection.vendor == 'postgresql' else '20000'
+        seed(int(os.getenv('QUERY_PLAN_ROWS', default_rows)))
+
+    def test_queue_queries_use_indexes(self):
+        for name, queryset, backends in queue_queries():
+            if connection.vendor not in backends:
+                continue
+            with self.subTest(name):
+                self.assertNotRegex(queryset.explain(), FULL_SCAN[connection.vendor])
+
+
+class ZeroDisappearedTests(TestCase):
+    """SKUs missing from the day's feed are zeroed only when the feed was read completely."""
+
+    def setUp(self):
+        FeedIngest(writer=OrmItemWriter()).ingest(feed_chunk(list(range(1, 21))))
+
+    def run_ingest(self, skus, failed_file=None):
+        ingest = FeedIngest(writer=OrmItemWriter(), max_disappeared_share=0.1)
+        ingest.ingest(feed_chunk(skus))
+        if failed_file:
+            ingest.file_failed(failed_file, ValueError('truncated sheet'))
+        return ingest.finish()
+
+    def test_missing_skus_are_zeroed_and_logged(self):
+        report = self.run_ingest(list(range(1, 19)))
+
+        self.assertEqual(sorted(report.disappeared), ['19', '20'])
+        self.assertIsNone(report.zeroing_skipped)
+        self.assertEqual(list(Item.objects.filter(stock=0).order_by('sku').values_list('sku', flat=True)),
+                         ['19', '20'])
+        self.assertEqual(ItemChange.objects.filter(new_stock=0).count(), 2)
+
+    def test_too_many_missing_skus_are_left_alone(self):
+        report = self.run_ingest(list(range(1, 11)))
+
+        self.assertEqual(len(report.disappeared), 10)
+        self.assertIn('10 of 20', report.zeroing_skipped)
+        self.assertFalse(Item.objects.filter(stock=0).exists())
+
+    def test_nothing_is_zeroed_after_a_failed_file(self):
+        report = self.run_ingest(list(range(1, 20)), failed_file='feed_2.xlsx')
+
+        self.assertEqual(report.failed_files, ['feed_2.xlsx'])
+        self.assertIn('feed_2.xlsx', report.zeroing_skipped)
+        self.assertFalse(Item.objects.filter(stock=0).exists())
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    """The half-open trial call retries like any other and never leaves the breaker stuck."""
+
+    def ebay_client(self, *status_codes):
+        client = EbayClient(base_url='api.example.com', max_retries=0, backoff=0,
+                            breaker=CircuitBreaker(threshold=1, cooldown=0))
+        client.session.post = mock.Mock(side_effect=[
+            SimpleNamespace(status_code=code, text='', headers={}) for code in status_codes])
+        # The first call fails and opens the breaker
+        client.post(client.trading_url)
+        self.assertTrue(client.breaker.is_open)
+        return client
+
+    def test_trial_retries_while_the_breaker_is_open(self):
+        client = self.ebay_client(503, 503, 200)
+
+        client.max_retries = 1
+        self.assertEqual(client.post(client.trading_url).status_code, 200)
+        self.assertFalse(client.breaker.is_open)
+
+    def test_failed_trial_lets_the_next_trial_through(self):
+        client = self.ebay_client(503, 503, 503, 200)
+
+        client.max_retries = 1
+        self.assertEqual(client.post(client.trading_url).status_code, 503)
+        self.assertTrue(client.breaker.is_open)
+        self.assertEqual(client.post(client.trading_url).status_code, 200)
+        self.assertFalse(client.breaker.is_open)
+
+
+class ItemClaimerTests(TestCase):
+    """Workers take disjoint rows and every job of a worker keeps its own claims."""
+
+    def setUp(self):
+        self.items = make_items(10)
+
+    def test_workers_claim_disjoint_windows(self):
+        first = ItemClaimer('add_items', worker='worker-1')
+        second = ItemClaimer('add_items', worker='worker-2')
+
+        first_rows = [row.pk for window in claimed_windows(self.items, first, window_size=3, limit=6)
+                      for row in window]
+        second_rows = [row.pk for window in claimed_windows(self.items, second, window_size=3)
+                       for row in window]
+
+        self.assertEqual(len(first_rows), 6)
+        self.assertEqual(len(second_rows), 4)
+        self.assertFalse(set(first_rows) & set(second_rows))
+        self.assertEqual(Item.objects.filter(claimed_by='worker-1:add_items').count(), 6)
+
+    def test_expired_claims_are_taken_over(self):
+        stale = ItemClaimer('add_items', worker='worker-1', lease=timedelta(seconds=-1))
+        stale.claim(self.items, 10)
+
+        rows = ItemClaimer('add_items', worker='worker-2').claim(self.items, 10)
+        self.assertEqual(len(rows), 10)
+
+    @mock.patch.dict(os.environ, {'WORKER_ID': ''})
+    def test_processes_without_a_worker_id_are_separate_workers(self):
+        with mock.patch('os.getpid', return_value=101):
+            first = ItemClaimer('add_items')
+        with mock.patch('os.getpid', return_value=102):
+            second = ItemClaimer('add_items')
+
+        self.assertNotEqual(first.owner, second.owner)
+        self.assertFalse(first.stable)
+        first_rows = {row.pk for row in first.claim(self.items, 5)}
+        second_rows = {row.pk for row in second.claim(self.items, 10)}
+        self.assertEqual(len(second_rows), 5)
+        self.assertFalse(first_rows & second_rows)
+
+    def test_jobs_of_one_worker_keep_their_own_claims(self):
+        listing = ItemClaimer('add_items', worker='worker-1', lease=timedelta(minutes=5))
+        update = ItemClaimer('revise_inventory_status', worker='worker-1', lease=timedelta(hours=1))
+        listing.claim(self.items, 4)
+        listing_expiry = Item.objects.filter(claimed_by=listing.owner).first().claim_expires_at
+
+        # Claiming renews and releasing drops only the job's own rows
+        self.assertEqual(len(update.claim(self.items, 10)), 6)
+        self.assertEqual(Item.objects.filter(claimed_by=listing.owner).first().claim_expires_at,
+                         listing_expiry)
+        self.assertEqual(update.release(), 6)
+        self.assertEqual(Item.objects.filter(claimed_by=listing.owner).count(), 4)
+
+
+class ListingErrorTests(SimpleTestCase):
+    """Failed items are classified from their eBay errors and retried with a growing delay."""
+
+    def test_classify_errors(self):
+        self.assertEqual(classify_errors([]), 'retryable')
+        self.assertEqual(classify_errors([('10007', 'RequestError')]), 'retryable')
+        self.assertEqual(classify_errors([('240', 'SystemError')]), 'retryable')
+        self.assertEqual(classify_errors([('107', 'RequestError'), ('931', 'RequestError')]), 'retryable')
+        self.assertEqual(classify_errors([('107', 'RequestError')]), 'permanent')
+
+    @mock.patch.dict(os.environ, {'LISTING_RETRY_BASE_MINUTES': '60', 'LISTING_MAX_ATTEMPTS': '4'})
+    def test_retryable_failures_back_off_and_are_parked(self):
+        now = timezone.now()
+        delays = [failure_outcome(attempts, 'retryable', 'Timeout', now)['next_attempt_at'] - now
+                  for attempts in range(3)]
+        self.assertEqual(delays, [timedelta(hours=1), timedelta(hours=2), timedelta(hours=4)])
+
+        parked = failure_outcome(3, 'retryable', 'Timeout', now)
+        self.assertEqual((parked['error_class'], parked['error_attempts'], parked['next_attempt_at']),
+                         ('permanent', 4, None))
+        self.assertIn('Gave up after 4 attempts', parked['debug_info'])
+
+    @mock.patch.dict(os.environ, {'LISTING_RETRY_BASE_MINUTES': '60', 'LISTING_MAX_ATTEMPTS': '100'})
+    def test_backoff_is_capped(self):
+        now = timezone.now()
+        outcome = failure_outcome(20, 'retryable', 'Timeout', now)
+        self.assertEqual(outcome['next_attempt_at'] - now, timedelta(days=7))
+
+    def test_permanent_failures_are_not_retried(self):
+        outcome = failure_outcome(0, 'permanent', 'Invalid category', timezone.now())
+        self.assertEqual((outcome['status'], outcome['error_attempts'], outcome['next_attempt_at']),
+                         ('error', 1, None))
+
+
+class IngestErrorStateTests(TestCase):
+    """A price or stock change from the feed does not give a rejected item another attempt."""
+
+    def test_price_and_stock_changes_keep_the_error_state(self):
+        FeedIngest(writer=OrmItemWriter()).ingest(feed_chunk([1, 2]))
+        Item.objects.filter(sku='1').update(status='error', error_class='permanent', error_attempts=1)
+        Item.objects.filter(sku='2').update(status='error', error_class='retryable', error_attempts=3,
+                                            next_attempt_at=timezone.now() + timedelta(hours=4))
+
+        ingest = FeedIngest(writer=OrmItemWriter())
+        ingest.ingest(feed_chunk([1, 2], stock=9, price=12))
+        self.assertEqual(ingest.report.changed, 2)
+
+        self.assertEqual(
+            list(Item.objects.order_by('sku').values_list('stock', 'error_class', 'error_attempts')),
+            [(9, 'permanent', 1), (9, 'retryable', 3)])
+        self.assertIsNotNone(Item.objects.get(sku='2').next_attempt_at)
+
+
+class RepriceTests(TestCase):
+    """Rule edits in the admin only queue a reprice; the next cronjob run applies it."""
+
+    def setUp(self):
+        self.items = make_items(3, status='updated')
+        reprice_pending()
+        self.rule = PricingRule.objects.create(name='All', markup=Decimal('1.5'))
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+
+    def test_admin_edit_queues_a_reprice(self):
+        response = self.client.post(f'/admin/listings/pricingrule/{self.rule.pk}/change/', {
+            'name': 'All', 'priority': 100, 'markup': '2', 'active': 'on'})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(RepriceRequest.objects.count(), 1)
+        self.assertEqual(set(self.items.values_list('sell_price', flat=True)), {Decimal('12.00')})
+
+    def test_unpriced_items_are_not_sent(self):
+        Item.objects.filter(pk=self.items[0].pk).update(status='not listed')
+        Item.objects.filter(pk=self.items[2].pk).update(status='updated')
+        Item.objects.create(sku='new', brand='BRAND', part_name='PART new', price=Decimal('10'), stock=5)
+        Item.objects.create(sku='new-listed', brand='BRAND', part_name='PART new', price=Decimal('10'),
+                            stock=5, status='listed', item_id='110099')
+
+        self.assertEqual([item.sku for item in listing_candidates()], ['1'])
+        self.assertEqual([item.sku for item in revise_candidates()], ['2'])
+
+    def test_pending_request_reprices_the_catalog(self):
+        self.assertEqual(reprice_pending(), 0)
+        RepriceRequest.objects.create(reason='Rule All changed')
+
+        self.assertEqual(reprice_pending(), 3)
+        self.assertFalse(RepriceRequest.objects.exists())
+        self.assertEqual(set(self.items.values_list('sell_price', 'status')), {(Decimal('15.00'), 'listed')})
+
+
+class ChangeLogTests(TestCase):
+    """Every consumer reads the change log from its own cursor, which only moves forward."""
+
+    def log_changes(self, *skus):
+        ItemChange.objects.bulk_create([ItemChange(sku=sku, old_price=Decimal('10'), new_price=Decimal('11'),
+                                                   old_stock=1, new_stock=2) for sku in skus])
+        return ItemChange.objects.order_by('id').last().id
+
+    def test_new_consumer_starts_at_the_end_of_the_log(self):
+        self.log_changes('1', '2')
+        self.assertFalse(pending_changes('revise').exists())
+
+        self.log_changes('3')
+        self.assertEqual(list(pending_changes('revise').values_list('sku', flat=True)), ['3'])
+
+    def test_cursor_advances_up_to_the_high_water_mark(self):
+        get_cursor('revise')
+        high_water = self.log_changes('1', '2')
+        self.log_changes('3')
+
+        self.assertEqual(pending_changes('revise', up_to=high_water).count(), 2)
+        advance_cursor('revise', high_water)
+        self.assertEqual(list(pending_changes('revise').values_list('sku', flat=True)), ['3'])
+
+        # An older run finishing late does not move the cursor back
+        advance_cursor('revise', high_water - 1)
+        self.assertEqual(get_cursor('revise').position, high_water)
+
+    def test_prune_keeps_what_the_slowest_consumer_still_needs(self):
+        get_cursor('revise')
+        get_cursor('export')
+        first = self.log_changes('1')
+        last = self.log_changes('2')
+        advance_cursor('revise', last)
+        advance_cursor('export', first)
+
+        self.assertEqual(prune_change_log(), 1)
+        self.assertEqual(list(ItemChange.objects.values_list('sku', flat=True)), ['2'])
+
+
+class KeysetWindowTests(TestCase):
+    """Candidates are paged by primary key, unaffected by rows leaving or joining the queue."""
+
+    def setUp(self):
+        self.items = make_items(10)
+        self.pks = list(self.items.values_list('pk', flat=True))
+
+    def test_windows_cover_every_row_once(self):
+        windows = list(keyset_windows(self.items.filter(status='not listed'), window_size=4))
+
+        self.assertEqual([len(window) for window in windows], [4, 4, 2])
+        self.assertEqual([item.pk for window in windows for item in window], self.pks)
+
+    def test_rows_leaving_the_filter_do_not_shift_later_windows(self):
+        seen = []
+        for window in keyset_windows(self.items.filter(status='not listed'), window_size=3):
+            seen.extend(item.pk for item in window)
+            # Listing the window takes it out of the candidates, as the listing job does
+            Item.objects.filter(pk__in=[item.pk for item in window]).update(status='listed')
+        self.assertEqual(seen, self.pks)
+
+    def test_rows_inserted_during_the_run_are_left_for_the_next_one(self):
+        windows = keyset_windows(self.items, window_size=5)
+        first = next(windows)
+        Item.objects.create(sku='new', brand='BRAND', part_name='PART new', price=Decimal('1'), stock=1)
+
+        self.assertEqual([item.pk for item in first + next(windows)], self.pks)
+        self.assertEqual(list(windows), [])
+
+    def test_limit_and_resume_checkpoint(self):
+        windows = list(keyset_windows(self.items, window_size=4, limit=5, after=self.pks[2]))
+        self.assertEqual([item.pk for window in windows for item in window], self.pks[3:8])
+
+    def test_projected_windows_load_only_the_requested_columns(self):
+        window = next(keyset_windows(self.items, window_size=4, fields=('id', 'sku', 'stock')))
+        self.assertEqual(window[0].get_deferred_fields() & {'sku', 'stock', 'pdescription'},
+                         {'pdescription'})
+
+    def test_batches_follow_the_current_batch_size(self):
+        sizes = iter([4, 4, 1, 2, 2])
+        windows = keyset_windows(self.items, window_size=5)
+
+        batches = list(iter_batches(windows, lambda: next(sizes)))
+        self.assertEqual([len(batch) for batch in batches], [4, 1, 1, 2, 2])
+        self.assertEqual([item.pk for batch in batches for item in batch], self.pks)
+
+
+class ListingOutcomeTests(TestCase):
+    """Outcomes of many items are written back per status, each item keeping its own values."""
+
+    def setUp(self):
+        self.items = make_items(4)
+        self.pks = list(self.items.values_list('pk', flat=True))
+
+    def test_outcomes_are_written_per_item(self):
+        now = timezone.now()
+        write_listing_outcomes({
+            self.pks[0]: listed_outcome('110001'),
+            self.pks[1]: listed_outcome('110002'),
+            self.pks[2]: failure_outcome(0, 'permanent', 'Invalid category', now),
+        })
+
+        self.assertEqual(
+            list(self.items.values_list('status', 'item_id', 'error_class', 'debug_info')),
+            [('listed', '110001', None, None), ('listed', '110002', None, None),
+             ('error', None, 'permanent', 'Invalid category'), ('not listed', None, None, None)])
+
+    def test_fields_without_a_value_are_left_alone(self):
+        Item.objects.filter(pk=self.pks[1]).update(pushed_price=Decimal('9.99'))
+        updated_at = self.items.get(pk=self.pks[1]).updated_at
+        write_listing_outcomes({self.pks[0]: {'status': 'updated', 'pushed_price': Decimal('12.00')},
+                                self.pks[1]: {'status': 'updated'}}, touch=False)
+
+        self.assertEqual(list(self.items.filter(status='updated').values_list('pushed_price', flat=True)),
+                         [Decimal('12.00'), Decimal('9.99')])
+        self.assertEqual(self.items.get(pk=self.pks[1]).updated_at, updated_at)
+
+
+class OutOfSyncTests(TestCase):
+    """Only listings whose price or quantity on eBay is stale are revised."""
+
+    def setUp(self):
+        self.items = make_items(5, status='listed', sell_price=Decimal('100.00'), stock=5,
+                                pushed_price=Decimal('100.00'), pushed_quantity=5)
+        pks = list(self.items.values_list('pk', flat=True))
+        Item.objects.filter(pk=pks[1]).update(pushed_price=None, pushed_quantity=None)
+        Item.objects.filter(pk=pks[2]).update(stock=4)
+        Item.objects.filter(pk=pks[3]).update(sell_price=Decimal('101.00'))
+        Item.objects.filter(pk=pks[4]).update(sell_price=Decimal('95.00'))
+
+    def out_of_sync_skus(self):
+        return sorted(out_of_sync(self.items).values_list('sku', flat=True))
+
+    @mock.patch.dict(os.environ, {'REVISE_PRICE_TOLERANCE': '0'})
+    def test_every_difference_is_sent_without_tolerance(self):
+        self.assertEqual(self.out_of_sync_skus(), ['2', '3', '4', '5'])
+
+    @mock.patch.dict(os.environ, {'REVISE_PRICE_TOLERANCE': '0.02'})
+    def test_small_price_changes_wait_for_a_larger_one(self):
+        # 1% up is within the tolerance, 5% down is not; a quantity change is always sent
+        self.assertEqual(self.out_of_sync_skus(), ['2', '3', '5'])
+
+
+class RunLedgerAdoptionTests(TestCase):
+    """An unfinished run is only resumed by a restart of its own worker, never while it is alive."""
+
+    def test_interrupted_run_is_resumed_by_a_stable_worker(self):
+        first = RunLedger('add_items', worker='worker-1', stale_after=timedelta(minutes=15))
+        first.finish(completed=False)
+
+        second = RunLedger('add_items', worker='worker-1', stale_after=timedelta(minutes=15))
+        self.assertTrue(second.resumed)
+        self.assertEqual(second.run.pk, first.run.pk)
+
+    def test_live_run_is_not_taken_over(self):
+        first = RunLedger('add_items', worker='worker-1', stale_after=timedelta(minutes=15))
+
+        second = RunLedger('add_items', worker='worker-1', stale_after=timedelta(minutes=15))
+        self.assertFalse(second.resumed)
+        self.assertNotEqual(second.run.pk, first.run.pk)
+
+        # Once it stops recording progress it counts as crashed
+        JobRun.objects.filter(pk=first.run.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        second.finish()
+        self.assertEqual(RunLedger('add_items', worker='worker-1', stale_after=timedelta(minutes=15)).run.pk,
+                         first.run.pk)
+
+    def test_runs_of_per_process_workers_are_not_resumed(self):
+        RunLedger('add_items', worker='host:101').finish(completed=False)
+        self.assertFalse(RunLedger('add_items', worker='host:101', resume=False).resumed)
+
+
+@skipUnless(connection.vendor == 'postgresql', "COPY and INSERT ... ON CONFLICT merge need PostgreSQL")
+class PostgresCopyItemWriterTests(TransactionTestCase):
+    """
+    The COPY merge inserts new SKUs, rewrites changed ones and leaves unchanged fingerprints alone.
+
+    Not wrapped in a transaction: the staging table is emptied when each write commits.
+    """
+
+    def write(self, *chunks):
+        return PostgresCopyItemWriter().write(to_item_columns(pd.concat(chunks)))
+
+    def test_merge_counts_and_change_log(self):
+        self.assertEqual(self.write(feed_chunk([1, 2, 3])), (3, 0))
+        self.assertEqual(Item.objects.filter(status='not listed', error_attempts=0).count(), 3)
+        self.assertFalse(ItemChange.objects.exists())
+        fingerprint = Item.objects.get(sku='1').feed_fingerprint
+
+        # 1 unchanged, 2 repriced, 3 restocked, 4 new
+        created, updated = self.write(feed_chunk([1]), feed_chunk([2], price=12),
+                                      feed_chunk([3], stock=9), feed_chunk([4]))
+
+        self.assertEqual((created, updated), (1, 2))
+        self.assertEqual(Item.objects.get(sku='1').feed_fingerprint, fingerprint)
+        self.assertEqual(list(Item.objects.order_by('sku').values_list('sku', 'price', 'stock')), [
+            ('1', Decimal('10.00'), 5), ('2', Decimal('12.00'), 5),
+            ('3', Decimal('10.00'), 9), ('4', Decimal('10.00'), 5)])
+        self.assertEqual(
+            sorted(ItemChange.objects.values_list('sku', 'old_price', 'new_price', 'old_stock', 'new_stock')),
+            [('2', Decimal('10.00'), Decimal('12.00'), 5, 5), ('3', Decimal('10.00'), Decimal('10.00'), 5, 9)])
+
+    def test_unchanged_chunk_writes_nothing(self):
+        self.write(feed_chunk([1, 2]))
+        self.assertEqual(self.write(feed_chunk([1, 2])), (0, 0))
+        self.assertFalse(ItemChange.objects.exists())
+
+    def test_error_state_survives_a_price_change(self):
+        self.write(feed_chunk([1]))
+        Item.objects.filter(sku='1').update(status='error', error_class='permanent', error_attempts=2)
+
+        self.assertEqual(self.write(feed_chunk([1], price=11)), (0, 1))
+        self.assertEqual(list(Item.objects.values_list('price', 'error_class', 'error_attempts')),
+                         [(Decimal('11.00'), 'permanent', 2)])
+
+
+class AddItemsResponseTests(TestCase):
+    """Every item of an AddItems call gets the outcome of its own response container."""
+
+    def setUp(self):
+        self.batch = list(make_items(4))
+
+    def outcomes(self):
+        return list(Item.objects.order_by('pk').values_list(
+            'status', 'item_id', 'error_class', 'error_attempts', 'debug_info'))
+
+    def test_partial_failure_is_recorded_per_item(self):
+        response = ebay_response('AddItems', 'PartialFailure', (
+            '<AddItemResponseContainer><ItemID>110001</ItemID><CorrelationID>1</CorrelationID>'
+            + ebay_error('21917091', 'Requested StartPrice is close to the average', severity='Warning')
+            + '</AddItemResponseContainer>'
+            '<AddItemResponseContainer><CorrelationID>2</CorrelationID>'
+            + ebay_error('87', 'The category is not valid') + '</AddItemResponseContainer>'
+            '<AddItemResponseContainer><CorrelationID>3</CorrelationID>'
+            + ebay_error('10007', 'Internal error', classification='SystemError')
+            + '</AddItemResponseContainer>'
+            # Neither of these matches item 4
+            '<AddItemResponseContainer><ItemID>110009</ItemID><CorrelationID>9</CorrelationID>'
+            '</AddItemResponseContainer>'
+            '<AddItemResponseContainer><ItemID>110010</ItemID></AddItemResponseContainer>'))
+
+        self.assertTrue(process_add_items_response(self.batch, 0, response))
+
+        self.assertEqual(self.outcomes(), [
+            ('listed', '110001', None, 0, None),
+            ('error', None, 'permanent', 1, 'Error 87: The category is not valid'),
+            ('error', None, 'retryable', 1, 'Error 10007: Internal error'),
+            ('error', None, 'retryable', 1, 'No AddItemResponseContainer returned (Ack: PartialFailure)'),
+        ])
+        self.assertIsNotNone(Item.objects.get(pk=self.batch[2].pk).next_attempt_at)
+        self.assertIsNone(Item.objects.get(pk=self.batch[1].pk).next_attempt_at)
+
+    def test_call_level_error_fails_every_item_as_retryable(self):
+        response = ebay_response('AddItems', 'Failure', ebay_error('931', 'Auth token is invalid'))
+
+        self.assertFalse(process_add_items_response(self.batch, 0, response))
+
+        self.assertEqual(set(self.outcomes()),
+                         {('error', None, 'retryable', 1, 'Error 931: Auth token is invalid')})
+
+    def test_unreadable_response_leaves_the_batch_alone(self):
+        response = SimpleNamespace(status_code=502, headers={}, text='<html>Bad Gateway')
+
+        self.assertFalse(process_add_items_response(self.batch, 0, response))
+
+        self.assertEqual(set(self.outcomes()), {('not listed', None, None, 0, None)})
+
+
+class ReviseInventoryStatusResponseTests(SimpleTestCase):
+    """Items of a ReviseInventoryStatus call are split by what eBay says about each of them."""
+
+    chunk = [SimpleNamespace(item_id=item_id, sku=item_id[-1]) for item_id in ('1101', '1102', '1103')]
+
+    def split(self, response):
+        revised, rejected = split_revise_results(self.chunk, response)
+        return [item.item_id for item in revised], [item.item_id for item in rejected]
+
+    @staticmethod
+    def inventory_status(*item_ids):
+        return ''.join(f'<InventoryStatus><ItemID>{item_id}</ItemID><Quantity>5</Quantity></InventoryStatus>'
+                       for item_id in item_ids)
+
+    def test_answer_without_item_detail_counts_for_the_whole_call(self):
+        for ack in ('Success', 'Warning'):
+            with self.subTest(ack):
+                response = ebay_response('ReviseInventoryStatus', ack, ebay_error(
+                    '21917091', 'Price is close to the average', severity='Warning'))
+                self.assertEqual(self.split(response), (['1101', '1102', '1103'], []))
+
+    def test_errors_are_matched_to_items_by_item_id(self):
+        response = ebay_response('ReviseInventoryStatus', 'PartialFailure', self.inventory_status('1101', '1103')
+                                 + ebay_error('21916750', 'Item 1102 ended', params=('1102',)))
+
+        ack, revised, errors = parse_revise_inventory_status_response(response.text)
+        self.assertEqual((ack, revised), ('PartialFailure', {'1101', '1103'}))
+        self.assertEqual(errors, [('Error 21916750: Item 1102 ended', {'1102'})])
+        self.assertEqual(self.split(response), (['1101', '1103'], ['1102']))
+
+    def test_call_failure_rejects_every_item(self):
+        response = ebay_response('ReviseInventoryStatus', 'Failure', ebay_error('931', 'Auth token is invalid'))
+        self.assertEqual(self.split(response), ([], ['1101', '1102', '1103']))
+
+    def test_unparseable_body_rejects_every_item(self):
+        response = SimpleNamespace(status_code=503, headers={}, text='Service Unavailable')
+        self.assertEqual(self.split(response), ([], ['1101', '1102', '1103']))
+
+
+class AccessTokenTests(TestCase):
+    """The access token is served from memory, refreshed ahead of its expiry and when eBay rejects it."""
+
+    def setUp(self):
+        generate_token._token_cache.update(access_token=None, expires_at=None)
+        self.addCleanup(generate_token._token_cache.update, access_token=None, expires_at=None)
+        self.token = APIToken.objects.create(
+            access_token='old-token', refresh_token='refresh', refresh_token_expires_in=0, token_type='User',
+            access_token_expires_at=timezone.now() + timedelta(hours=1))
+        patcher = mock.patch.object(generate_token, 'generate_access_token_from_refresh_token',
+                                    return_value=('new-token', 7200))
+        self.generate = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fresh_token_is_served_from_memory(self):
+        self.assertEqual(generate_token.check_access_token(), 'old-token')
+        with self.assertNumQueries(0):
+            self.assertEqual(generate_token.check_access_token(), 'old-token')
+        self.generate.assert_not_called()
+
+    def test_token_close_to_its_expiry_is_refreshed_and_stored(self):
+        APIToken.objects.filter(pk=self.token.pk).update(
+            access_token_expires_at=timezone.now() + generate_token.TOKEN_REFRESH_MARGIN / 2)
+
+        self.assertEqual(generate_token.check_access_token(), 'new-token')
+        self.token.refresh_from_db()
+        self.assertEqual(self.token.access_token, 'new-token')
+        self.assertGreater(self.token.access_token_expires_at, timezone.now() + timedelta(hours=1))
+        self.assertEqual(generate_token._token_cache['access_token'], 'new-token')
+
+    def test_token_without_a_stored_expiry_is_looked_up_once(self):
+        APIToken.objects.filter(pk=self.token.pk).update(access_token_expires_at=None)
+        expires_at = timezone.now() + timedelta(minutes=90)
+
+        with mock.patch.object(generate_token, 'get_token_expiry', return_value=expires_at) as lookup:
+            self.assertEqual(generate_token.check_access_token(), 'old-token')
+            self.assertEqual(generate_token.check_access_token(), 'old-token')
+
+        lookup.assert_called_once_with('old-token')
+        self.token.refresh_from_db()
+        self.assertEqual(self.token.access_token_expires_at, expires_at)
+        self.generate.assert_not_called()
+
+    def test_call_rejected_for_its_token_is_sent_again_with_a_new_one(self):
+        for code in sorted(TOKEN_ERROR_CODES):
+            with self.subTest(code):
+                generate_token._token_cache.update(access_token=None, expires_at=None)
+                APIToken.objects.filter(pk=self.token.pk).update(access_token='old-token')
+                client = EbayClient(base_url='api.example.com', max_retries=0)
+                client.session.post = mock.Mock(side_effect=[
+                    ebay_response('ReviseInventoryStatus', 'Failure', ebay_error(code, 'Auth token is invalid')),
+                    ebay_response('ReviseInventoryStatus', 'Success')])
+
+                response = client.trading('ReviseInventoryStatus', '<eBayAuthToken>old-token</eBayAuthToken>',
+                                          access_token='old-token')
+
+                self.assertIn('<Ack>Success</Ack>', response.text)
+                self.assertEqual(client.session.post.call_args.kwargs['data'],
+                                 '<eBayAuthToken>new-token</eBayAuthToken>')
+                self.assertEqual(APIToken.objects.get().access_token, 'new-token')
+
+    def test_other_errors_are_not_retried(self):
+        client = EbayClient(base_url='api.example.com', max_retries=0)
+        client.session.post = mock.Mock(side_effect=[
+            ebay_response('ReviseInventoryStatus', 'Failure', ebay_error('21916750', 'Item ended'))])
+
+        client.trading('ReviseInventoryStatus', '<eBayAuthToken>old-token</eBayAuthToken>',
+                       access_token='old-token')
+        self.assertEqual(client.session.post.call_count, 1)
+        self.generate.assert_not_called()
+
+
+class PoolThreadTokenRefreshTests(TransactionTestCase):
+    """A token refresh on a pool thread does not leave the thread a database connection."""
+
+    def test_pool_thread_closes_its_connection_after_a_refresh(self):
+        generate_token._token_cache.update(access_token=None, expires_at=None)
+        self.addCleanup(generate_token._token_cache.update, access_token=None, expires_at=None)
+        APIToken.objects.create(access_token='old-token', refresh_token='refresh', refresh_token_expires_in=0,
+                                token_type='User', access_token_expires_at=timezone.now() + timedelta(hours=1))
+        client = EbayClient(base_url='api.example.com', max_retries=0)
+        client.session.post = mock.Mock(side_effect=[
+            ebay_response('AddItems', 'Failure', ebay_error('932', 'Auth token is hard expired')),
+            ebay_response('AddItems', 'Success')])
+
+        closed_on = []
+
+        def close_all():
+            closed_on.append(threading.current_thread())
+
+        with mock.patch.object(generate_token, 'generate_access_token_from_refresh_token',
+                               return_value=('new-token', 7200)), \
+                mock.patch.object(connections, 'close_all', side_effect=close_all), \
+                ThreadPoolExecutor(max_workers=1) as pool:
+            response = pool.submit(client.trading, 'AddItems', '<eBayAuthToken>old-token</eBayAuthToken>',
+                                   access_token='old-token').result()
+
+        self.assertIn('<Ack>Success</Ack>', response.text)
+        self.assertEqual(len(closed_on), 1)
+        self.assertIsNot(closed_on[0], threading.main_thread())
+        self.assertEqual(APIToken.objects.get().access_token, 'new-token')
+
+
+class RunLedgerRecoveryTests(TestCase):
+    """A crashed listing run is resumed from its checkpoint and its unanswered calls are looked up."""
+
+    def setUp(self):
+        self.items = list(make_items(6, sell_price=Decimal('12.00')))
+        ledger = RunLedger('add_items', worker='worker-1')
+        first, second, third = [ledger.submitted(self.items[start:start + 2], ['1', '2'])
+                                for start in (0, 2, 4)]
+
+        # Answers arrive out of order; the checkpoint only passes fully answered prefixes
+        ledger.answered(second, 'succeeded')
+        self.assertIsNone(ledger.checkpoint_pk)
+        ledger.answered(first, 'succeeded')
+        self.assertEqual(ledger.checkpoint_pk, self.items[3].pk)
+        # The process dies before the third call is answered
+        self.third = third
+
+    def test_new_run_resumes_from_the_checkpoint(self):
+        ledger = RunLedger('add_items', worker='worker-1', stale_after=timedelta(0))
+
+        self.assertTrue(ledger.resumed)
+        self.assertEqual(ledger.checkpoint_pk, self.items[3].pk)
+        self.assertEqual(ledger.items_submitted, 6)
+        self.assertEqual(list(ledger.unanswered()), [self.third])
+
+    def test_unanswered_items_are_looked_up_with_get_item(self):
+        listed_sku = self.items[4].sku
+
+        def get_item(call_name, body, access_token=None):
+            if f'<SKU>{listed_sku}</SKU>' in body:
+                return ebay_response('GetItem', 'Success', '<Item><ItemID>110005</ItemID></Item>')
+            return ebay_response('GetItem', 'Failure', ebay_error('17', 'Item not found'))
+
+        client = SimpleNamespace(trading=mock.Mock(side_effect=get_item))
+        ledger = RunLedger('add_items', worker='worker-1', stale_after=timedelta(0))
+        reconcile_unanswered_batches(ledger, client, 'token')
+
+        self.assertEqual(client.trading.call_count, 2)
+        self.assertEqual(list(Item.objects.filter(pk__in=[item.pk for item in self.items[4:]])
+                              .order_by('pk').values_list('status', 'item_id')),
+                         [('listed', '110005'), ('not listed', None)])
+        self.third.refresh_from_db()
+        self.assertEqual((self.third.outcome, self.third.detail), ('reconciled', '1 of 2 items found listed'))
+        self.assertFalse(ledger.unanswered().exists())
+        # The item that was not found stays a candidate after the checkpoint
+        self.assertEqual([item.pk for item in listing_candidates().filter(pk__gt=ledger.checkpoint_pk)],
+                         [self.items[5].pk])
+
+
+class BulkExchangeStandinTests(TestCase):
+    """The bulk listing mode runs end to end against devtools/bulk_exchange_standin.py."""
+
+    def setUp(self):
+        server = serve(port=0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f'http://127.0.0.1:{server.server_address[1]}'
+        patcher = mock.patch.dict(os.environ, {
+            'BULK_EXCHANGE_URL': f'{url}/BulkDataExchangeService',
+            'FILE_TRANSFER_URL': f'{url}/FileTransferService',
+            'BULK_POLL_INTERVAL': '0',
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('cronjobs.listings_cronjob.check_access_token', return_value='token')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_response_file_outcomes_are_recorded(self):
+        items = list(make_items(3, sell_price=Decimal('12.00'), pdescription='Front bumper cover'))
+        # The stand-in rejects titles over 80 characters with RequestError 70
+        Item.objects.filter(pk=items[1].pk).update(pdescription='X' * 81)
+
+        create_items_bulk_exchange()
+
+        listed, rejected, other = Item.objects.filter(pk__in=[item.pk for item in items]).order_by('pk')
+        self.assertEqual([(item.status, item.error_class) for item in (listed, rejected, other)],
+                         [('listed', None), ('error', 'permanent'), ('listed', None)])
+        self.assertIsNotNone(listed.item_id)
+        self.assertNotEqual(listed.item_id, other.item_id)
+        self.assertIsNone(rejected.item_id)
+        self.assertIn('The title may not be more than 80 characters.', rejected.debug_info)
+        self.assertEqual(rejected.error_attempts, 1)
+
+        # A listing whose outcome was lost is answered with its earlier ItemID, not listed twice
+        Item.objects.filter(pk=listed.pk).update(status='not listed', item_id=None)
+        create_items_bulk_exchange()
+
+        relisted = Item.objects.get(pk=listed.pk)
+        self.assertEqual((relisted.status, relisted.item_id), ('listed', listed.item_id))
+        self.assertEqual(Item.objects.get(pk=other.pk).item_id, other.item_id)